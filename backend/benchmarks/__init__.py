@@ -0,0 +1 @@
+# 性能基准脚本，在项目根目录下运行，例如: PYTHONPATH=backend python -m benchmarks.bench_chunking
@@ -0,0 +1,133 @@
+"""
+分块性能基准。
+
+用法（在项目根目录下）:
+    PYTHONPATH=backend python -m benchmarks.bench_chunking --pages 500
+"""
+import argparse
+from services.chunk_service import ChunkService
+from benchmarks.utils import load_sample_pages, best_of
+
+
+def legacy_fixed_size_chunks(text: str, chunk_size: int = 1000) -> list:
+    """旧版按空格切词、逐词拼接的固定大小分块，作为对比基线"""
+    chunks = []
+    current_chunk = ""
+    words = text.split()
+
+    for word in words:
+        if len(current_chunk) + len(word) + 1 <= chunk_size:
+            current_chunk += " " + word if current_chunk else word
+        else:
+            if current_chunk:
+                chunks.append({"text": current_chunk.strip()})
+            current_chunk = word
+
+    if current_chunk:
+        chunks.append({"text": current_chunk.strip()})
+
+    return chunks
+
+
+def bench_fixed_size(page_map: list, chunk_size: int, chunk_overlap: int, repeat: int):
+    service = ChunkService()
+    metadata = {"filename": "benchmark.pdf", "loading_method": "benchmark"}
+
+    def run_legacy():
+        chunks = []
+        for page_data in page_map:
+            for chunk in legacy_fixed_size_chunks(page_data['text'], chunk_size):
+                chunks.append({
+                    "content": chunk["text"],
+                    "metadata": {
+                        "chunk_id": len(chunks) + 1,
+                        "page_number": page_data['page'],
+                        "page_range": str(page_data['page']),
+                        "word_count": len([char for char in chunk["text"] if char.strip()])
+                    }
+                })
+        return chunks
+
+    def run_current():
+        return service.chunk_text("", "fixed_size", metadata, page_map=page_map,
+                                  chunk_size=chunk_size, chunk_overlap=chunk_overlap)["chunks"]
+
+    total_chars = sum(len(page_data['text']) for page_data in page_map)
+    legacy_chunks = run_legacy()
+    current_chunks = run_current()
+    oversized = sum(1 for chunk in legacy_chunks if len(chunk["content"]) > chunk_size)
+    legacy_time = best_of(run_legacy, repeat)
+    current_time = best_of(run_current, repeat)
+
+    print(f"fixed_size: {len(page_map)} 页, {total_chars} 字符, chunk_size={chunk_size}, overlap={chunk_overlap}")
+    print(f"  旧实现: {legacy_time * 1000:.1f} ms, {len(legacy_chunks)} 块（超出 chunk_size 的块: {oversized}）")
+    print(f"  新实现: {current_time * 1000:.1f} ms, {len(current_chunks)} 块")
+    print(f"  加速比: {legacy_time / current_time:.2f}x")
+
+
+def bench_sentences(page_map: list, repeat: int):
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        RecursiveCharacterTextSplitter = None
+
+    service = ChunkService()
+    metadata = {"filename": "benchmark.pdf", "loading_method": "benchmark"}
+
+    def run_legacy():
+        # 旧实现：每页新建一个 RecursiveCharacterTextSplitter，再逐块统计字数
+        chunks = []
+        for page_data in page_map:
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200,
+                separators=["。", "！", "？", ".", "!", "?", "\n", " "]
+            )
+            for text in splitter.split_text(page_data['text']):
+                chunks.append({
+                    "content": text,
+                    "metadata": {
+                        "chunk_id": len(chunks) + 1,
+                        "page_number": page_data['page'],
+                        "page_range": str(page_data['page']),
+                        "word_count": len([char for char in text if char.strip()])
+                    }
+                })
+        return chunks
+
+    def run_current():
+        return service.chunk_text("", "by_sentences", metadata, page_map=page_map,
+                                  chunk_size=1000, chunk_overlap=200)["chunks"]
+
+    current_chunks = run_current()
+    current_time = best_of(run_current, repeat)
+    print(f"by_sentences: {len(page_map)} 页, chunk_size=1000, overlap=200")
+    if RecursiveCharacterTextSplitter is None:
+        print("  未安装 langchain，跳过旧实现对比")
+    else:
+        legacy_chunks = run_legacy()
+        legacy_time = best_of(run_legacy, repeat)
+        print(f"  RecursiveCharacterTextSplitter: {legacy_time * 1000:.1f} ms, {len(legacy_chunks)} 块")
+    print(f"  sentence_segmenter: {current_time * 1000:.1f} ms, {len(current_chunks)} 块")
+    if RecursiveCharacterTextSplitter is not None:
+        print(f"  加速比: {legacy_time / current_time:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分块性能基准")
+    parser.add_argument("--pages", type=int, default=500, help="模拟文档页数")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", choices=["fixed_size", "by_sentences"], help="只运行指定的基准")
+    args = parser.parse_args()
+
+    page_map = load_sample_pages(args.pages)
+    if args.only in (None, "fixed_size"):
+        bench_fixed_size(page_map, args.chunk_size, args.chunk_overlap, args.repeat)
+    if args.only in (None, "by_sentences"):
+        bench_sentences(page_map, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+PDF 加载方法基准：在本地生成的合成 PDF 上运行 LoadService 的各个 _load_with_* 方法，
+统计每秒页数、峰值内存（RSS，另给出相对导入完成时的增量）以及与已知原文对比的文本保真度。
+
+合成 PDF 的页数、每页行数、中英文比例和表格数量均可配置。每个方法在独立的子进程中运行，
+峰值内存互不影响。保真度为每页 token（中文二元组 + 英文单词）多重集合的 F1 的平均值。
+
+用法（在项目根目录下）:
+    PYTHONPATH=backend python -m benchmarks.bench_loaders --pages 50 --cjk-ratio 0.7 --tables 1 --output loaders.json
+    PYTHONPATH=backend python -m benchmarks.bench_loaders --methods pymupdf,pdfplumber --output loaders.csv
+
+也可以用 pytest-benchmark 运行（需安装 pytest-benchmark）:
+    PYTHONPATH=backend pytest backend/benchmarks/bench_loaders.py --benchmark-only
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+import fitz  # PyMuPDF
+from services.text_tokenizer import tokenize
+
+METHODS = ("pymupdf", "pypdf", "pdfplumber", "unstructured", "pdfminer")
+RESULT_FIELDS = ["method", "status", "seconds", "pages_per_sec", "peak_rss_mb", "baseline_rss_mb",
+                 "rss_growth_mb", "fidelity", "extracted_pages", "error"]
+
+CJK_TEXT = (
+    "本理财计划为固定收益类产品业绩比较基准不代表未来表现和实际收益投资者应充分认识投资风险谨慎投资"
+    "管理人托管人销售机构产品代码募集期开放日份额净值认购申购赎回费用税收信息披露风险揭示书"
+)
+LATIN_WORDS = (
+    "fund asset bond equity yield return risk rate period investor manager custodian share "
+    "value fee subscription redemption benchmark disclosure liquidity credit market interest"
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+LINE_HEIGHT = 16
+TABLE_ROW_HEIGHT = 18
+
+
+def _cjk_line(rng: random.Random, length: int = 28) -> str:
+    start = rng.randrange(len(CJK_TEXT) - length)
+    return CJK_TEXT[start:start + length] + "。"
+
+
+def _latin_line(rng: random.Random, words: int = 9) -> str:
+    return " ".join(rng.choice(LATIN_WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate_pdf(path: str, pages: int = 20, lines: int = 30, cjk_ratio: float = 0.5,
+                 tables: int = 0, table_rows: int = 5, table_cols: int = 4, seed: int = 0) -> list:
+    """生成合成 PDF，返回每页的原文"""
+    rng = random.Random(seed)
+    truth = []
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page_lines = []
+        y = MARGIN + LINE_HEIGHT
+        max_text_y = PAGE_HEIGHT - MARGIN - tables * (table_rows * TABLE_ROW_HEIGHT + LINE_HEIGHT)
+        for _ in range(lines):
+            if y > max_text_y:
+                break
+            line = _cjk_line(rng) if rng.random() < cjk_ratio else _latin_line(rng)
+            page.insert_text((MARGIN, y), line, fontname="china-s", fontsize=10)
+            page_lines.append(line)
+            y += LINE_HEIGHT
+
+        col_width = (PAGE_WIDTH - 2 * MARGIN) / table_cols
+        for _ in range(tables):
+            y += LINE_HEIGHT / 2
+            for row in range(table_rows):
+                top = y + row * TABLE_ROW_HEIGHT
+                for col in range(table_cols):
+                    left = MARGIN + col * col_width
+                    page.draw_rect(fitz.Rect(left, top, left + col_width, top + TABLE_ROW_HEIGHT), width=0.5)
+                    if row == 0:
+                        cell = CJK_TEXT[rng.randrange(len(CJK_TEXT) - 4):][:4] if rng.random() < cjk_ratio else rng.choice(LATIN_WORDS)
+                    else:
+                        cell = f"{rng.uniform(0, 100):.2f}%"
+                    page.insert_text((left + 3, top + 13), cell, fontname="china-s", fontsize=9)
+                    page_lines.append(cell)
+            y += table_rows * TABLE_ROW_HEIGHT
+        truth.append("\n".join(page_lines))
+    doc.save(path)
+    doc.close()
+    return truth
+
+
+def fidelity(extracted: str, expected: str) -> float:
+    """两段文本 token 多重集合的 F1"""
+    extracted_tokens = Counter(tokenize(extracted))
+    expected_tokens = Counter(tokenize(expected))
+    if not expected_tokens:
+        return 1.0 if not extracted_tokens else 0.0
+    overlap = sum((extracted_tokens & expected_tokens).values())
+    if not overlap:
+        return 0.0
+    precision = overlap / sum(extracted_tokens.values())
+    recall = overlap / sum(expected_tokens.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def _peak_rss_mb() -> float:
+    # Linux 下 ru_maxrss 单位为 KB，macOS 下为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_once(method: str, pdf_path: str) -> list:
+    """用指定方法加载一次，返回 page_map"""
+    from services.load_service import LoadService
+    service = LoadService()
+    if method == "unstructured":
+        page_map = service._load_with_unstructured(pdf_path, strategy="fast")
+    else:
+        page_map = getattr(service, f"_load_with_{method}")(pdf_path)
+    return page_map.to_pages()
+
+
+def _run_method(method: str, pdf_path: str, truth: list, repeat: int, queue) -> None:
+    """子进程入口：加载 repeat 次，取最短耗时和最后一次结果的保真度"""
+    try:
+        # 先完成模块导入，导入耗时和内存不计入加载结果
+        import services.load_service  # noqa: F401
+        baseline_rss = _peak_rss_mb()
+        best = float("inf")
+        page_map = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page_map = load_once(method, pdf_path)
+            best = min(best, time.perf_counter() - start)
+        texts = {page["page"]: page["text"] for page in page_map}
+        scores = [fidelity(texts.get(page_num, ""), expected) for page_num, expected in enumerate(truth, 1)]
+        queue.put({
+            "method": method,
+            "status": "ok",
+            "seconds": round(best, 4),
+            "pages_per_sec": round(len(truth) / best, 2) if best > 0 else None,
+            "peak_rss_mb": round(_peak_rss_mb(), 1),
+            "baseline_rss_mb": round(baseline_rss, 1),
+            "rss_growth_mb": round(_peak_rss_mb() - baseline_rss, 1),
+            "fidelity": round(sum(scores) / len(scores), 4) if scores else None,
+            "extracted_pages": len(page_map)
+        })
+    except Exception as e:
+        queue.put({"method": method, "status": "error", "error": str(e)})
+
+
+def run_benchmark(methods, pdf_path: str, truth: list, repeat: int = 3, timeout: float = 600) -> list:
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for method in methods:
+        queue = context.Queue()
+        process = context.Process(target=_run_method, args=(method, pdf_path, truth, repeat, queue))
+        process.start()
+        try:
+            results.append(queue.get(timeout=timeout))
+        except Exception:
+            results.append({"method": method, "status": "timeout"})
+        process.join(5)
+        if process.is_alive():
+            process.terminate()
+    return results
+
+
+def write_results(path: str, config: dict, results: list) -> None:
+    """按扩展名写出 JSON 或 CSV；CSV 已存在时追加，便于跨版本对比"""
+    if path.endswith(".csv"):
+        fields = list(config) + RESULT_FIELDS
+        write_header = not os.path.exists(path)
+        with open(path, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, restval="", extrasaction="ignore")
+            if write_header:
+                writer.writeheader()
+            writer.writerows({**config, **result} for result in results)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"config": config, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF 加载方法基准")
+    parser.add_argument("--methods", default=",".join(METHODS), help="逗号分隔的加载方法")
+    parser.add_argument("--pages", type=int, default=20, help="合成 PDF 页数")
+    parser.add_argument("--lines", type=int, default=30, help="每页正文行数（文本密度）")
+    parser.add_argument("--cjk-ratio", type=float, default=0.5, help="中文行所占比例 0-1")
+    parser.add_argument("--tables", type=int, default=0, help="每页表格数")
+    parser.add_argument("--table-rows", type=int, default=5)
+    parser.add_argument("--table-cols", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果文件，.json 或 .csv")
+    args = parser.parse_args()
+
+    config = {
+        "timestamp": datetime.now().isoformat(),
+        "pages": args.pages,
+        "lines": args.lines,
+        "cjk_ratio": args.cjk_ratio,
+        "tables": args.tables,
+        "table_rows": args.table_rows,
+        "table_cols": args.table_cols,
+        "repeat": args.repeat,
+        "seed": args.seed
+    }
+    methods = [method.strip() for method in args.methods.split(",") if method.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "synthetic.pdf")
+        truth = generate_pdf(pdf_path, args.pages, args.lines, args.cjk_ratio,
+                             args.tables, args.table_rows, args.table_cols, args.seed)
+        print(f"合成 PDF: {args.pages} 页, 每页 {args.lines} 行, 中文比例 {args.cjk_ratio}, 每页表格 {args.tables}")
+        results = run_benchmark(methods, pdf_path, truth, args.repeat)
+
+    for result in results:
+        if result["status"] == "ok":
+            print(f"  {result['method']:<13s} {result['pages_per_sec']:>9.1f} 页/秒  "
+                  f"峰值内存 {result['peak_rss_mb']:>7.1f} MB (+{result['rss_growth_mb']:.1f})  保真度 {result['fidelity']:.3f}")
+        else:
+            print(f"  {result['method']:<13s} {result['status']}: {result.get('error', '')}")
+
+    if args.output:
+        write_results(args.output, config, results)
+        print(f"结果已写入 {args.output}")
+
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+if pytest is not None:
+    @pytest.fixture(scope="module")
+    def synthetic_pdf(tmp_path_factory):
+        path = str(tmp_path_factory.mktemp("bench_loaders") / "synthetic.pdf")
+        return path, generate_pdf(path, pages=10, cjk_ratio=0.5, tables=1)
+
+    @pytest.mark.parametrize("method", METHODS)
+    def test_load_throughput(benchmark, synthetic_pdf, method):
+        pdf_path, truth = synthetic_pdf
+        page_map = benchmark(load_once, method, pdf_path)
+        texts = {page["page"]: page["text"] for page in page_map}
+        benchmark.extra_info["fidelity"] = sum(
+            fidelity(texts.get(page_num, ""), expected) for page_num, expected in enumerate(truth, 1)
+        ) / len(truth)
+
+
+if __name__ == "__main__":
+    main()
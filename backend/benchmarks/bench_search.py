@@ -0,0 +1,149 @@
+"""
+向量检索基准：精确检索与 IVF 近似检索在不同 nprobe 下的 recall@k 与单次查询延迟。
+
+默认在合成的簇状单位向量上测试；--store 指定 02-embedded-docs 中的 .npy 文件时改用真实向量，
+查询取库中向量加噪声。--docs 把合成向量拆成多份文档写入临时目录，
+经 SearchService 按真实布局（每份文档一个向量文件、全部文件一个语料索引）比较 exact 和 ivf。
+
+用法（在项目根目录下）:
+    PYTHONPATH=backend python -m benchmarks.bench_search --vectors 200000 --dim 256
+    PYTHONPATH=backend python -m benchmarks.bench_search --store 02-embedded-docs/xxx_hashing.npy
+    PYTHONPATH=backend python -m benchmarks.bench_search --docs 1000 --vectors 200000 --dim 256
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+from services.search_service import IVFIndex, SearchService, exact_search
+
+
+def synthetic_vectors(total: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """围绕 clusters 个随机中心生成的单位向量"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, size=total)]
+    vectors += 0.6 * rng.standard_normal((total, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    queries = np.asarray(vectors[rng.integers(0, len(vectors), size=count)], dtype=np.float32)
+    queries += (0.3 / np.sqrt(queries.shape[1])) * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries
+
+
+def run_queries(search, queries: np.ndarray):
+    """返回每个查询的结果下标和平均延迟（毫秒）"""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(search(query)[0])
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall(results: list, truth: list, k: int) -> float:
+    hits = sum(len(np.intersect1d(found[:k], expected[:k])) for found, expected in zip(results, truth))
+    return hits / (k * len(truth))
+
+
+def write_corpus(embedded_dir: str, vectors: np.ndarray, docs: int, embedder: str = "hashing"):
+    """把向量均分为 docs 份，按 EmbedService 的文件布局写成 docs 个向量文件"""
+    for i, rows in enumerate(np.array_split(np.arange(len(vectors)), docs)):
+        base_path = os.path.join(embedded_dir, f"doc{i:05d}_{embedder}")
+        np.save(f"{base_path}.ids.npy", np.arange(1, len(rows) + 1, dtype=np.int32))
+        np.save(f"{base_path}.hashes.npy", np.zeros(len(rows), dtype=np.uint64))
+        with open(f"{base_path}.json", 'w', encoding='utf-8') as f:
+            json.dump({"source": f"doc{i:05d}", "embedder": embedder, "dim": vectors.shape[1]}, f)
+        np.save(f"{base_path}.npy", vectors[rows])
+
+
+def run_corpus(vectors: np.ndarray, queries: np.ndarray, docs: int, k: int, nprobes: list):
+    """多文档语料上的整体检索延迟和 IVF 召回率，结果以 (文档, 行号) 比较"""
+    with tempfile.TemporaryDirectory() as embedded_dir, tempfile.TemporaryDirectory() as index_dir:
+        write_corpus(embedded_dir, vectors, docs)
+        service = SearchService(embedded_dir=embedded_dir, index_dir=index_dir)
+
+        def run(mode, nprobe=None):
+            results = []
+            start = time.perf_counter()
+            for query in queries:
+                _, candidates = service.search_by_vector(query, k, mode=mode, nprobe=nprobe)
+                results.append([(store.info["source"], row) for _, store, row in candidates])
+            return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+        def corpus_recall(results, truth):
+            return sum(len(set(found) & set(expected)) for found, expected in zip(results, truth)) / (k * len(truth))
+
+        def timed(search):
+            start = time.perf_counter()
+            search()
+            return time.perf_counter() - start
+
+        print(f"语料: {docs} 份文档 x 约 {len(vectors) // docs} 个向量")
+        print(f"  构建语料矩阵（单簇）: 耗时 {timed(lambda: service.search_by_vector(queries[0], k, mode='exact')):.2f}s")
+        truth, exact_ms = run("exact")
+        print(f"  exact: {exact_ms:.2f} ms/查询")
+        start = time.perf_counter()
+        stores = service._list_stores("hashing")
+        for query in queries:
+            found = []
+            for store in stores:
+                rows, scores = exact_search(store.vectors, query, k)
+                found.extend((float(score), store.info["source"], int(row)) for row, score in zip(rows, scores))
+            found.sort(reverse=True)
+        print(f"  逐文件 exact（对照）: {(time.perf_counter() - start) * 1000 / len(queries):.2f} ms/查询")
+
+        print(f"  auto 选择 {service.resolve_mode('auto', len(vectors))}（阈值按语料总向量数）")
+        print(f"  构建语料 IVF: 耗时 {timed(lambda: service.search_by_vector(queries[0], k, mode='ivf')):.2f}s")
+        for nprobe in nprobes:
+            results, ivf_ms = run("ivf", nprobe)
+            print(f"  ivf nprobe={nprobe:<4d}: {ivf_ms:.2f} ms/查询 ({exact_ms / ivf_ms:.1f}x), "
+                  f"recall@{k}={corpus_recall(results, truth):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量检索基准")
+    parser.add_argument("--store", help="02-embedded-docs 中的向量文件，不指定时使用合成向量")
+    parser.add_argument("--vectors", type=int, default=200000, help="合成向量数量")
+    parser.add_argument("--dim", type=int, default=256, help="合成向量维度")
+    parser.add_argument("--clusters", type=int, default=1000, help="合成向量的簇数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None, help="IVF 簇数，默认 4*sqrt(N)")
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32", help="逗号分隔的 nprobe 取值")
+    parser.add_argument("--docs", type=int, default=0, help="拆成多少份文档按真实布局检索，0 为单个矩阵")
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = np.load(args.store, mmap_mode='r')
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dim, args.clusters)
+    queries = make_queries(vectors, args.queries)
+    k = args.k
+    if args.docs:
+        run_corpus(vectors, queries, args.docs, k, [int(value) for value in args.nprobe.split(",")])
+        return
+
+    print(f"向量: {vectors.shape[0]} x {vectors.shape[1]}, 查询 {len(queries)} 次, k={k}")
+    truth, exact_ms = run_queries(lambda q: exact_search(vectors, q, k), queries)
+    print(f"  exact: {exact_ms:.2f} ms/查询, recall@{k}=1.000")
+
+    start = time.perf_counter()
+    index = IVFIndex.build(vectors, nlist=args.nlist)
+    print(f"  IVF 构建: {index.nlist} 个簇, 耗时 {time.perf_counter() - start:.2f}s")
+
+    for nprobe in (int(value) for value in args.nprobe.split(",")):
+        if nprobe > index.nlist:
+            break
+        results, ivf_ms = run_queries(lambda q: index.search(vectors, q, k, nprobe), queries)
+        print(f"  ivf nprobe={nprobe:<4d}: {ivf_ms:.2f} ms/查询 ({exact_ms / ivf_ms:.1f}x), "
+              f"recall@{k}={recall(results, truth, k):.3f}")
+
+
+if __name__ == "__main__":
+    main()
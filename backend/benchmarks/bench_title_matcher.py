@@ -0,0 +1,65 @@
+"""
+标题识别性能基准，统计每秒处理的行数。
+
+用法（在项目根目录下）:
+    PYTHONPATH=backend python -m benchmarks.bench_title_matcher --pages 500
+"""
+import argparse
+import re
+import time
+from services.title_matcher import TitleMatcher
+from benchmarks.utils import load_sample_pages
+
+# 旧版 ParseService 逐行依次尝试的十个正则
+LEGACY_TITLE_PATTERNS = [
+    r'^第[一二三四五六七八九十百千万]+[章节篇]',
+    r'^\d+\.\s+[^\n]+',
+    r'^[A-Z]\.\s+[^\n]+',
+    r'^\d+\)\s+[^\n]+',
+    r'^[A-Z]\)\s+[^\n]+',
+    r'^（\d+）\s*[^\n]+',
+    r'^（[一二三四五六七八九十]+）\s*[^\n]+',
+    r'^[一二三四五六七八九十]+、\s*[^\n]+',
+    r'^[（(][一二三四五六七八九十]+[）)]\s*[^\n]+',
+    r'^[（(][A-Z][）)]\s*[^\n]+',
+]
+
+
+def lines_per_second(fn, lines: list, repeat: int):
+    best = float("inf")
+    matched = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        matched = sum(1 for line in lines if fn(line))
+        best = min(best, time.perf_counter() - start)
+    return len(lines) / best, matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="标题识别性能基准")
+    parser.add_argument("--pages", type=int, default=500, help="模拟文档页数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines = [
+        line.strip()
+        for page in load_sample_pages(args.pages)
+        for line in page["text"].split("\n")
+        if line.strip()
+    ]
+
+    def legacy(line):
+        return any(re.match(pattern, line) for pattern in LEGACY_TITLE_PATTERNS)
+
+    matcher = TitleMatcher()
+    legacy_rate, legacy_matched = lines_per_second(legacy, lines, args.repeat)
+    current_rate, current_matched = lines_per_second(matcher.match_level, lines, args.repeat)
+
+    print(f"by_titles 标题识别: {len(lines)} 行")
+    print(f"  旧实现（逐个 re.match）: {legacy_rate:,.0f} 行/秒, 识别标题 {legacy_matched} 行")
+    print(f"  TitleMatcher: {current_rate:,.0f} 行/秒, 识别标题 {current_matched} 行")
+    print(f"  加速比: {current_rate / legacy_rate:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import glob
+import os
+import time
+
+from services.doc_store import is_document_file, open_document
+
+LOADED_DOCS_DIR = "01-loaded-docs"
+
+
+def load_sample_pages(min_pages: int = 0) -> list:
+    """
+    读取 01-loaded-docs 中的样例文档，返回 page_map 列表。
+    min_pages 大于样例总页数时循环复用样例页面，模拟长文档。
+    """
+    pages = []
+    paths = sorted(glob.glob(os.path.join(LOADED_DOCS_DIR, "*")))
+    for path in filter(is_document_file, paths):
+        for chunk in open_document(path).iter_chunks():
+            if chunk["content"].strip():
+                pages.append(chunk["content"])
+    if not pages:
+        raise RuntimeError(f"{LOADED_DOCS_DIR} 中没有可用的样例文档")
+
+    total = max(min_pages, len(pages))
+    return [{"page": i + 1, "text": pages[i % len(pages)]} for i in range(total)]
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    """执行 repeat 次，返回最短耗时（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
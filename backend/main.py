@@ -1,10 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from services.web_service import router as web_router
+from services.metrics_service import REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS
 import os
+import time
 
 os.makedirs("temp", exist_ok=True)
 os.makedirs("01-chunked-docs", exist_ok=True)
+os.makedirs("01-parsed-docs", exist_ok=True)
 os.makedirs("02-embedded-docs", exist_ok=True)
 
 
@@ -17,11 +21,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Total-Count", "X-Profile-Id"],
 )
 
+# 较大的 JSON 响应按 gzip 压缩；默认的最高压缩级别对数十 MB 的响应太慢
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
 # 注册路由
 app.include_router(web_router, prefix="/api")
 
+
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    """按路由（接口函数名）记录请求耗时，未匹配到路由的请求不记录，避免标签无限增长"""
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        if route is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - start_time,
+                method=request.method, route=route.name, status=status
+            )
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,360 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+from services.text_tokenizer import tokenize
+from services.doc_store import open_document
+
+logger = logging.getLogger(__name__)
+
+BM25_INDEX_DIR = os.getenv("RAG_BM25_INDEX_DIR", os.path.join("index", "bm25"))
+CHUNKED_DOCS_DIR = "01-chunked-docs"
+
+BM25_K1 = float(os.getenv("RAG_BM25_K1", 1.2))
+BM25_B = float(os.getenv("RAG_BM25_B", 0.75))
+
+
+class Segment:
+    """
+    一组 chunk 的倒排表。词项按字典序存放在 terms 中，
+    第 i 个词项的倒排记录为 rows/tfs[offsets[i]:offsets[i + 1]]。单个文档的段中 rows 为文档内 chunk 的行号；
+    多个段合并成的表中 rows 为表内行号，slots[row] 为该行所属文档的段号。
+    """
+
+    def __init__(self, terms, offsets, rows, tfs, chunk_ids, lengths, slots=None):
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.chunk_ids = chunk_ids
+        self.lengths = lengths
+        self.slots = slots
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, chunks: list):
+        chunk_ids = np.empty(len(chunks), dtype=np.int32)
+        lengths = np.empty(len(chunks), dtype=np.int32)
+        row_terms = []
+        row_ids = []
+        for row, chunk in enumerate(chunks):
+            tokens = tokenize(chunk["content"])
+            chunk_ids[row] = chunk["metadata"]["chunk_id"]
+            lengths[row] = len(tokens)
+            row_terms.extend(tokens)
+            row_ids.extend([row] * len(tokens))
+
+        if not row_terms:
+            empty = np.empty(0, dtype=np.int32)
+            return cls(np.empty(0, dtype=str), np.zeros(1, dtype=np.int64), empty, empty, chunk_ids, lengths)
+
+        # 先按 (词项, 行号) 去重得到词频，再按词项排序成 CSR 结构
+        terms, term_index = np.unique(np.array(row_terms), return_inverse=True)
+        pairs = term_index.astype(np.int64) * len(chunks) + np.array(row_ids, dtype=np.int64)
+        pairs, tfs = np.unique(pairs, return_counts=True)
+        term_of_pair = pairs // len(chunks)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_of_pair, minlength=len(terms)), out=offsets[1:])
+        rows = (pairs % len(chunks)).astype(np.int32)
+        return cls(terms, offsets, rows, tfs.astype(np.int32), chunk_ids, lengths)
+
+    @classmethod
+    def merge(cls, tables: list):
+        """把多张带 slots 的表合并为一张，各表的行号依次平移，同一词项的倒排记录按原顺序拼接"""
+        bases = np.cumsum([0] + [len(table) for table in tables[:-1]])
+        chunk_ids = np.concatenate([table.chunk_ids for table in tables])
+        lengths = np.concatenate([table.lengths for table in tables])
+        slots = np.concatenate([table.slots for table in tables])
+        all_terms = np.concatenate([np.repeat(table.terms, np.diff(table.offsets)) for table in tables])
+        if not len(all_terms):
+            empty = np.empty(0, dtype=np.int32)
+            return cls(np.empty(0, dtype=str), np.zeros(1, dtype=np.int64), empty, empty, chunk_ids, lengths, slots)
+        terms, term_index = np.unique(all_terms, return_inverse=True)
+        order = np.argsort(term_index, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_index, minlength=len(terms)), out=offsets[1:])
+        rows = np.concatenate([table.rows.astype(np.int64) + base for table, base in zip(tables, bases)])
+        tfs = np.concatenate([table.tfs for table in tables])
+        return cls(terms, offsets, rows[order].astype(np.int32), tfs[order], chunk_ids, lengths, slots)
+
+    def with_slot(self, slot: int):
+        """单个文档的段作为一张表，全部行属于段号 slot"""
+        return Segment(self.terms, self.offsets, self.rows, self.tfs, self.chunk_ids, self.lengths,
+                       np.full(len(self), slot, dtype=np.int32))
+
+    def postings(self, term: str):
+        """返回 (rows, tfs)，词项不存在时为 None"""
+        i = np.searchsorted(self.terms, term)
+        if i >= len(self.terms) or self.terms[i] != term:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.rows[start:end], self.tfs[start:end]
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, terms=self.terms, offsets=self.offsets, rows=self.rows,
+                 tfs=self.tfs, chunk_ids=self.chunk_ids, lengths=self.lengths)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["terms"], data["offsets"], data["rows"],
+                       data["tfs"], data["chunk_ids"], data["lengths"])
+
+
+class BM25Index:
+    """
+    已分块文档的 BM25 词法索引。每个已分块文档对应一个段文件，segments.json 记录各段的来源
+    （source 为分块所用的已加载文档）与统计信息。加入文档时默认替换同一已加载文档此前的分块结果，
+    也可以让多次分块的结果并存；不同 PDF 即使文件名相同也是不同的已加载文档，互不影响。
+
+    检索时全部段在内存中合并成少数几张表（与 DedupIndex 相同：新段单独成表，相邻两表大小接近时合并），
+    每个查询词在每张表中只查找一次，不随文档数逐段循环。段被替换或删除后只标记失效，
+    失效的行超过一半时丢弃全部表，下次检索时从段文件重新合并。
+    """
+
+    def __init__(self, index_dir: str = BM25_INDEX_DIR, k1: float = BM25_K1, b: float = BM25_B):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._entries = None   # 已分块文档 doc_id -> 段信息
+        self._tables = None    # [Segment]，带 slots 的合并表
+        self._slots = []       # 段号 -> 已分块文档 doc_id，失效的段为 None
+        self._slot_of = {}     # 已分块文档 doc_id -> 当前段号
+        self._dead_rows = 0    # 表中属于失效段的行数
+        self._documents = {}   # 已分块文档 doc_id -> StoredDocument
+
+    @property
+    def _entries_path(self) -> str:
+        return os.path.join(self.index_dir, "segments.json")
+
+    def _segment_path(self, chunked_doc_id: str) -> str:
+        return os.path.join(self.index_dir, self._entries[chunked_doc_id]["segment"])
+
+    @staticmethod
+    def _segment_name(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest() + ".npz"
+
+    def _load_entries(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            for key, entry in saved.items():
+                if "chunked_doc_id" in entry:
+                    # 旧索引按 PDF 文件名保存段，转换为按已分块文档保存，来源未知时按文件名匹配
+                    entry = {**entry, "source": None, "segment": self._segment_name(key)}
+                    key = entry.pop("chunked_doc_id")
+                self._entries[key] = entry
+
+    def _save_entries(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{self._entries_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._entries_path)
+
+    def _ensure_tables(self):
+        """第一次检索时把全部段读入并合并成一张表"""
+        self._load_entries()
+        if self._tables is not None:
+            return
+        self._tables, self._slots, self._slot_of, self._dead_rows = [], [], {}, 0
+        tables = [Segment.load(self._segment_path(chunked_doc_id)).with_slot(self._new_slot(chunked_doc_id))
+                  for chunked_doc_id in self._entries]
+        if tables:
+            self._tables.append(Segment.merge(tables))
+
+    def _new_slot(self, chunked_doc_id: str) -> int:
+        slot = len(self._slots)
+        self._slots.append(chunked_doc_id)
+        self._slot_of[chunked_doc_id] = slot
+        return slot
+
+    def _add_table(self, chunked_doc_id: str, segment: Segment) -> None:
+        if self._tables is None:
+            return
+        self._tables.append(segment.with_slot(self._new_slot(chunked_doc_id)))
+        while len(self._tables) > 1 and len(self._tables[-2]) <= 2 * len(self._tables[-1]):
+            newer, older = self._tables.pop(), self._tables.pop()
+            self._tables.append(Segment.merge([older, newer]))
+
+    def _drop(self, chunked_doc_id: str) -> None:
+        """从索引中移除一个已分块文档（调用方持有锁并负责保存段信息）"""
+        entry = self._entries.pop(chunked_doc_id)
+        try:
+            os.remove(os.path.join(self.index_dir, entry["segment"]))
+        except FileNotFoundError:
+            pass
+        self._documents.pop(chunked_doc_id, None)
+        slot = self._slot_of.pop(chunked_doc_id, None)
+        if slot is None:
+            return
+        self._slots[slot] = None
+        self._dead_rows += entry["total_chunks"]
+        if self._dead_rows * 2 > sum(len(table) for table in self._tables):
+            self._tables, self._slots, self._slot_of = None, [], {}
+
+    def _same_source(self, entry: dict, source: str, filename: str) -> bool:
+        if entry.get("source") is None:
+            return entry["filename"] == filename
+        return entry["source"] == source
+
+    def documents_for(self, source: str, filename: str = "") -> list:
+        """已加载文档 source 在索引中的已分块文档；旧索引中来源未知的段按文件名 filename 匹配"""
+        with self._lock:
+            self._load_entries()
+            return [chunked_doc_id for chunked_doc_id, entry in self._entries.items()
+                    if self._same_source(entry, source, filename)]
+
+    def add_document(self, chunked_doc_id: str, document_data: dict, source: str = None, replace: bool = True) -> None:
+        """
+        把已分块文档加入索引，source 为分块所用的已加载文档。replace 为真时移除同一 source 此前的分块结果，
+        只检索最新的一次分块；为假时与之并存。已在索引中的文档不重复加入。
+        """
+        with self._lock:
+            self._load_entries()
+            if chunked_doc_id in self._entries:
+                return
+        # 近重复 chunk 只索引其规范 chunk；分词和建表不持有锁
+        chunks = [chunk for chunk in document_data.get("chunks", []) if "duplicate_of" not in chunk["metadata"]]
+        segment = Segment.build(chunks)
+        filename = document_data.get("filename", "")
+        with self._lock:
+            if chunked_doc_id in self._entries:
+                return
+            if replace:
+                for previous in [key for key, entry in self._entries.items() if self._same_source(entry, source, filename)]:
+                    self._drop(previous)
+            entry = {
+                "source": source,
+                "segment": self._segment_name(chunked_doc_id),
+                "filename": filename,
+                "chunking_method": document_data.get("chunking_method", ""),
+                "total_chunks": len(chunks),
+                "total_tokens": int(segment.lengths.sum())
+            }
+            os.makedirs(self.index_dir, exist_ok=True)
+            segment.save(os.path.join(self.index_dir, entry["segment"]))
+            self._entries[chunked_doc_id] = entry
+            self._add_table(chunked_doc_id, segment)
+            self._save_entries()
+
+    def remove_document(self, chunked_doc_id: str) -> bool:
+        with self._lock:
+            self._load_entries()
+            if chunked_doc_id not in self._entries:
+                return False
+            self._drop(chunked_doc_id)
+            self._save_entries()
+            return True
+
+    def _get_chunk(self, chunked_doc_id: str, chunk_id: int) -> dict:
+        """按需从分块文档读取一个 chunk，文档或 chunk 不存在时返回空字典"""
+        document = self._documents.get(chunked_doc_id)
+        if document is None:
+            path = os.path.join(CHUNKED_DOCS_DIR, chunked_doc_id)
+            if not os.path.isfile(path):
+                return {}
+            document = self._documents[chunked_doc_id] = open_document(path)
+        return document.chunk_by_id(chunk_id) or {}
+
+    def search(self, query: str, top_k: int = 5, doc_ids=None) -> list:
+        """
+        返回 BM25 得分最高的 top_k 个 chunk。
+        文档数与平均长度按全部索引段统计，doc_ids（已分块文档、已加载文档或 PDF 文件名）只限定返回结果的范围。
+        只在锁内取表和段信息的快照，打分不阻塞其他检索和 add_document；表只会整体替换，不会原地修改。
+        """
+        terms, query_tfs = np.unique(np.array(tokenize(query) or [""]), return_counts=True)
+        with self._lock:
+            self._ensure_tables()
+            if not self._entries:
+                return []
+            entries = dict(self._entries)
+            tables = list(self._tables)
+            slots = list(self._slots)
+            has_dead = self._dead_rows > 0
+        total_chunks = sum(entry["total_chunks"] for entry in entries.values())
+        total_tokens = sum(entry["total_tokens"] for entry in entries.values())
+        avg_length = total_tokens / total_chunks if total_chunks else 0.0
+
+        live = np.array([chunked_doc_id is not None for chunked_doc_id in slots], dtype=bool)
+        allowed = None
+        if doc_ids:
+            allowed = np.array([
+                chunked_doc_id is not None and (chunked_doc_id in doc_ids or entries[chunked_doc_id]["filename"] in doc_ids
+                                                or entries[chunked_doc_id].get("source") in doc_ids)
+                for chunked_doc_id in slots
+            ], dtype=bool)
+
+        # 每张表中每个查询词的有效倒排记录：(表, 词项下标, 行号, 词频)
+        postings = []
+        doc_freqs = np.zeros(len(terms))
+        for table in tables:
+            live_rows = live[table.slots] if has_dead else None
+            positions = np.searchsorted(table.terms, terms)
+            for i, position in enumerate(positions.tolist()):
+                if position >= len(table.terms) or table.terms[position] != terms[i]:
+                    continue
+                start, end = table.offsets[position], table.offsets[position + 1]
+                rows, tfs = table.rows[start:end], table.tfs[start:end]
+                if live_rows is not None:
+                    keep = live_rows[rows]
+                    rows, tfs = rows[keep], tfs[keep]
+                doc_freqs[i] += len(rows)
+                postings.append((table, i, rows, tfs))
+        idf = np.log(1 + (total_chunks - doc_freqs + 0.5) / (doc_freqs + 0.5))
+
+        candidates = []
+        for table in tables:
+            parts = [(i, rows, tfs) for owner, i, rows, tfs in postings if owner is table]
+            if not parts:
+                continue
+            rows = np.concatenate([rows for _, rows, _ in parts])
+            tfs = np.concatenate([tfs for _, _, tfs in parts])
+            weights = np.concatenate([np.full(len(part_rows), query_tfs[i] * idf[i]) for i, part_rows, _ in parts])
+            if allowed is not None:
+                keep = allowed[table.slots[rows]]
+                rows, tfs, weights = rows[keep], tfs[keep], weights[keep]
+            if not len(rows):
+                continue
+            norms = self.k1 * (1 - self.b + self.b * table.lengths[rows] / (avg_length or 1.0))
+            matched, inverse = np.unique(rows, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights * tfs * (self.k1 + 1) / (tfs + norms))
+            if len(matched) > top_k:
+                best = np.argpartition(-scores, top_k - 1)[:top_k]
+                matched, scores = matched[best], scores[best]
+            candidates.extend((float(score), table, int(row)) for score, row in zip(scores, matched))
+        candidates.sort(key=lambda item: item[0], reverse=True)
+
+        results = []
+        for score, table, row in candidates[:top_k]:
+            chunked_doc_id = slots[table.slots[row]]
+            entry = entries[chunked_doc_id]
+            chunk_id = int(table.chunk_ids[row])
+            chunk = self._get_chunk(chunked_doc_id, chunk_id)
+            results.append({
+                "score": score,
+                "doc_id": chunked_doc_id,
+                "filename": entry["filename"],
+                "content": chunk.get("content", ""),
+                "metadata": chunk.get("metadata", {"chunk_id": chunk_id})
+            })
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load_entries()
+            return {
+                "documents": len(self._entries),
+                "chunks": sum(entry["total_chunks"] for entry in self._entries.values()),
+                "lookup_tables": len(self._tables) if self._tables is not None else 0
+            }
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 提取缓存目录与容量上限
+EXTRACTION_CACHE_DIR = os.getenv("RAG_EXTRACTION_CACHE_DIR", os.path.join("cache", "extraction"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("RAG_EXTRACTION_CACHE_MAX_MB", 512)) * 1024 * 1024
+
+# 分块结果缓存：内存层条目数与磁盘层容量上限
+CHUNK_CACHE_DIR = os.getenv("RAG_CHUNK_CACHE_DIR", os.path.join("cache", "chunks"))
+CHUNK_CACHE_MAX_BYTES = int(os.getenv("RAG_CHUNK_CACHE_MAX_MB", 512)) * 1024 * 1024
+CHUNK_CACHE_MEMORY_ENTRIES = int(os.getenv("RAG_CHUNK_CACHE_MEMORY_ENTRIES", 32))
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """分块计算文件的 SHA-256"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+class DiskCache:
+    """
+    基于文件的 JSON 缓存，每个键一个文件。
+    总大小超过 max_bytes 时按最近访问时间淘汰（LRU），访问时间用文件 mtime 持久化，
+    因此重启后仍保留淘汰顺序。
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = None  # key -> 文件大小，按访问顺序排列
+        self._total_bytes = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_index(self):
+        if self._entries is not None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        self._entries = OrderedDict((key, size) for _, key, size in sorted(files))
+        self._total_bytes = sum(self._entries.values())
+
+    def get(self, key: str):
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    value = json.load(f)
+                os.utime(path)
+            except Exception as e:
+                logger.error(f"读取缓存 {key} 失败: {str(e)}")
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value) -> None:
+        data = json.dumps(value, ensure_ascii=False).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._load_index()
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load_index()
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class ExtractionCache(DiskCache):
+    """
+    PDF 提取结果缓存，键为文件内容的 SHA-256 加上加载方法与策略，
+    值为 {"total_pages": ..., "page_map": [...]}。
+    """
+
+    def __init__(self, cache_dir: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    @staticmethod
+    def make_key(file_hash: str, method: str, strategy=None, chunking_strategy=None, chunking_options=None) -> str:
+        parts = [file_hash, method]
+        # 只有 unstructured 的结果受策略参数影响
+        if method == "unstructured":
+            parts += [str(strategy), str(chunking_strategy), json.dumps(chunking_options, sort_keys=True)]
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+
+class ChunkCache(DiskCache):
+    """
+    分块结果缓存，键为已加载文档的内容哈希加分块方法和参数。
+    在磁盘层之上加一层容量为 memory_entries 的内存 LRU，重复请求不必再读盘解析。
+    """
+
+    def __init__(self, cache_dir: str = CHUNK_CACHE_DIR, max_bytes: int = CHUNK_CACHE_MAX_BYTES,
+                 memory_entries: int = CHUNK_CACHE_MEMORY_ENTRIES):
+        super().__init__(cache_dir, max_bytes)
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(content_hash: str, method: str, **params) -> str:
+        parts = [content_hash, method, json.dumps(params, sort_keys=True)]
+        return hashlib.sha256("|".join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str):
+        with self._memory_lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        value = super().get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value) -> None:
+        super().put(key, value)
+        self._remember(key, value)
+
+    def _remember(self, key: str, value) -> None:
+        with self._memory_lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._memory_lock:
+            stats["memory_entries"] = len(self._memory)
+        stats["memory_hits"] = self.memory_hits
+        return stats
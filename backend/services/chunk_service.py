@@ -1,59 +1,113 @@
 from fastapi import APIRouter
 from datetime import datetime
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from bisect import bisect_right
+from services.sentence_segmenter import sentence_boundaries, pack_sentences
+from services.page_map import PageMap
+from services.metrics_service import STAGE_SECONDS, PAGES_PROCESSED
+import time
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# 固定大小分块时优先在这些字符处断开，避免切断英文单词或数字
+BREAK_CHARS = frozenset(" \t\n\r\u3000。！？；，、：.!?;,:")
+# 在窗口末尾多大比例的范围内寻找断点
+BREAK_SEARCH_RATIO = 0.2
+
+
+def build_page_buffer(page_map):
+    """
+    返回 (buffer, page_starts, page_numbers)：所有页面用换行拼接成的文本缓冲区、
+    每页在缓冲区中的起始偏移（末尾多一个结束哨兵）和页码。
+    page_map 为 PageMap 时直接使用其缓冲区，不再拼接。
+    """
+    page_map = PageMap.coerce(page_map)
+    return page_map.buffer, page_map.starts, page_map.page_numbers
+
+
+def fixed_size_spans(buffer: str, chunk_size: int, chunk_overlap: int = 0):
+    """
+    在缓冲区上按字符数切分，逐个产出 (start, end) 偏移，相邻块重叠 chunk_overlap 个字符。
+    按字符计数，因此不含空格的中文文本也能按 chunk_size 切分。
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size 必须大于0")
+    chunk_overlap = max(0, min(chunk_overlap, chunk_size - 1))
+    search = max(1, int(chunk_size * BREAK_SEARCH_RATIO))
+    length = len(buffer)
+    start = 0
+
+    while start < length:
+        # 跳过块首空白
+        while start < length and buffer[start].isspace():
+            start += 1
+        if start >= length:
+            break
+
+        end = min(start + chunk_size, length)
+        if end < length:
+            # 在窗口末尾附近向前寻找断点，找不到则硬切
+            for cut in range(end, end - search, -1):
+                if buffer[cut - 1] in BREAK_CHARS:
+                    end = cut
+                    break
+
+        stripped_end = end
+        while stripped_end > start and buffer[stripped_end - 1].isspace():
+            stripped_end -= 1
+        yield start, stripped_end
+
+        if end >= length:
+            break
+        start = max(end - chunk_overlap, start + 1)
+
 class ChunkService:
     
-    def chunk_text(self, text: str, method: str, metadata: dict, page_map: list = None, chunk_size: int = None) -> dict:
+    def chunk_text(self, text: str, method: str, metadata: dict, page_map=None, chunk_size: int = None, chunk_overlap: int = None) -> dict:
+        """page_map 为 PageMap，也接受 [{"page": 页码, "text": 文本}, ...] 列表"""
         try:
+            start_time = time.perf_counter()
             chunks = []
+            page_map = PageMap.coerce(page_map)
             total_pages = len(page_map)
             print(f"method: {method}")
             
             def count_words(text: str) -> int:
-                return len([char for char in text if char.strip()])
+                # 去除空白字符后统计字符数
+                return len("".join(text.split()))
             
             if method == "by_pages":
-                for page_data in page_map:
+                for page_number, page_text in page_map.items():
                     chunk_metadata = {
                         "chunk_id": len(chunks) + 1,
-                        "page_number": page_data['page'],
-                        "page_range": str(page_data['page']),
-                        "word_count": count_words(page_data['text'])
+                        "page_number": page_number,
+                        "page_range": str(page_number),
+                        "word_count": count_words(page_text)
                     }
                     chunks.append({
-                        "content": page_data['text'],
+                        "content": page_text,
                         "metadata": chunk_metadata
                     })
             
             elif method == "fixed_size":
-                for page_data in page_map:
-                    page_chunks = self._fixed_size_chunks(page_data['text'], chunk_size)
-                    for idx, chunk in enumerate(page_chunks, 1):
-                        chunk_metadata = {
-                            "chunk_id": len(chunks) + 1,
-                            "page_number": page_data['page'],
-                            "page_range": str(page_data['page']),
-                            "word_count": count_words(chunk["text"])
-                        }
-                        chunks.append({
-                            "content": chunk["text"],
-                            "metadata": chunk_metadata
-                        })
+                chunks = self._fixed_size_chunks(page_map, chunk_size or 1000, chunk_overlap or 0)
             
-            elif method in ["by_paragraphs", "by_sentences"]:
-                splitter_method = self._paragraph_chunks if method == "by_paragraphs" else self._sentence_chunks
-                for page_data in page_map:
-                    page_chunks = splitter_method(page_data['text'])
+            elif method == "by_sentences":
+                chunks = self._sentence_chunks(
+                    page_map,
+                    chunk_size or 1000,
+                    chunk_overlap if chunk_overlap is not None else 200
+                )
+
+            elif method == "by_paragraphs":
+                for page_number, page_text in page_map.items():
+                    page_chunks = self._paragraph_chunks(page_text)
                     for chunk in page_chunks:
                         chunk_metadata = {
                             "chunk_id": len(chunks) + 1,
-                            "page_number": page_data['page'],
-                            "page_range": str(page_data['page']),
+                            "page_number": page_number,
+                            "page_range": str(page_number),
                             "word_count": count_words(chunk["text"])
                         }
                         chunks.append({
@@ -73,6 +127,8 @@ class ChunkService:
                 "timestamp": datetime.now().isoformat(),
                 "chunks": chunks
             }
+            STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="chunk", method=method)
+            PAGES_PROCESSED.inc(total_pages, stage="chunk", method=method)
             
             return document_data
             
@@ -80,28 +136,36 @@ class ChunkService:
             logger.error(f"Error in chunk_text: {str(e)}")
             raise
 
-    def _fixed_size_chunks(self, text: str, chunk_size: int = 1000) -> list:
+    def _fixed_size_chunks(self, page_map: PageMap, chunk_size: int = 1000, chunk_overlap: int = 0) -> list:
         """
-        将文本按固定大小分块
-        :param text: 输入文本
+        将整个文档按固定大小分块，块可以跨页
+        :param page_map: 文档页面
         :param chunk_size: 每个块的大小（字符数）
+        :param chunk_overlap: 相邻块重叠的字符数
         :return: 分块列表
         """
+        buffer, page_starts, page_numbers = build_page_buffer(page_map)
+        spans = fixed_size_spans(buffer, chunk_size, chunk_overlap)
+        return self._span_chunks(buffer, page_starts, page_numbers, spans)
+
+    def _span_chunks(self, buffer: str, page_starts: list, page_numbers: list, spans) -> list:
+        """把缓冲区上的 (start, end) 区间转换为带页码范围的分块"""
         chunks = []
-        current_chunk = ""
-        words = text.split()
-        
-        for word in words:
-            if len(current_chunk) + len(word) + 1 <= chunk_size:
-                current_chunk += " " + word if current_chunk else word
-            else:
-                if current_chunk:
-                    chunks.append({"text": current_chunk.strip()})
-                current_chunk = word
-        
-        if current_chunk:
-            chunks.append({"text": current_chunk.strip()})
-            
+        for start, end in spans:
+            content = buffer[start:end]
+            first_page = page_numbers[bisect_right(page_starts, start) - 1]
+            last_page = page_numbers[bisect_right(page_starts, end - 1) - 1]
+            chunks.append({
+                "content": content,
+                "metadata": {
+                    "chunk_id": len(chunks) + 1,
+                    "page_number": first_page,
+                    "page_range": str(first_page) if first_page == last_page else f"{first_page}-{last_page}",
+                    "word_count": len("".join(content.split())),
+                    "start_offset": start,
+                    "end_offset": end
+                }
+            })
         return chunks
 
     def _paragraph_chunks(self, text: str) -> list:
@@ -119,20 +183,25 @@ class ChunkService:
                 
         return chunks
 
-    def _sentence_chunks(self, text: str) -> list[dict]:
+    def _sentence_chunks(self, page_map: PageMap, chunk_size: int = 1000, chunk_overlap: int = 200) -> list:
         """
-        将文本按句子分块
+        将整个文档一次性断句，再把句子打包成不超过 chunk_size 的块
         
         Args:
-            text: 要分块的文本
+            page_map: 文档页面
+            chunk_size: 每个块的最大字符数
+            chunk_overlap: 相邻块之间重叠的最大字符数（按整句重叠）
             
         Returns:
-            分块后的句子列表
+            分块列表，块可以跨页
         """
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["。", "！", "？", ".", "!", "?", "\n", " "]
-        )
-        texts = splitter.split_text(text)
-        return [{"text": t} for t in texts]
\ No newline at end of file
+        buffer, page_starts, page_numbers = build_page_buffer(page_map)
+
+        def split_long(start, end):
+            # 超长的句子退化为固定大小切分
+            for sub_start, sub_end in fixed_size_spans(buffer[start:end], chunk_size, chunk_overlap):
+                yield start + sub_start, start + sub_end
+
+        boundaries = sentence_boundaries(buffer)
+        spans = pack_sentences(buffer, boundaries, chunk_size, chunk_overlap, split_long)
+        return self._span_chunks(buffer, page_starts, page_numbers, spans)
@@ -0,0 +1,545 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from typing import NamedTuple
+import numpy as np
+from services.text_tokenizer import tokenize
+from services.doc_store import open_document
+from services.manifest_service import DOC_DIRS
+
+logger = logging.getLogger(__name__)
+
+DEDUP_INDEX_DIR = os.getenv("RAG_DEDUP_INDEX_DIR", os.path.join("index", "dedup"))
+
+# off：不去重；mark：在重复 chunk 的元数据中记录 duplicate_of；collapse：从文档中移除重复 chunk，只保留指向规范 chunk 的记录
+DEDUP_MODES = ("off", "mark", "collapse")
+DEDUP_MODE = os.getenv("RAG_DEDUP_MODE", "mark")
+# MinHash 排列数与 LSH 分段数，每段 num_perm / bands 行。
+# 16 段 × 8 行时相似度约 0.7 以上的 chunk 对大概率成为候选，再按签名估计的相似度过滤
+DEDUP_NUM_PERM = int(os.getenv("RAG_DEDUP_NUM_PERM", 128))
+DEDUP_BANDS = int(os.getenv("RAG_DEDUP_BANDS", 16))
+# 估计的 Jaccard 相似度不低于该值才视为重复
+DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", 0.8))
+# 连续多少个分词结果组成一个 shingle
+DEDUP_SHINGLE_SIZE = int(os.getenv("RAG_DEDUP_SHINGLE_SIZE", 3))
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_KEY_MULTIPLIER = np.uint64(0x100000001B3)
+_BAND_SALT = np.uint64(0x9E3779B97F4A7C15)
+
+
+class MinHasher:
+    """
+    chunk 文本的 MinHash 签名。shingle 为连续 shingle_size 个分词结果，
+    用 CRC32 映射为整数后做 num_perm 个 (a * x + b) mod p 的置换，各取最小值。
+    置换参数由固定种子生成，签名在不同进程间可以比较。
+    """
+
+    def __init__(self, num_perm: int = DEDUP_NUM_PERM, bands: int = DEDUP_BANDS,
+                 shingle_size: int = DEDUP_SHINGLE_SIZE, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) 必须是 bands ({bands}) 的整数倍")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def params(self) -> dict:
+        return {"num_perm": self.num_perm, "bands": self.bands, "shingle_size": self.shingle_size}
+
+    def signature(self, text: str):
+        """文本的签名（uint32 数组），没有可分的词时返回 None"""
+        tokens = tokenize(text)
+        if not tokens:
+            return None
+        # 先对每个词做 CRC32，再把连续 k 个词的哈希组合成 shingle 的哈希，去重后作为集合
+        values = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64, count=len(tokens))
+        k = min(self.shingle_size, len(tokens))
+        shingles = values[:len(values) - k + 1].copy()
+        for j in range(1, k):
+            shingles = shingles * _KEY_MULTIPLIER + values[j:len(values) - k + 1 + j]
+        shingles = np.unique(shingles & _MAX_HASH)
+        # uint64 乘法溢出按模 2^64 回绕，与常见 MinHash 实现一致
+        hashed = (np.outer(shingles, self._a) + self._b) % _MERSENNE_PRIME
+        return (hashed.min(axis=0) & _MAX_HASH).astype(np.uint32)
+
+    def band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """(n, num_perm) 签名 -> (n, bands) 的分段键，不同分段的键加了不同的盐"""
+        rows = self.num_perm // self.bands
+        bands = signatures.reshape(len(signatures), self.bands, rows).astype(np.uint64)
+        keys = np.zeros((len(signatures), self.bands), dtype=np.uint64)
+        for j in range(rows):
+            keys = keys * _KEY_MULTIPLIER + bands[:, :, j]
+        return keys ^ (np.arange(self.bands, dtype=np.uint64) * _BAND_SALT)
+
+
+class Segment:
+    """
+    一个已分块文档中规范（非重复）chunk 的 LSH 表。
+    keys 为全部分段键排序后的结果，rows[i] 是 keys[i] 所属 chunk 在 chunk_ids/signatures 中的行号。
+    """
+
+    FIELDS = ("chunk_ids", "signatures", "keys", "rows")
+
+    def __init__(self, chunk_ids, signatures, keys, rows):
+        self.chunk_ids = chunk_ids
+        self.signatures = signatures
+        self.keys = keys
+        self.rows = rows
+
+    @classmethod
+    def build(cls, chunk_ids: np.ndarray, signatures: np.ndarray, band_keys: np.ndarray):
+        flat = band_keys.ravel()
+        # 稳定排序，相同键时靠前的 chunk 排在前面
+        order = np.argsort(flat, kind="stable")
+        rows = (order // band_keys.shape[1]).astype(np.int32) if band_keys.size else np.empty(0, dtype=np.int32)
+        return cls(chunk_ids.astype(np.int32), signatures, flat[order], rows)
+
+    def candidates(self, band_keys: np.ndarray):
+        """返回 (查询行号, 本段行号) 两个数组，每个查询行在每个分段最多命中一个候选"""
+        if not len(self.keys) or not band_keys.size:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        flat = band_keys.ravel()
+        index = np.searchsorted(self.keys, flat)
+        hit = index < len(self.keys)
+        hit[hit] = self.keys[index[hit]] == flat[hit]
+        query_rows = np.flatnonzero(hit) // band_keys.shape[1]
+        pairs = np.unique(np.stack([query_rows, self.rows[index[hit]]], axis=1), axis=0)
+        return pairs[:, 0], pairs[:, 1]
+
+    def save(self, base_path: str) -> None:
+        for field in self.FIELDS:
+            tmp_path = f"{base_path}.{field}.tmp.npy"
+            np.save(tmp_path, getattr(self, field))
+            os.replace(tmp_path, f"{base_path}.{field}.npy")
+
+    @classmethod
+    def load(cls, base_path: str):
+        # 只读内存映射，段再多也只占用实际访问到的页
+        return cls(*(np.load(f"{base_path}.{field}.npy", mmap_mode='r') for field in cls.FIELDS))
+
+    @classmethod
+    def remove(cls, base_path: str) -> None:
+        for field in cls.FIELDS:
+            try:
+                os.remove(f"{base_path}.{field}.npy")
+            except FileNotFoundError:
+                pass
+
+
+class DedupUpdate(NamedTuple):
+    """mark_duplicates / resolve_stale 的结果，分块文档写入成功后交给 DedupIndex.commit 写入索引"""
+    chunked_doc_id: str
+    source: str
+    entry: dict        # filename、total_chunks、canonical_chunks
+    segment: Segment   # 本文档规范 chunk 的 LSH 表
+    references: list   # 本文档的重复 chunk 指向的其他已分块文档
+    replace: bool      # 是否移除同一 source 的其他分块结果
+
+
+class DedupIndex:
+    """
+    跨文档的近重复 chunk 检测（MinHash + LSH）。每个已分块文档对应一个段文件，source 为分块所用的已加载文档，
+    同一 source 的分块结果互不比较；段中只收录规范 chunk，所以命中的候选一定是规范 chunk；
+    同一文档内靠后的 chunk 与靠前的重复时指向靠前的规范 chunk。
+
+    检测和写索引分两步：mark_duplicates 只标记 chunk，分块文档写入成功后再 commit，索引不会指向不存在的文件。
+    commit 默认替换同一 source 此前的分块结果；段信息记录了哪些文档引用了本文档的规范 chunk（referenced_by），
+    被替换或删除的段的引用方由调用方用 resolve_stale 重新解析。
+
+    全部段的分段键在内存中合并成少数几张有序表（键、段号、行号），新段先单独成表，
+    相邻两表大小接近时合并，表的数量随总量对数增长。查找时每张表各二分查找一次，不做两两比较，
+    候选再按签名估计的相似度过滤；签名只在验证候选时从段文件按需读取。
+    """
+
+    def __init__(self, index_dir: str = DEDUP_INDEX_DIR, threshold: float = DEDUP_THRESHOLD,
+                 hasher: MinHasher = None, chunked_dir: str = DOC_DIRS["chunked"]):
+        self.index_dir = index_dir
+        self.chunked_dir = chunked_dir
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self._lock = threading.Lock()
+        self._entries = None   # 已分块文档 doc_id -> 段信息
+        self._segments = {}    # 已分块文档 doc_id -> Segment（内存映射）
+        self._tables = None    # [(keys, slots, rows)]，各自按 keys 排序
+        self._slots = []       # 段号 -> 已分块文档 doc_id，被替换或删除的段为 None
+        self._slot_of = {}     # 已分块文档 doc_id -> 当前段号
+        self._dead_keys = 0    # 表中属于已失效段的键数
+
+    @property
+    def _entries_path(self) -> str:
+        return os.path.join(self.index_dir, "segments.json")
+
+    @staticmethod
+    def _segment_name(key: str) -> str:
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _segment_path(self, chunked_doc_id: str) -> str:
+        return os.path.join(self.index_dir, self._entries[chunked_doc_id]["segment"])
+
+    def _load_entries(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if os.path.exists(self._entries_path):
+            with open(self._entries_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            # 签名参数变化后旧段无法比较，从空索引重新开始
+            if saved.get("params") != self.hasher.params():
+                logger.warning(f"去重索引参数已变化，忽略 {self.index_dir} 中的旧索引")
+                return
+            for key, entry in saved.get("documents", {}).items():
+                if "chunked_doc_id" in entry:
+                    # 旧索引按 PDF 文件名保存段，转换为按已分块文档保存，来源未知时按文件名匹配
+                    entry = {**entry, "source": None, "segment": self._segment_name(key)}
+                    key = entry.pop("chunked_doc_id")
+                entry.setdefault("references", [])
+                entry.setdefault("referenced_by", [])
+                self._entries[key] = entry
+
+    def _save_entries(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = f"{self._entries_path}.tmp"
+        # 段信息随文档数增长且每次加入文档都要重写，不缩进以便使用 C 实现的编码器
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"params": self.hasher.params(), "documents": self._entries}, ensure_ascii=False))
+        os.replace(tmp_path, self._entries_path)
+
+    def _get_segment(self, chunked_doc_id: str) -> Segment:
+        segment = self._segments.get(chunked_doc_id)
+        if segment is None:
+            segment = Segment.load(self._segment_path(chunked_doc_id))
+            self._segments[chunked_doc_id] = segment
+        return segment
+
+    def _ensure_tables(self):
+        """第一次使用时把全部段的分段键读入并合并成一张表"""
+        self._load_entries()
+        if self._tables is not None:
+            return
+        self._tables, self._slots, self._slot_of, self._dead_keys = [], [], {}, 0
+        keys, slots, rows = [], [], []
+        for chunked_doc_id in self._entries:
+            base_path = self._segment_path(chunked_doc_id)
+            slot = self._new_slot(chunked_doc_id)
+            keys.append(np.load(f"{base_path}.keys.npy"))
+            rows.append(np.load(f"{base_path}.rows.npy"))
+            slots.append(np.full(len(keys[-1]), slot, dtype=np.int32))
+        if keys:
+            self._tables.append(self._merge(keys, slots, rows))
+
+    def _new_slot(self, chunked_doc_id: str) -> int:
+        slot = len(self._slots)
+        self._slots.append(chunked_doc_id)
+        self._slot_of[chunked_doc_id] = slot
+        return slot
+
+    @staticmethod
+    def _merge(keys: list, slots: list, rows: list) -> tuple:
+        keys, slots, rows = np.concatenate(keys), np.concatenate(slots), np.concatenate(rows)
+        # 各部分本身有序，稳定排序（timsort）近似线性归并
+        order = np.argsort(keys, kind="stable")
+        return keys[order], slots[order], rows[order]
+
+    def _add_table(self, chunked_doc_id: str, segment: Segment) -> None:
+        if self._tables is None:
+            return
+        slot = self._new_slot(chunked_doc_id)
+        self._tables.append((np.asarray(segment.keys), np.full(len(segment.keys), slot, dtype=np.int32),
+                             np.asarray(segment.rows)))
+        while len(self._tables) > 1 and len(self._tables[-2][0]) <= 2 * len(self._tables[-1][0]):
+            newer, older = self._tables.pop(), self._tables.pop()
+            self._tables.append(self._merge(*zip(older, newer)))
+
+    def _drop(self, chunked_doc_id: str) -> dict:
+        """
+        从索引中移除一个已分块文档并返回其段信息（调用方持有锁并负责保存段信息）。
+        当前段失效；失效的键超过一半时丢弃全部表，下次使用时按段信息重新读入。
+        """
+        entry = self._entries.pop(chunked_doc_id)
+        for target in entry["references"]:
+            if target in self._entries and chunked_doc_id in self._entries[target]["referenced_by"]:
+                self._entries[target]["referenced_by"].remove(chunked_doc_id)
+        self._segments.pop(chunked_doc_id, None)
+        Segment.remove(os.path.join(self.index_dir, entry["segment"]))
+        slot = self._slot_of.pop(chunked_doc_id, None)
+        if slot is not None:
+            self._slots[slot] = None
+            self._dead_keys += entry["canonical_chunks"] * self.hasher.bands
+            if self._dead_keys * 2 > sum(len(table[0]) for table in self._tables):
+                self._tables, self._slots, self._slot_of = None, [], {}
+        return entry
+
+    def _same_source(self, entry: dict, source: str, filename: str) -> bool:
+        if entry.get("source") is None:
+            return entry["filename"] == filename
+        return entry["source"] == source
+
+    def _source_documents(self, source: str, filename: str) -> set:
+        return {chunked_doc_id for chunked_doc_id, entry in self._entries.items()
+                if self._same_source(entry, source, filename)}
+
+    def _lookup(self, band_keys: np.ndarray, exclude: set):
+        """返回 (查询行号, 段号, 段内行号)，已去重且不含失效的段和 exclude 中文档的段"""
+        flat = band_keys.ravel()
+        found = []
+        for keys, slots, rows in self._tables:
+            left = np.searchsorted(keys, flat, side="left")
+            counts = np.searchsorted(keys, flat, side="right") - left
+            total = int(counts.sum())
+            if not total:
+                continue
+            # 展开每个查询键命中的 [left, right) 区间
+            query_index = np.repeat(np.arange(len(flat)), counts)
+            positions = np.repeat(left - np.cumsum(counts) + counts, counts) + np.arange(total)
+            found.append(np.stack([query_index // band_keys.shape[1], slots[positions], rows[positions]], axis=1))
+        if not found:
+            return np.empty((0, 3), dtype=np.int64)
+        found = np.unique(np.concatenate(found), axis=0)
+        live = np.array([chunked_doc_id is not None for chunked_doc_id in self._slots])
+        for chunked_doc_id in exclude:
+            if chunked_doc_id in self._slot_of:
+                live[self._slot_of[chunked_doc_id]] = False
+        return found[live[found[:, 1]]]
+
+    def _signatures(self, contents: list) -> tuple:
+        """返回 (有签名的下标, 签名, 分段键)，没有可分的词的文本不参与比较"""
+        signed, signatures = [], []
+        for i, content in enumerate(contents):
+            signature = self.hasher.signature(content)
+            if signature is not None:
+                signed.append(i)
+                signatures.append(signature)
+        signatures = np.array(signatures, dtype=np.uint32).reshape(len(signed), self.hasher.num_perm)
+        return signed, signatures, self.hasher.band_keys(signatures)
+
+    def _find_canonical(self, signatures: np.ndarray, band_keys: np.ndarray, exclude: set) -> dict:
+        """在索引中查找规范 chunk，返回 {签名行号: (相似度, 规范 chunk 所在的已分块文档, chunk_id)}（调用方持有锁）"""
+        matches = {}
+        found = self._lookup(band_keys, exclude)
+        for slot in np.unique(found[:, 1]).tolist():
+            other_id = self._slots[slot]
+            segment = self._get_segment(other_id)
+            query_rows, segment_rows = found[found[:, 1] == slot][:, [0, 2]].T
+            similarities = (signatures[query_rows] == segment.signatures[segment_rows]).mean(axis=1)
+            for query_row, segment_row, similarity in zip(query_rows.tolist(), segment_rows.tolist(), similarities.tolist()):
+                if similarity >= self.threshold and similarity > matches.get(query_row, (0.0,))[0]:
+                    matches[query_row] = (similarity, other_id, int(segment.chunk_ids[segment_row]))
+        return matches
+
+    def _build_update(self, chunked_doc_id: str, source: str, document_data: dict, total_chunks: int,
+                      replace: bool, segment: Segment = None) -> DedupUpdate:
+        """按 document_data 中当前的重复标记生成本文档的引用关系，未给出 segment 时由规范 chunk 重新计算"""
+        chunks = document_data.get("chunks", [])
+        if segment is None:
+            canonical = [chunk for chunk in chunks if "duplicate_of" not in chunk["metadata"]]
+            signed, signatures, band_keys = self._signatures([chunk["content"] for chunk in canonical])
+            chunk_ids = np.array([canonical[i]["metadata"]["chunk_id"] for i in signed], dtype=np.int32)
+            segment = Segment.build(chunk_ids, signatures, band_keys)
+        pointers = [chunk["metadata"]["duplicate_of"] for chunk in chunks if "duplicate_of" in chunk["metadata"]]
+        pointers += [record["duplicate_of"] for record in document_data.get("collapsed_chunks", [])]
+        return DedupUpdate(
+            chunked_doc_id, source,
+            {"filename": document_data.get("filename", ""), "total_chunks": total_chunks,
+             "canonical_chunks": len(segment.chunk_ids)},
+            segment,
+            sorted({pointer["doc_id"] for pointer in pointers} - {chunked_doc_id}),
+            replace
+        )
+
+    def mark_duplicates(self, chunked_doc_id: str, document_data: dict, source: str = None,
+                        mode: str = DEDUP_MODE, replace: bool = True):
+        """
+        检测 document_data 中与其他已加载文档的规范 chunk 或本文档靠前 chunk 近重复的 chunk，按 mode 标记或移除，
+        直接修改 document_data。source 为分块所用的已加载文档，同一 source 的其他分块结果不参与比较。
+        不修改索引：返回 DedupUpdate，分块文档写入成功后交给 commit；mode 为 off 时返回 None。
+        """
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"不支持的去重方式: {mode}")
+        if mode == "off":
+            return None
+
+        chunks = document_data.get("chunks", [])
+        signed_rows, signatures, band_keys = self._signatures([chunk["content"] for chunk in chunks])
+
+        with self._lock:
+            self._ensure_tables()
+            exclude = self._source_documents(source, document_data.get("filename", "")) | {chunked_doc_id}
+            # 签名行号 -> (相似度, 规范 chunk 所在的已分块文档, chunk_id)
+            matches = self._find_canonical(signatures, band_keys, exclude)
+
+        # 本文档内部：只与靠前的 chunk 比较，规范 chunk 是重复时沿用它指向的规范 chunk
+        own = Segment.build(np.arange(len(signed_rows)), signatures, band_keys)
+        query_rows, own_rows = own.candidates(band_keys)
+        earlier = own_rows < query_rows
+        query_rows, own_rows = query_rows[earlier], own_rows[earlier]
+        similarities = (signatures[query_rows] == signatures[own_rows]).mean(axis=1)
+        internal = {}
+        for query_row, own_row, similarity in zip(query_rows.tolist(), own_rows.tolist(), similarities.tolist()):
+            if similarity >= self.threshold and similarity > internal.get(query_row, (0.0,))[0]:
+                internal[query_row] = (similarity, own_row)
+        for query_row in sorted(internal):
+            if query_row in matches:
+                continue
+            similarity, own_row = internal[query_row]
+            canonical = matches.get(own_row)
+            if canonical is not None:
+                matches[query_row] = (similarity, canonical[1], canonical[2])
+            else:
+                chunk_id = chunks[signed_rows[own_row]]["metadata"]["chunk_id"]
+                matches[query_row] = (similarity, chunked_doc_id, chunk_id)
+
+        for signed_row, (similarity, canonical_doc, canonical_chunk) in matches.items():
+            chunks[signed_rows[signed_row]]["metadata"]["duplicate_of"] = {
+                "doc_id": canonical_doc,
+                "chunk_id": canonical_chunk,
+                "similarity": round(similarity, 4)
+            }
+        canonical_rows = np.array([row for row in range(len(signed_rows)) if row not in matches], dtype=np.int64)
+        chunk_ids = np.array([chunks[signed_rows[row]]["metadata"]["chunk_id"] for row in canonical_rows], dtype=np.int32)
+        segment = Segment.build(chunk_ids, signatures[canonical_rows], band_keys[canonical_rows])
+        update = self._build_update(chunked_doc_id, source, document_data, len(chunks), replace, segment)
+
+        document_data["duplicate_chunks"] = len(matches)
+        if mode == "collapse" and matches:
+            document_data["collapsed_chunks"] = [
+                {"chunk_id": chunk["metadata"]["chunk_id"], "duplicate_of": chunk["metadata"]["duplicate_of"]}
+                for chunk in chunks if "duplicate_of" in chunk["metadata"]
+            ]
+            document_data["chunks"] = [chunk for chunk in chunks if "duplicate_of" not in chunk["metadata"]]
+            document_data["total_chunks"] = len(document_data["chunks"])
+        return update
+
+    def commit(self, update) -> dict:
+        """
+        写入 mark_duplicates / resolve_stale 的结果，update 为 None 时不做任何事。
+        update.replace 为真时移除同一 source 的其他分块结果。返回 {已分块文档: {它引用的、已移除的已分块文档}}，
+        这些文档中指向已移除规范 chunk 的重复标记需要用 resolve_stale 重新解析。
+        """
+        if update is None:
+            return {}
+        with self._lock:
+            self._load_entries()
+            referenced_by = []
+            if update.chunked_doc_id in self._entries:
+                referenced_by = self._drop(update.chunked_doc_id)["referenced_by"]
+            dropped = {}
+            if update.replace:
+                for other in self._source_documents(update.source, update.entry["filename"]):
+                    dropped[other] = self._drop(other)
+
+            entry = {
+                **update.entry,
+                "source": update.source,
+                "segment": self._segment_name(update.chunked_doc_id),
+                "references": update.references,
+                "referenced_by": referenced_by
+            }
+            os.makedirs(self.index_dir, exist_ok=True)
+            update.segment.save(os.path.join(self.index_dir, entry["segment"]))
+            self._entries[update.chunked_doc_id] = entry
+            self._add_table(update.chunked_doc_id, update.segment)
+
+            stale = {}
+            for target in update.references:
+                if target in self._entries:
+                    if update.chunked_doc_id not in self._entries[target]["referenced_by"]:
+                        self._entries[target]["referenced_by"].append(update.chunked_doc_id)
+                else:
+                    # 标记之后、写入之前规范 chunk 所在的段已被移除
+                    stale.setdefault(update.chunked_doc_id, set()).add(target)
+            for dropped_id, dropped_entry in dropped.items():
+                for referrer in dropped_entry["referenced_by"]:
+                    if referrer in self._entries:
+                        stale.setdefault(referrer, set()).add(dropped_id)
+            self._save_entries()
+            return stale
+
+    def resolve_stale(self, chunked_doc_id: str, document_data: dict, stale_ids: set):
+        """
+        重新解析 document_data 中指向 stale_ids（已移除的已分块文档）的重复标记：索引中找到新的规范 chunk 时改为指向它，
+        找不到时清除标记，该 chunk 成为本文档的规范 chunk；collapse 模式下已移除的 chunk 用原规范 chunk 的内容恢复。
+        直接修改 document_data，返回交给 commit 的 DedupUpdate；没有需要修改的标记时返回 None。
+        """
+        chunks = document_data.get("chunks", [])
+        collapsed = document_data.get("collapsed_chunks", [])
+        # (标记所在的 chunk 或 collapse 记录, 用于重新查找的文本)
+        targets = [(chunk, chunk["content"]) for chunk in chunks
+                   if chunk["metadata"].get("duplicate_of", {}).get("doc_id") in stale_ids]
+        for record in collapsed:
+            if record["duplicate_of"]["doc_id"] in stale_ids:
+                targets.append((record, self._canonical_chunk(record["duplicate_of"]).get("content")))
+        if not targets:
+            return None
+
+        signed, signatures, band_keys = self._signatures([content or "" for _, content in targets])
+        with self._lock:
+            self._ensure_tables()
+            entry = self._entries.get(chunked_doc_id, {})
+            source = entry.get("source")
+            exclude = self._source_documents(source, document_data.get("filename", "")) | {chunked_doc_id}
+            matches = self._find_canonical(signatures, band_keys, exclude)
+        found = {signed[row]: match for row, match in matches.items()}
+
+        restored = []
+        for i, (target, content) in enumerate(targets):
+            is_record = "content" not in target
+            if i in found:
+                similarity, canonical_doc, canonical_chunk = found[i]
+                pointer = {"doc_id": canonical_doc, "chunk_id": canonical_chunk, "similarity": round(similarity, 4)}
+                if is_record:
+                    target["duplicate_of"] = pointer
+                else:
+                    target["metadata"]["duplicate_of"] = pointer
+            elif not is_record:
+                del target["metadata"]["duplicate_of"]
+            else:
+                collapsed.remove(target)
+                if content is None:
+                    logger.warning(f"{chunked_doc_id} 的 chunk {target['chunk_id']} 已合并且规范 chunk 不可读，无法恢复")
+                    continue
+                canonical = self._canonical_chunk(target["duplicate_of"])
+                restored.append({"content": content, "metadata": {**canonical.get("metadata", {}), "chunk_id": target["chunk_id"]}})
+
+        if restored:
+            chunks.extend(restored)
+            chunks.sort(key=lambda chunk: chunk["metadata"]["chunk_id"])
+            document_data["total_chunks"] = len(chunks)
+        if "collapsed_chunks" in document_data and not collapsed:
+            del document_data["collapsed_chunks"]
+        document_data["duplicate_chunks"] = sum("duplicate_of" in chunk["metadata"] for chunk in chunks) + len(collapsed)
+        return self._build_update(chunked_doc_id, source, document_data, len(chunks) + len(collapsed), replace=False)
+
+    def _canonical_chunk(self, pointer: dict) -> dict:
+        """从磁盘上的已分块文档读取 duplicate_of 指向的 chunk，读不到时返回空字典"""
+        path = os.path.join(self.chunked_dir, pointer["doc_id"])
+        if not os.path.isfile(path):
+            return {}
+        return open_document(path).chunk_by_id(pointer["chunk_id"]) or {}
+
+    def remove_document(self, chunked_doc_id: str) -> dict:
+        """从索引中移除已分块文档，返回值与 commit 相同，不在索引中时为空字典"""
+        with self._lock:
+            self._load_entries()
+            if chunked_doc_id not in self._entries:
+                return {}
+            entry = self._drop(chunked_doc_id)
+            self._save_entries()
+            return {referrer: {chunked_doc_id} for referrer in entry["referenced_by"] if referrer in self._entries}
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._load_entries()
+            return {
+                "documents": len(self._entries),
+                "chunks": sum(entry["total_chunks"] for entry in self._entries.values()),
+                "canonical_chunks": sum(entry["canonical_chunks"] for entry in self._entries.values()),
+                "lookup_tables": len(self._tables) if self._tables is not None else 0
+            }
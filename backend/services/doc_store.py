@@ -0,0 +1,417 @@
+import gzip
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from services.page_map import PageMap
+from services.metrics_service import STAGE_SECONDS
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 文档文件格式：
+#   头记录 {"type": "header", "format": "rag-doc", "version": 1, <文档字段>}，单独压缩为一个成员（帧）；
+#   chunk 每行一条 JSON，每 DOC_BLOCK_CHUNKS 行压缩为一个成员；
+#   尾记录 {"type": "footer", "total_chunks": N, "block_chunks": B, "blocks": [各块起始字节偏移], "fields": {...}}；
+#   最后是定长的结束标记，记录尾记录的起始偏移。gzip 的结束标记是一个带 FEXTRA 字段的空成员，
+#   zstd 的是一个可跳过帧，标准解压工具都会忽略，因此 zcat/zstdcat 得到的仍是完整的 JSONL。
+# 随机读取第 N 个 chunk 只需读头尾记录并解压一个块。
+DOC_FORMAT = "rag-doc"
+DOC_FORMAT_VERSION = 1
+DOC_BLOCK_CHUNKS = int(os.getenv("RAG_DOC_BLOCK_CHUNKS", 64))
+# 新文档的压缩方式：zstd（需要安装 zstandard）或 gzip，默认有 zstandard 时用 zstd
+DOC_CODEC = os.getenv("RAG_DOC_CODEC") or ("zstd" if zstandard is not None else "gzip")
+DOC_ZSTD_LEVEL = int(os.getenv("RAG_DOC_ZSTD_LEVEL", 6))
+DOC_GZIP_LEVEL = int(os.getenv("RAG_DOC_GZIP_LEVEL", 6))
+
+LEGACY_EXTENSION = ".json"
+
+
+class GzipCodec:
+    name = "gzip"
+    extension = ".jsonl.gz"
+    magic = b"\x1f\x8b"
+    trailer_size = 34
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, compresslevel=DOC_GZIP_LEVEL, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+    def open_stream(self, f):
+        return gzip.GzipFile(fileobj=f, mode='rb')
+
+    def trailer(self, footer_offset: int) -> bytes:
+        # 空的 gzip 成员：FLG.FEXTRA 置位，子字段 "RD" 保存尾记录偏移，随后是空的 deflate 数据和 CRC/长度
+        extra = b"RD" + struct.pack("<HQ", 8, footer_offset)
+        return (b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff" + struct.pack("<H", len(extra)) + extra
+                + b"\x03\x00" + struct.pack("<II", 0, 0))
+
+    def read_trailer(self, data: bytes):
+        if len(data) != self.trailer_size or data[:4] != b"\x1f\x8b\x08\x04" or data[12:14] != b"RD":
+            return None
+        return struct.unpack("<Q", data[16:24])[0]
+
+
+class ZstdCodec:
+    name = "zstd"
+    extension = ".jsonl.zst"
+    magic = b"\x28\xb5\x2f\xfd"
+    trailer_size = 16
+    skippable_magic = 0x184D2A5E
+
+    def __init__(self):
+        if zstandard is None:
+            raise RuntimeError("读写 zstd 压缩的文档需要安装 zstandard")
+        self._local = threading.local()
+
+    def _compressor(self):
+        # ZstdCompressor 不能在线程间共享
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=DOC_ZSTD_LEVEL)
+        return compressor
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor().compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    def open_stream(self, f):
+        return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+
+    def trailer(self, footer_offset: int) -> bytes:
+        return struct.pack("<IIQ", self.skippable_magic, 8, footer_offset)
+
+    def read_trailer(self, data: bytes):
+        if len(data) != self.trailer_size:
+            return None
+        magic, size, footer_offset = struct.unpack("<IIQ", data)
+        if magic != self.skippable_magic or size != 8:
+            return None
+        return footer_offset
+
+
+_codecs = {}
+
+
+def get_codec(name: str = None):
+    name = name or DOC_CODEC
+    if name not in ("gzip", "zstd"):
+        raise ValueError(f"不支持的文档压缩方式: {name}")
+    codec = _codecs.get(name)
+    if codec is None:
+        codec = _codecs[name] = GzipCodec() if name == "gzip" else ZstdCodec()
+    return codec
+
+
+def document_extensions() -> tuple:
+    return (GzipCodec.extension, ZstdCodec.extension, LEGACY_EXTENSION)
+
+
+def is_document_file(name: str) -> bool:
+    """是否为 01-loaded-docs / 01-chunked-docs 中的文档文件（新格式或旧的 JSON）"""
+    return name.endswith(document_extensions()) and not name.startswith(".")
+
+
+def document_stem(name: str) -> str:
+    """去掉文档扩展名的文件名"""
+    name = os.path.basename(name)
+    for extension in document_extensions():
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+def document_path(directory: str, stem: str, codec: str = None) -> str:
+    return os.path.join(directory, f"{stem}{get_codec(codec).extension}")
+
+
+def _dumps(record) -> bytes:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode('utf-8') + b"\n"
+
+
+class DocumentStoreWriter:
+    """
+    逐条写入 chunk 的文档写入器。先写同目录下的临时文件，close 时再原子替换，
+    因此读取方不会看到写了一半的文档。每个写入器的临时文件名唯一，
+    并发写同一文档时互不干扰，后完成的替换先完成的。
+    JSON 编码计入 serialize 阶段，压缩和写文件计入 write 阶段，method 为两个阶段的指标标签。
+    """
+
+    def __init__(self, path: str, header: dict, codec: str = None, block_chunks: int = DOC_BLOCK_CHUNKS,
+                 method: str = ""):
+        self.path = path
+        self.codec = get_codec(codec)
+        self.block_chunks = max(1, block_chunks)
+        self.method = method
+        self.total_chunks = 0
+        self.serialize_seconds = 0.0
+        self.write_seconds = 0.0
+        self._blocks = []
+        self._pending = []
+        directory, name = os.path.split(path)
+        os.makedirs(directory or ".", exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or ".")
+        # mkstemp 只给属主读写权限，改回与普通文件相同的权限
+        os.chmod(self._tmp_path, 0o644)
+        self._file = os.fdopen(fd, 'wb')
+        header = {k: v for k, v in header.items() if k != "chunks"}
+        self._write_member(self._dumps({"type": "header", "format": DOC_FORMAT, "version": DOC_FORMAT_VERSION, **header}))
+
+    def _dumps(self, record) -> bytes:
+        start = time.perf_counter()
+        data = _dumps(record)
+        self.serialize_seconds += time.perf_counter() - start
+        return data
+
+    def _write_member(self, data: bytes) -> None:
+        start = time.perf_counter()
+        self._file.write(self.codec.compress(data))
+        self.write_seconds += time.perf_counter() - start
+
+    def _flush_block(self) -> None:
+        if self._pending:
+            self._blocks.append(self._file.tell())
+            self._write_member(b"".join(self._pending))
+            self._pending = []
+
+    def write_chunk(self, chunk: dict) -> None:
+        self._pending.append(self._dumps(chunk))
+        self.total_chunks += 1
+        if len(self._pending) >= self.block_chunks:
+            self._flush_block()
+
+    def close(self, **fields) -> int:
+        """写入尾记录并替换目标文件，fields 为写入头记录时还不知道的文档字段。返回文件字节数"""
+        self._flush_block()
+        footer_offset = self._file.tell()
+        self._write_member(self._dumps({
+            "type": "footer",
+            "total_chunks": self.total_chunks,
+            "block_chunks": self.block_chunks,
+            "blocks": self._blocks,
+            "fields": {"total_chunks": self.total_chunks, **fields}
+        }))
+        start = time.perf_counter()
+        self._file.write(self.codec.trailer(footer_offset))
+        size = self._file.tell()
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        self.write_seconds += time.perf_counter() - start
+        STAGE_SECONDS.observe(self.serialize_seconds, stage="serialize", method=self.method)
+        STAGE_SECONDS.observe(self.write_seconds, stage="write", method=self.method)
+        return size
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+
+def write_document(path: str, document_data: dict, codec: str = None, method: str = "") -> int:
+    """一次写入完整的文档数据（含 chunks），返回文件字节数。method 为 serialize/write 阶段耗时的指标标签"""
+    writer = DocumentStoreWriter(path, document_data, codec, method=method)
+    try:
+        for chunk in document_data.get("chunks", []):
+            writer.write_chunk(chunk)
+        return writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+
+class StoredDocument:
+    """
+    已保存文档的只读视图。新格式只读取头尾记录，chunk 按块解压，支持随机读取和逐条遍历；
+    旧的 JSON 文档和缺少结束标记的文件整份读入内存后提供相同的接口。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.codec = None
+        self._chunks = None        # 整份读入时的 chunk 列表
+        self._blocks = []
+        self._block_chunks = 1
+        self._footer_offset = 0
+        self._total_chunks = 0
+        self._cached_block = (None, None)
+        self._by_id = None
+        self.metadata = {}
+
+        with open(path, 'rb') as f:
+            magic = f.read(4)
+            if magic.startswith(GzipCodec.magic):
+                self.codec = get_codec("gzip")
+            elif magic == ZstdCodec.magic:
+                self.codec = get_codec("zstd")
+            if self.codec is None:
+                f.seek(0)
+                self._load_legacy(json.load(f))
+            elif not self._read_index(f):
+                f.seek(0)
+                self._scan(f)
+
+    def _load_legacy(self, doc_data: dict) -> None:
+        self._chunks = doc_data.pop("chunks", [])
+        self._total_chunks = len(self._chunks)
+        self.metadata = doc_data
+
+    def _read_index(self, f) -> bool:
+        """读取结束标记、尾记录和头记录，文件不完整时返回 False"""
+        size = f.seek(0, os.SEEK_END)
+        if size < self.codec.trailer_size:
+            return False
+        f.seek(size - self.codec.trailer_size)
+        footer_offset = self.codec.read_trailer(f.read(self.codec.trailer_size))
+        if footer_offset is None or footer_offset >= size:
+            return False
+        f.seek(footer_offset)
+        footer = json.loads(self.codec.decompress(f.read(size - self.codec.trailer_size - footer_offset)))
+        header_end = footer["blocks"][0] if footer["blocks"] else footer_offset
+        f.seek(0)
+        header = json.loads(self.codec.decompress(f.read(header_end)))
+
+        self._blocks = footer["blocks"]
+        self._block_chunks = footer["block_chunks"]
+        self._footer_offset = footer_offset
+        self._total_chunks = footer["total_chunks"]
+        self.metadata = self._merge(header, footer)
+        return True
+
+    @staticmethod
+    def _merge(header: dict, footer: dict) -> dict:
+        metadata = {k: v for k, v in header.items() if k not in ("type", "format", "version")}
+        metadata.update(footer.get("fields", {}))
+        return metadata
+
+    def _scan(self, f) -> None:
+        """顺序解压整个文件（没有有效结束标记时使用）"""
+        header, footer, chunks = {}, {}, []
+        with self.codec.open_stream(f) as stream:
+            for line in stream.read().decode('utf-8').splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get("type") == "header" and not header and not chunks:
+                    header = record
+                elif record.get("type") == "footer":
+                    footer = record
+                else:
+                    chunks.append(record)
+        self._chunks = chunks
+        self._total_chunks = len(chunks)
+        self.metadata = self._merge(header, footer)
+        self.metadata["total_chunks"] = len(chunks)
+
+    def __len__(self) -> int:
+        return self._total_chunks
+
+    def _read_block(self, index: int) -> list:
+        cached_index, cached_chunks = self._cached_block
+        if cached_index == index:
+            return cached_chunks
+        start = self._blocks[index]
+        end = self._blocks[index + 1] if index + 1 < len(self._blocks) else self._footer_offset
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            data = self.codec.decompress(f.read(end - start))
+        chunks = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        self._cached_block = (index, chunks)
+        return chunks
+
+    def chunk(self, i: int) -> dict:
+        """第 i 个 chunk（从0开始）"""
+        if i < 0:
+            i += self._total_chunks
+        if not 0 <= i < self._total_chunks:
+            raise IndexError(f"chunk 下标超出范围: {i}")
+        if self._chunks is not None:
+            return self._chunks[i]
+        return self._read_block(i // self._block_chunks)[i % self._block_chunks]
+
+    def chunk_by_id(self, chunk_id: int) -> dict:
+        """按 metadata.chunk_id 查找 chunk。chunk_id 通常等于位置加一，不等时才建立完整的映射"""
+        if 0 < chunk_id <= self._total_chunks:
+            chunk = self.chunk(chunk_id - 1)
+            if chunk.get("metadata", {}).get("chunk_id") == chunk_id:
+                return chunk
+        if self._by_id is None:
+            self._by_id = {chunk["metadata"]["chunk_id"]: i for i, chunk in enumerate(self.iter_chunks())}
+        i = self._by_id.get(chunk_id)
+        return self.chunk(i) if i is not None else None
+
+    def iter_chunks(self, start: int = 0, stop: int = None):
+        """按顺序逐条产出 [start, stop) 范围内的 chunk，每次只解压一个块"""
+        stop = self._total_chunks if stop is None else min(stop, self._total_chunks)
+        if self._chunks is not None:
+            yield from self._chunks[start:stop]
+            return
+        i = max(0, start)
+        while i < stop:
+            block = self._read_block(i // self._block_chunks)
+            offset = i % self._block_chunks
+            for chunk in block[offset:offset + stop - i]:
+                yield chunk
+            i += len(block) - offset
+
+    def page_chunks(self, page_number: int) -> list:
+        """
+        覆盖第 page_number 页的全部 chunk。chunk 按起始页有序，
+        先二分查找第一个起始页不小于该页的 chunk，只解压用到的块。
+        """
+        lo, hi = 0, self._total_chunks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _first_page(self.chunk(mid)) < page_number:
+                lo = mid + 1
+            else:
+                hi = mid
+        # 起始页更早、但页码范围延续到该页的 chunk（跨页或重叠的分块）
+        start = lo
+        while start > 0 and _last_page(self.chunk(start - 1)) >= page_number:
+            start -= 1
+        chunks = [self.chunk(i) for i in range(start, lo)]
+        for chunk in self.iter_chunks(lo):
+            if _first_page(chunk) != page_number:
+                break
+            chunks.append(chunk)
+        return chunks
+
+    def page_map(self) -> PageMap:
+        """已加载文档（每页一个 chunk）的页面映射，分块和解析可以直接使用，不必重新提取 PDF"""
+        page_numbers = []
+        texts = []
+        for chunk in self.iter_chunks():
+            page_numbers.append(chunk['metadata']['page_number'])
+            texts.append(chunk['content'])
+        return PageMap.from_texts(texts, page_numbers)
+
+    def to_dict(self) -> dict:
+        """与旧格式相同的完整文档数据 {..., "chunks": [...]}"""
+        return {**self.metadata, "chunks": list(self.iter_chunks())}
+
+
+def _first_page(chunk: dict) -> int:
+    return chunk.get("metadata", {}).get("page_number") or 0
+
+
+def _last_page(chunk: dict) -> int:
+    """page_range 为 "3" 或 "3-5"，缺少时按起始页计"""
+    page_range = str(chunk.get("metadata", {}).get("page_range") or "")
+    last = page_range.rsplit("-", 1)[-1]
+    return int(last) if last.isdigit() else _first_page(chunk)
+
+
+def open_document(path: str) -> StoredDocument:
+    return StoredDocument(path)
+
+
+def read_document(path: str) -> dict:
+    return StoredDocument(path).to_dict()
@@ -0,0 +1,248 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from datetime import datetime
+import numpy as np
+from services.text_tokenizer import tokenize
+from services.doc_store import open_document, document_stem
+
+logger = logging.getLogger(__name__)
+
+EMBEDDED_DOCS_DIR = "02-embedded-docs"
+DEFAULT_EMBEDDER = os.getenv("RAG_EMBEDDER", "hashing")
+DEFAULT_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", 256))
+
+
+class HashingEmbedder:
+    """
+    离线哈希向量：把分词结果用 CRC32 映射到固定维度并带符号累加（feature hashing），
+    词频取 log1p 后做 L2 归一化。不需要训练和网络，结果在不同进程间稳定。
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self._token_cache = {}
+
+    def _hash_token(self, token: str):
+        cached = self._token_cache.get(token)
+        if cached is None:
+            h = zlib.crc32(token.encode('utf-8'))
+            cached = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+            if len(self._token_cache) < 1_000_000:
+                self._token_cache[token] = cached
+        return cached
+
+    def embed(self, texts: list) -> np.ndarray:
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                col, sign = self._hash_token(token)
+                rows.append(row)
+                cols.append(col)
+                signs.append(sign)
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(vectors, (np.asarray(rows), np.asarray(cols)), np.asarray(signs, dtype=np.float32))
+        # 次线性词频，抑制模板化文本中高频词的权重
+        np.copysign(np.log1p(np.abs(vectors)), vectors, out=vectors)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class SentenceTransformerEmbedder:
+    """本地 sentence-transformers 模型，模型路径或名称由 RAG_EMBED_MODEL 指定"""
+
+    name = "sentence_transformers"
+
+    def __init__(self, model_name: str = None):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name or os.getenv("RAG_EMBED_MODEL", "BAAI/bge-small-zh-v1.5"))
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list) -> np.ndarray:
+        vectors = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+EMBEDDERS = {
+    HashingEmbedder.name: HashingEmbedder,
+    SentenceTransformerEmbedder.name: SentenceTransformerEmbedder,
+}
+
+_embedder_instances = {}
+
+
+def get_embedder(name: str = DEFAULT_EMBEDDER):
+    """按名称获取嵌入器实例，同一进程内复用"""
+    if name not in EMBEDDERS:
+        raise ValueError(f"Unsupported embedder: {name}")
+    if name not in _embedder_instances:
+        _embedder_instances[name] = EMBEDDERS[name]()
+    return _embedder_instances[name]
+
+
+def content_hash(text: str) -> int:
+    """chunk 内容的 64 位哈希，用于在新旧版本之间复用向量"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class StaleEmbeddingError(Exception):
+    """向量文件与其 chunk_id、内容哈希文件不是同一次写入的结果（正在写入或写入中断）"""
+
+
+def load_embedding(base_path: str):
+    """
+    读取一份向量化结果，返回 (向量矩阵, chunk_id 数组, 内容哈希数组)，向量矩阵为只读内存映射。
+    写入时先替换 .ids.npy、.hashes.npy 和 .json，最后替换 .npy 并把它的修改时间更新为当前时间，
+    因此旁路文件比向量文件新、读取期间向量文件被替换或行数不一致时抛出 StaleEmbeddingError。
+    """
+    vectors_path = f"{base_path}.npy"
+    before = os.stat(vectors_path)
+    chunk_ids = np.load(f"{base_path}.ids.npy")
+    hashes = np.load(f"{base_path}.hashes.npy")
+    sidecar_mtime = max(os.stat(f"{base_path}{suffix}").st_mtime_ns for suffix in (".ids.npy", ".hashes.npy", ".json"))
+    vectors = np.load(vectors_path, mmap_mode='r')
+    after = os.stat(vectors_path)
+    if ((before.st_ino, before.st_mtime_ns) != (after.st_ino, after.st_mtime_ns)
+            or sidecar_mtime > after.st_mtime_ns
+            or not len(vectors) == len(chunk_ids) == len(hashes)):
+        raise StaleEmbeddingError(f"向量文件与 chunk_id 不一致: {vectors_path}")
+    return vectors, chunk_ids, hashes
+
+
+class EmbedService:
+    """
+    对已分块文档做向量化，向量按行写入 float32 的 .npy 文件（内存映射写入），
+    另存 chunk_id 数组 (.ids.npy)、chunk 内容哈希 (.hashes.npy) 和一个小的描述文件 (.json)。
+    同一 PDF 以相同分块方法和嵌入器向量化过的旧版本中，内容相同的 chunk 直接复用向量。
+    标记了 duplicate_of 的近重复 chunk 不做向量化，检索时由其规范 chunk 代表。
+    """
+
+    def _find_previous(self, doc_data: dict, source: str, model):
+        """返回 (旧向量矩阵, 内容哈希 -> 行号)，没有可复用的旧版本时返回 (None, {})"""
+        candidates = []
+        for info_path in glob.glob(os.path.join(EMBEDDED_DOCS_DIR, f"*_{model.name}.json")):
+            with open(info_path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            base_path = info_path[:-len(".json")]
+            if (info.get("source") != source
+                    and info.get("filename") == doc_data.get("filename")
+                    and info.get("chunking_method") == doc_data.get("chunking_method")
+                    and info.get("dim") == model.dim
+                    and os.path.exists(f"{base_path}.hashes.npy")):
+                candidates.append((info.get("timestamp", ""), base_path))
+        if not candidates:
+            return None, {}
+        _, base_path = max(candidates)
+        try:
+            vectors, _, hashes = load_embedding(base_path)
+        except StaleEmbeddingError as e:
+            logger.warning(f"{str(e)}，不复用旧向量")
+            return None, {}
+        return vectors, {int(h): row for row, h in enumerate(hashes)}
+
+    def embed_document(self, chunked_path: str, embedder: str = DEFAULT_EMBEDDER,
+                       batch_size: int = DEFAULT_BATCH_SIZE, progress=None) -> dict:
+        try:
+            chunked_doc = open_document(chunked_path)
+            model = get_embedder(embedder)
+
+            # 向量矩阵的第 i 行对应文档中第 positions[i] 个 chunk
+            positions, chunk_ids, hashes = [], [], []
+            for position, chunk in enumerate(chunked_doc.iter_chunks()):
+                if "duplicate_of" in chunk["metadata"]:
+                    continue
+                positions.append(position)
+                chunk_ids.append(chunk["metadata"]["chunk_id"])
+                hashes.append(content_hash(chunk["content"]))
+            chunk_ids = np.array(chunk_ids, dtype=np.int32)
+            hashes = np.array(hashes, dtype=np.uint64)
+
+            stem = document_stem(chunked_path)
+            base_path = os.path.join(EMBEDDED_DOCS_DIR, f"{stem}_{model.name}")
+            os.makedirs(EMBEDDED_DOCS_DIR, exist_ok=True)
+
+            # 先写临时文件，全部完成后再替换，避免检索读到写了一半的矩阵。
+            # 临时文件名按写入器唯一（隐藏文件，检索时不会列出），同一文档并发向量化时互不覆盖
+            fd, vectors_tmp = tempfile.mkstemp(prefix=f".{os.path.basename(base_path)}.", suffix=".tmp.npy",
+                                               dir=EMBEDDED_DOCS_DIR)
+            os.close(fd)
+            tmp_base = vectors_tmp[:-len(".npy")]
+            try:
+                return self._write_embedding(chunked_doc, chunked_path, model, positions, chunk_ids, hashes,
+                                             base_path, tmp_base, batch_size, progress)
+            except BaseException:
+                for path in (vectors_tmp, f"{tmp_base}.ids.npy", f"{tmp_base}.hashes.npy", f"{tmp_base}.json"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+        except Exception as e:
+            logger.error(f"向量化失败: {str(e)}")
+            raise
+
+    def _write_embedding(self, chunked_doc, chunked_path, model, positions, chunk_ids, hashes,
+                         base_path, tmp_base, batch_size, progress) -> dict:
+        """写入 tmp_base 开头的临时文件，再按旁路文件在前、向量文件在后的顺序发布到 base_path"""
+        doc_data = chunked_doc.metadata
+        vectors_tmp = f"{tmp_base}.npy"
+        total = len(positions)
+        if total:
+            vectors = np.lib.format.open_memmap(vectors_tmp, mode='w+', dtype=np.float32, shape=(total, model.dim))
+        else:
+            # 空矩阵无法内存映射，直接写空数组
+            vectors = np.empty((0, model.dim), dtype=np.float32)
+            np.save(vectors_tmp, vectors)
+
+        # 先复制旧版本中内容未变的 chunk 的向量，只对其余 chunk 调用嵌入模型
+        previous_vectors, previous_rows = self._find_previous(doc_data, os.path.basename(chunked_path), model)
+        pending = []
+        for row, h in enumerate(hashes):
+            previous_row = previous_rows.get(int(h))
+            if previous_row is not None:
+                vectors[row] = previous_vectors[previous_row]
+            else:
+                pending.append(row)
+        reused = total - len(pending)
+        del previous_vectors
+
+        if progress is not None:
+            progress(reused, total)
+        for start in range(0, len(pending), batch_size):
+            rows = pending[start:start + batch_size]
+            vectors[rows] = model.embed([chunked_doc.chunk(positions[row])["content"] for row in rows])
+            if progress is not None:
+                progress(reused + start + len(rows), total)
+        if total:
+            vectors.flush()
+        del vectors
+
+        info = {
+            "source": os.path.basename(chunked_path),
+            "filename": doc_data.get("filename", ""),
+            "chunking_method": doc_data.get("chunking_method", ""),
+            "embedder": model.name,
+            "dim": int(model.dim),
+            "total_vectors": total,
+            "skipped_duplicates": len(chunked_doc) - total,
+            "timestamp": datetime.now().isoformat()
+        }
+        # 旁路文件也先写临时文件，全部替换完后最后发布向量文件，读取方据此判断各文件是否一致
+        np.save(f"{tmp_base}.ids.npy", chunk_ids)
+        np.save(f"{tmp_base}.hashes.npy", hashes)
+        with open(f"{tmp_base}.json", 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        os.replace(f"{tmp_base}.ids.npy", f"{base_path}.ids.npy")
+        os.replace(f"{tmp_base}.hashes.npy", f"{base_path}.hashes.npy")
+        os.replace(f"{tmp_base}.json", f"{base_path}.json")
+        os.replace(vectors_tmp, f"{base_path}.npy")
+        os.utime(f"{base_path}.npy")
+
+        return {**info, "filepath": f"{base_path}.npy", "reused_vectors": reused}
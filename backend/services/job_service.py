@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 同时执行的加载/解析/分块任务数
+JOB_MAX_WORKERS = int(os.getenv("RAG_JOB_MAX_WORKERS", 4))
+# 内存中最多保留的已结束任务数
+JOB_MAX_FINISHED = int(os.getenv("RAG_JOB_MAX_FINISHED", 200))
+# 长轮询最长等待秒数
+JOB_MAX_WAIT = 30
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "pending"
+        self.done_pages = 0
+        self.total_pages = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self._finished = threading.Event()
+
+    def update_progress(self, done: int, total: int):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"任务 {self.job_id} 已取消")
+        self.done_pages = done
+        self.total_pages = total
+
+    def is_finished(self) -> bool:
+        return self._finished.is_set()
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": {"done": self.done_pages, "total": self.total_pages},
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.status == "succeeded":
+            data["result"] = self.result
+        return data
+
+
+class JobService:
+    """
+    在有界线程池中执行阻塞的 PDF 处理任务，避免占用事件循环。
+    提交后立即返回 Job，调用方通过 get/wait 查询进度和结果。
+    """
+
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS, max_finished: int = JOB_MAX_FINISHED):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-job")
+        self.max_finished = max_finished
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn, *args, **kwargs) -> Job:
+        """提交任务，fn 会收到关键字参数 progress=job.update_progress"""
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        job.future = self.executor.submit(self._execute, job, fn, args, kwargs)
+        return job
+
+    async def run(self, fn, *args, **kwargs):
+        """在同一个有界线程池中执行 fn 并等待结果，供同步接口使用"""
+        return await asyncio.wrap_future(self.executor.submit(fn, *args, **kwargs))
+
+    def _execute(self, job: Job, fn, args, kwargs):
+        if job.cancel_event.is_set():
+            self._finish(job, "cancelled")
+            return
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args, progress=job.update_progress, **kwargs)
+            self._finish(job, "succeeded")
+        except JobCancelled:
+            self._finish(job, "cancelled")
+        except Exception as e:
+            logger.error(f"任务 {job.job_id} 执行失败: {str(e)}")
+            job.error = getattr(e, "detail", None) or str(e)
+            self._finish(job, "failed")
+
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        job._finished.set()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished()]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, timeout: float) -> Job:
+        """长轮询：等待任务结束或超时"""
+        deadline = time.monotonic() + min(timeout, JOB_MAX_WAIT)
+        while not job.is_finished() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        return job
+
+    def cancel(self, job_id: str) -> Job:
+        """取消任务：未开始的直接取消，运行中的在下一次进度回报时中止"""
+        job = self.get(job_id)
+        if job is None or job.is_finished():
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, "cancelled")
+        return job
@@ -1,187 +1,732 @@
 from pypdf import PdfReader
-from unstructured.partition.pdf import partition_pdf
 import pdfplumber
 import fitz  # PyMuPDF
+import hashlib
 import logging
 import os
+import re
 from datetime import datetime
-import json
 from pdfminer.high_level import extract_pages
 from pdfminer.layout import LTTextContainer
-import PyPDF2
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple
+from services.cache_service import ExtractionCache, hash_file
+from services.manifest_service import ManifestService
+from services.page_map import PageMap
+from services.doc_store import DocumentStoreWriter, document_path, open_document, write_document
+from services.metrics_service import STAGE_SECONDS, PAGES_PROCESSED, BYTES_PROCESSED
 
 logger = logging.getLogger(__name__)
 
+# 并行提取进程池的最大进程数
+MAX_LOAD_WORKERS = int(os.getenv("RAG_LOAD_MAX_WORKERS", os.cpu_count() or 1))
+# 每个子进程至少分到的页数，页数太少时并行的开销大于收益
+MIN_PAGES_PER_WORKER = int(os.getenv("RAG_LOAD_MIN_PAGES_PER_WORKER", 8))
+# 提取进程池的启动方式，默认 forkserver，避免从多线程的服务进程直接 fork
+LOAD_START_METHOD = os.getenv("RAG_LOAD_START_METHOD", "forkserver")
+
+# 逐页独立提取的加载方法，支持并行和增量提取
+PAGE_METHODS = ("pymupdf", "pypdf", "pdfplumber", "pdfminer")
+
+# auto 方法：先用 pymupdf 提取全部页，未通过质量检查的页再用较慢但更准确的方法重新提取
+AUTO_PRIMARY_METHOD = "pymupdf"
+AUTO_FALLBACK_METHOD = os.getenv("RAG_AUTO_FALLBACK_METHOD", "pdfplumber")
+# 内容流小于该字节数的页视为空白页，不要求有文本
+AUTO_MIN_CONTENT_BYTES = int(os.getenv("RAG_AUTO_MIN_CONTENT_BYTES", 200))
+# 每万平方磅页面面积至少应提取到的可见字符数（A4 约 50 万平方磅）
+AUTO_MIN_CHARS_PER_AREA = float(os.getenv("RAG_AUTO_MIN_CHARS_PER_AREA", 0.5))
+# 乱码字符占可见字符的比例上限
+AUTO_MAX_GARBLED_RATIO = float(os.getenv("RAG_AUTO_MAX_GARBLED_RATIO", 0.1))
+
+# 替换字符、私用区、代理项和控制字符，通常来自缺失 ToUnicode 映射的字体
+GARBLED_CHARS = re.compile(r'[\ufffd\ue000-\uf8ff\ud800-\udfff\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# unstructured 支持的分区策略，未指定时使用 fast
+UNSTRUCTURED_STRATEGIES = ("fast", "hi_res", "ocr_only", "auto")
+# 单个文档分区的超时时间（秒），超时后终止子进程
+UNSTRUCTURED_TIMEOUT = float(os.getenv("RAG_UNSTRUCTURED_TIMEOUT", 600))
+# 分区子进程的启动方式。forkserver 预先导入 unstructured，避免每次启动子进程都重新导入，
+# 也避免从多线程的服务进程直接 fork
+UNSTRUCTURED_START_METHOD = os.getenv("RAG_UNSTRUCTURED_START_METHOD", "forkserver")
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+_unstructured_context = None
+
+
+def _get_process_pool():
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=MAX_LOAD_WORKERS,
+                mp_context=multiprocessing.get_context(LOAD_START_METHOD)
+            )
+        return _process_pool
+
+
+def _reset_process_pool(pool):
+    """丢弃已损坏的进程池（子进程被 OOM 或信号杀死后整个池都不可再用），下次使用时重新创建"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_in_pool(method, pdf_path, ranges):
+    """
+    在进程池中提取各页范围，按顺序产出 (start, end, 文本列表)。
+    有子进程异常退出时重建进程池，把尚未完成的页范围重新提交一次，再次失败则抛出。
+    """
+    pending = list(ranges)
+    for attempt in range(2):
+        pool = _get_process_pool()
+        futures = []
+        try:
+            futures = [pool.submit(_extract_page_range, method, pdf_path, start, end) for start, end in pending]
+            for future, (start, end) in zip(futures, list(pending)):
+                texts = future.result()
+                pending.pop(0)
+                yield start, end, texts
+            return
+        except BrokenProcessPool:
+            _reset_process_pool(pool)
+            if attempt:
+                raise
+            logger.warning(f"提取子进程异常退出，重建进程池后重试剩余 {len(pending)} 个页范围")
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def _resolve_workers(workers, total_pages):
+    """根据请求的进程数、进程池上限和总页数确定实际使用的进程数"""
+    if not workers or workers <= 1:
+        return 1
+    max_by_pages = max(1, total_pages // MIN_PAGES_PER_WORKER)
+    return max(1, min(workers, MAX_LOAD_WORKERS, max_by_pages))
+
+
+def _split_page_range(total_pages, parts):
+    """把 [0, total_pages) 均匀拆分为 parts 个连续区间"""
+    size, rest = divmod(total_pages, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = start + size + (1 if i < rest else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _count_pages(method, pdf_path):
+    if method == "pymupdf":
+        with fitz.open(pdf_path) as doc:
+            return len(doc)
+    elif method == "pdfplumber":
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    else:
+        return len(PdfReader(pdf_path).pages)
+
+
+def _extract_page_range(method, pdf_path, start, end):
+    """
+    提取 [start, end) 页（从0开始）的文本，返回按页序排列的文本列表。
+    作为进程池任务运行，因此定义在模块级别并在函数内自行打开PDF。
+    """
+    return list(_iter_page_range(method, pdf_path, start, end))
+
+
+def _iter_page_range(method, pdf_path, start, end):
+    """逐页提取 [start, end) 页的文本，每提取完一页就产出一页"""
+    if method == "pymupdf":
+        with fitz.open(pdf_path) as doc:
+            for i in range(start, end):
+                yield doc[i].get_text().strip()
+    elif method == "pypdf":
+        reader = PdfReader(pdf_path)
+        for i in range(start, end):
+            yield reader.pages[i].extract_text().strip()
+    elif method == "pdfplumber":
+        with pdfplumber.open(pdf_path) as pdf:
+            for i in range(start, end):
+                yield (pdf.pages[i].extract_text() or "").strip()
+    elif method == "pdfminer":
+        for page_layout in extract_pages(pdf_path, page_numbers=range(start, end)):
+            page_text = [element.get_text() for element in page_layout if isinstance(element, LTTextContainer)]
+            yield " ".join(page_text).strip()
+    else:
+        raise ValueError(f"未识别的方法: {method}")
+
+
+# 间接引用 "12 0 R"；/Parent 和注释的 /P 指回页面树，不计入指纹
+_PDF_REFERENCE = re.compile(r'(\d+) (\d+) R\b')
+_PDF_BACK_REFERENCE = re.compile(r'/(?:Parent|P)\s*\d+ \d+ R\b')
+_PDF_PAGE_TYPE = re.compile(r'/Type\s*/Page\b(?!s)')
+# 可从上级页面树节点继承的页面属性
+_INHERITED_PAGE_KEYS = ("Resources", "MediaBox", "CropBox", "Rotate")
+
+
+def _expand_references(doc, source, digests):
+    """把对象源码中的间接引用替换为被引用对象的摘要，去掉指回页面树的引用"""
+    def resolve(match):
+        target = int(match.group(1))
+        if not 0 < target < doc.xref_length():
+            return match.group(0)
+        return _xref_digest(doc, target, digests)
+    return _PDF_REFERENCE.sub(resolve, _PDF_BACK_REFERENCE.sub("", source))
+
+
+def _xref_digest(doc, xref, digests):
+    """
+    对象及其引用到的全部对象（内容流、Form XObject、图片、字体等）的摘要，按 xref 缓存，
+    同一文档中共享的字体和图片只读取一次。引用到其他页面对象时只记为页面，不展开整棵页面树。
+    """
+    digest = digests.get(xref)
+    if digest is not None:
+        return digest
+    # 先占位，循环引用时使用占位值
+    digests[xref] = f"cycle:{xref}"
+    source = doc.xref_object(xref, compressed=True)
+    if _PDF_PAGE_TYPE.search(source):
+        digest = "page"
+    else:
+        sha256 = hashlib.sha256(_expand_references(doc, source, digests).encode('utf-8'))
+        if doc.xref_is_stream(xref):
+            sha256.update(doc.xref_stream_raw(xref) or b"")
+        digest = sha256.hexdigest()[:32]
+    digests[xref] = digest
+    return digest
+
+
+def _page_digest(doc, page, digests):
+    """单页指纹：页面对象本身的属性加上从上级节点继承的属性，引用的对象全部展开为摘要"""
+    source = doc.xref_object(page.xref, compressed=True)
+    for key in _INHERITED_PAGE_KEYS:
+        kind, value = doc.xref_get_key(page.xref, key)
+        node = page.xref
+        while kind == "null":
+            parent_kind, parent = doc.xref_get_key(node, "Parent")
+            if parent_kind != "xref":
+                break
+            node = int(parent.split()[0])
+            kind, value = doc.xref_get_key(node, key)
+            if kind != "null":
+                source += f"/{key} {value}"
+    sha256 = hashlib.sha256(repr((tuple(page.rect), page.rotation)).encode('utf-8'))
+    sha256.update(_expand_references(doc, source, digests).encode('utf-8'))
+    return sha256.hexdigest()[:32]
+
+
+def page_fingerprints(pdf_path):
+    """
+    每页原始内容的指纹：页面尺寸、旋转，以及内容流和资源（含继承的资源、Form XObject、图片、字体）
+    递归展开后的 SHA-256。只读取 PDF 结构而不提取文本，用来判断新旧版本中哪些页没有变化。
+    """
+    with fitz.open(pdf_path) as doc:
+        digests = {}
+        return [_page_digest(doc, page, digests) for page in doc]
+
+
+def _page_layout_stats(pdf_path):
+    """每页的 (面积, 内容流字节数)，用于判断提取到的文本是否过少"""
+    with fitz.open(pdf_path) as doc:
+        return [(page.rect.width * page.rect.height, len(page.read_contents())) for page in doc]
+
+
+def page_text_problem(text, page_area, content_bytes):
+    """
+    检查一页提取结果的质量，合格时返回 None，否则返回原因：
+    empty（有内容却没有文本）、garbled（乱码比例过高）、sparse（相对页面面积文本过少）。
+    """
+    if content_bytes < AUTO_MIN_CONTENT_BYTES:
+        return None
+    visible = len("".join(text.split()))
+    if visible <= 0:
+        return "empty"
+    if len(GARBLED_CHARS.findall(text)) > visible * AUTO_MAX_GARBLED_RATIO:
+        return "garbled"
+    if visible < page_area / 10000 * AUTO_MIN_CHARS_PER_AREA:
+        return "sparse"
+    return None
+
+
+def _valid_chars(text):
+    return len("".join(text.split())) - len(GARBLED_CHARS.findall(text))
+
+
+def _get_unstructured_context():
+    global _unstructured_context
+    if _unstructured_context is None:
+        _unstructured_context = multiprocessing.get_context(UNSTRUCTURED_START_METHOD)
+        if UNSTRUCTURED_START_METHOD == "forkserver":
+            _unstructured_context.set_forkserver_preload(["unstructured.partition.pdf"])
+    return _unstructured_context
+
+
+def _partition_to_pages(pdf_path, strategy, chunking_strategy=None, chunking_options=None):
+    """
+    用 unstructured 分区并按页分组，返回 {页码: {"text": ..., "elements": [...]}}。
+    在子进程中运行，只返回可序列化的基本类型。
+    elements 按顺序记录每个元素的类型及其在页文本中的 [start, end) 偏移。
+    """
+    from unstructured.partition.pdf import partition_pdf
+
+    kwargs = {
+        "filename": pdf_path,
+        "strategy": strategy,
+        "infer_table_structure": strategy == "hi_res",
+    }
+    if chunking_strategy:
+        kwargs["chunking_strategy"] = chunking_strategy
+        kwargs.update(chunking_options or {})
+
+    pages = {}
+    for element in partition_pdf(**kwargs):
+        text = (element.text or "").strip()
+        if not text:
+            continue
+        page_number = getattr(element.metadata, "page_number", None) or 1
+        page = pages.get(page_number)
+        if page is None:
+            page = pages[page_number] = {"parts": [], "elements": [], "length": 0}
+        elif page["parts"]:
+            page["length"] += 1  # 元素之间的换行
+        start = page["length"]
+        page["parts"].append(text)
+        page["length"] += len(text)
+        page["elements"].append({"type": element.category, "start": start, "end": page["length"]})
+
+    return {
+        page_number: {"text": "\n".join(page["parts"]), "elements": page["elements"]}
+        for page_number, page in pages.items()
+    }
+
+
+def _partition_worker(conn, *args):
+    try:
+        conn.send(("ok", _partition_to_pages(*args)))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+    finally:
+        conn.close()
+
+
+def _group_runs(indices):
+    """把升序的页下标合并为连续区间 [(start, end), ...]"""
+    runs = []
+    for i in indices:
+        if runs and runs[-1][1] == i:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return [tuple(run) for run in runs]
+
+
+def _document_name(filename, loading_method, strategy=None, chunking_strategy=None):
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    base_name = filename.replace('.pdf', '').split('_')[0]
+
+    # Adjust the document name to include strategy if unstructured
+    if loading_method == "unstructured" and strategy:
+        return f"{base_name}_{loading_method}_{strategy}_{chunking_strategy}_{timestamp}"
+    return f"{base_name}_{loading_method}_{timestamp}"
+
+
+class DocumentWriter:
+    """
+    增量写入已加载文档。文件格式与 save_document 相同，
+    只是 chunks 逐条追加，total_chunks/total_pages 在关闭时写入尾记录。
+    """
+
+    def __init__(self, filename: str, loading_method: str, strategy: str = None, chunking_strategy: str = None,
+                 manifest: ManifestService = None):
+        doc_name = _document_name(filename, loading_method, strategy, chunking_strategy)
+        self.filepath = document_path("01-loaded-docs", doc_name)
+        self.manifest = manifest
+
+        self.header = header = {
+            "filename": str(filename),
+            "loading_method": str(loading_method),
+            "loading_strategy": str(strategy) if loading_method == "unstructured" and strategy else None,
+            "chunking_strategy": str(chunking_strategy) if loading_method == "unstructured" and chunking_strategy else None,
+            "chunking_method": "loaded",
+            "timestamp": datetime.now().isoformat(),
+        }
+        self._writer = DocumentStoreWriter(self.filepath, header, method=loading_method)
+
+    @property
+    def total_chunks(self) -> int:
+        return self._writer.total_chunks
+
+    def write_chunk(self, chunk: dict):
+        self._writer.write_chunk(chunk)
+
+    def close(self, total_pages: int) -> str:
+        size = self._writer.close(total_pages=int(total_pages))
+        BYTES_PROCESSED.inc(size, stage="write", method=self.header["loading_method"])
+        if self.manifest is not None:
+            self.manifest.record("loaded", self.filepath, {
+                **self.header,
+                "total_chunks": self.total_chunks,
+                "total_pages": int(total_pages)
+            })
+        return self.filepath
+
+    def abort(self):
+        """出错时关闭并删除写了一半的文件"""
+        self._writer.abort()
+
+
+class LoadResult(NamedTuple):
+    """一次加载的结果：页面、提取统计信息和提示消息"""
+    page_map: PageMap
+    stats: dict
+    message: str
+
+
+def _new_stats():
+    return {"workers": 1, "elapsed": 0.0, "cache_hit": False}
+
+
+def _record_extraction(method, pdf_path, elapsed, pages):
+    STAGE_SECONDS.observe(elapsed, stage="extract", method=method)
+    PAGES_PROCESSED.inc(pages, stage="extract", method=method)
+    BYTES_PROCESSED.inc(os.path.getsize(pdf_path), stage="extract", method=method)
+
+
+def _report_progress(progress, done, total):
+    if progress is not None:
+        progress(done, total)
+
+
+def _iter_page_ranges(method, pdf_path, total_pages, workers=None, stats=None, progress=None):
+    """
+    按页范围逐页提取文本。workers 大于1时把页范围拆分后交给进程池并行提取，
+    每个子进程自行打开PDF，结果按页序产出。
+    """
+    workers = _resolve_workers(workers, total_pages)
+    if stats is not None:
+        stats["workers"] = workers
+
+    _report_progress(progress, 0, total_pages)
+    if workers <= 1:
+        for done, text in enumerate(_iter_page_range(method, pdf_path, 0, total_pages), 1):
+            yield text
+            _report_progress(progress, done, total_pages)
+    else:
+        for start, end, texts in _extract_in_pool(method, pdf_path, _split_page_range(total_pages, workers)):
+            yield from texts
+            _report_progress(progress, end, total_pages)
+
+
 class LoadService:
-    def __init__(self):
-        self.total_pages = 0
-        self.current_page_map = []
+    """
+    PDF 加载。服务本身不保存任何加载结果，每次调用都返回新的 PageMap，
+    因此一个实例可以在多个请求和线程之间共享。
+    """
 
-    def get_total_pages(self):
-        return self.total_pages
+    def __init__(self, cache: ExtractionCache = None, manifest: ManifestService = None):
+        self.cache = cache
+        self.manifest = manifest
 
-    def get_page_map(self):
-        return self.current_page_map
+    def iter_pages(self, pdf_path, method="pymupdf", strategy=None, chunking_strategy=None, chunking_options=None, workers=None, progress=None, file_hash=None, stats=None):
+        """
+        逐页产出 {"page": 页码, "text": 文本}，不累积整份文档。
+        unstructured 需要整份文档一起分区，auto 需要先检查全部页再决定哪些页重新提取，
+        因此这两种方法先完整加载再逐页产出。
+        stats 为可选字典，提取统计信息在产出完毕后写入其中。
+        """
+        start_time = time.perf_counter()
+        if stats is None:
+            stats = {}
+        stats.update(_new_stats())
+        try:
+            if method in ("unstructured", "auto"):
+                result = self.load_pdf(pdf_path, method, strategy, chunking_strategy, chunking_options,
+                                       workers=workers, file_hash=file_hash, progress=progress)
+                stats.update(result.stats)
+                yield from result.page_map.pages()
+            elif method in PAGE_METHODS:
+                try:
+                    fingerprints = page_fingerprints(pdf_path)
+                except Exception as e:
+                    logger.warning(f"计算页指纹失败: {str(e)}")
+                    fingerprints = []
+                total_pages = _count_pages(method, pdf_path)
+                texts = _iter_page_ranges(method, pdf_path, total_pages, workers, stats, progress)
+                for page_num, text in enumerate(texts, 1):
+                    page = {"page": page_num, "text": text}
+                    if len(fingerprints) == total_pages:
+                        page["metadata"] = {"page_hash": fingerprints[page_num - 1]}
+                    yield page
+                _record_extraction(method, pdf_path, time.perf_counter() - start_time, total_pages)
+            else:
+                raise ValueError(f"未识别的方法: {method}")
+            stats["elapsed"] = round(time.perf_counter() - start_time, 3)
+        except Exception as e:
+            logger.error(f"逐页加载失败 {method}: {str(e)}")
+            raise
+
+    def find_previous_doc(self, filename, method):
+        """同名 PDF 用同一方法加载的上一个版本（已加载文档 doc_id），没有时返回 None"""
+        if self.manifest is None or method not in PAGE_METHODS:
+            return None
+        record = self.manifest.latest("loaded", filename, method)
+        return record["doc_id"] if record else None
 
-    def load_pdf(self, pdf_path, method="pymupdf", strategy=None, chunking_strategy=None, chunking_options=None):
+    def _read_previous_pages(self, previous_doc):
+        """读取上一版本中 页指纹 -> 文本 的映射，旧文档没有指纹时为空"""
+        path = os.path.join("01-loaded-docs", previous_doc)
+        if not os.path.exists(path):
+            return {}
+        return {
+            chunk["metadata"]["page_hash"]: chunk["content"]
+            for chunk in open_document(path).iter_chunks()
+            if "page_hash" in chunk["metadata"]
+        }
+
+    def load_pdf(self, pdf_path, method="pymupdf", strategy=None, chunking_strategy=None, chunking_options=None, workers=None, file_hash=None, progress=None, previous_doc=None) -> LoadResult:
+        """
+        加载PDF，返回 LoadResult，其中 page_map 每页带有原始内容指纹 page_hash。
+        progress 为可选回调 progress(已完成页数, 总页数)。
+        previous_doc 为同一文档上一版本的已加载文档 doc_id，指纹相同的页直接复用上一版本的文本，
+        只提取有变化的页。
+        """
         print(f"加载PDF文件: {pdf_path}")
         print(f"加载方法: {method}")
         print(f"加载策略: {strategy}")
         print(f"分块策略: {chunking_strategy}")
         print(f"分块选项: {chunking_options}")
+        logger.debug(f"并行进程数: {workers}")
         try:
-            if method == "pymupdf":
-                return self._load_with_pymupdf(pdf_path)
-            elif method == "pypdf":
-                return self._load_with_pypdf(pdf_path)
-            elif method == "pdfplumber":
-                return self._load_with_pdfplumber(pdf_path)
+            start_time = time.perf_counter()
+            stats = _new_stats()
+
+            cache_key = None
+            if self.cache is not None:
+                cache_key = self.cache.make_key(
+                    file_hash or hash_file(pdf_path), method, strategy, chunking_strategy, chunking_options
+                )
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    page_map = PageMap.from_pages(cached["page_map"])
+                    stats.update({
+                        "workers": 0,
+                        "cache_hit": True,
+                        "elapsed": round(time.perf_counter() - start_time, 3)
+                    })
+                    _report_progress(progress, len(page_map), len(page_map))
+                    return LoadResult(page_map, stats, f"命中提取缓存，总页数: {len(page_map)}")
+
+            try:
+                fingerprints = page_fingerprints(pdf_path)
+            except Exception as e:
+                logger.warning(f"计算页指纹失败，按完整加载处理: {str(e)}")
+                fingerprints = None
+
+            previous_pages = {}
+            if previous_doc and fingerprints and method in PAGE_METHODS:
+                previous_pages = self._read_previous_pages(previous_doc)
+
+            if previous_pages:
+                page_map = self._load_incremental(method, pdf_path, fingerprints, previous_pages, workers, stats, progress)
+                stats["previous_doc"] = previous_doc
+                message = f"增量加载成功，总页数: {len(page_map)}，重新提取 {stats['extracted_pages']} 页"
+            elif method in PAGE_METHODS:
+                loader = getattr(self, f"_load_with_{method}")
+                page_map = loader(pdf_path, workers, stats, progress)
+                message = f"使用{method}加载成功，总页数: {len(page_map)}"
             elif method == "unstructured":
-                return self._load_with_unstructured(
+                strategy = strategy or "fast"
+                page_map = self._load_with_unstructured(
                     pdf_path, 
                     strategy=strategy,
                     chunking_strategy=chunking_strategy,
-                    chunking_options=chunking_options
+                    chunking_options=chunking_options,
+                    progress=progress
                 )
-            elif method == "pdfminer":
-                return self._load_with_pdfminer(pdf_path)
+                message = f"使用unstructured({strategy})加载成功，总页数: {len(page_map)}"
+            elif method == "auto":
+                page_map = self._load_with_auto(pdf_path, workers, stats, progress)
+                message = f"使用auto加载成功，总页数: {len(page_map)}，{stats['escalated_pages']} 页改用{AUTO_FALLBACK_METHOD}"
             else:
                 raise ValueError(f"未识别的方法: {method}")
+            if fingerprints and len(fingerprints) == len(page_map):
+                page_map = page_map.with_metadata("page_hash", fingerprints)
+            elapsed = time.perf_counter() - start_time
+            stats["elapsed"] = round(elapsed, 3)
+            _record_extraction(method, pdf_path, elapsed, stats.get("extracted_pages", len(page_map)))
+            _report_progress(progress, len(page_map), len(page_map))
+
+            if cache_key is not None:
+                self.cache.put(cache_key, {
+                    "total_pages": len(page_map),
+                    "page_map": page_map.to_pages()
+                })
+            return LoadResult(page_map, stats, message)
         except Exception as e:
             logger.error(f"加载失败 {method}: {str(e)}")
             raise
 
 
-    def _load_with_pymupdf(self, pdf_path):
+    def _load_incremental(self, method, pdf_path, fingerprints, previous_pages, workers=None, stats=None, progress=None) -> PageMap:
+        """只提取指纹在上一版本中不存在的页，其余页复用上一版本的文本"""
+        total_pages = len(fingerprints)
+        texts = [previous_pages.get(fingerprint) for fingerprint in fingerprints]
+        changed = [i for i, text in enumerate(texts) if text is None]
+        runs = _group_runs(changed)
+        workers = _resolve_workers(workers, len(changed))
+        if stats is not None:
+            stats.update({
+                "workers": workers,
+                "reused_pages": total_pages - len(changed),
+                "extracted_pages": len(changed)
+            })
+
+        done = total_pages - len(changed)
+        _report_progress(progress, done, total_pages)
+        if workers <= 1 or len(runs) <= 1:
+            for start, end in runs:
+                for i, text in enumerate(_iter_page_range(method, pdf_path, start, end), start):
+                    texts[i] = text
+                    done += 1
+                    _report_progress(progress, done, total_pages)
+        else:
+            for start, end, extracted in _extract_in_pool(method, pdf_path, runs):
+                texts[start:end] = extracted
+                done += end - start
+                _report_progress(progress, done, total_pages)
+
+        return PageMap.from_texts(texts)
+
+    def _load_with_pymupdf(self, pdf_path, workers=None, stats=None, progress=None) -> PageMap:
         try:
-            with fitz.open(pdf_path) as doc:
-                self.total_pages = len(doc)
-                self.current_page_map = []
-                for page_num, page in enumerate(doc, 1):
-                    text = page.get_text().strip()
-                    self.current_page_map.append({
-                        "page": page_num,
-                        "text": text
-                    })
-                return {"message": f"使用pymupdf加载成功，总页数: {self.total_pages}"}
+            return self._load_page_ranges("pymupdf", pdf_path, workers, stats, progress)
         except Exception as e:
             logger.error(f"使用pymupdf加载失败: {str(e)}")
             raise
 
-    def _load_with_pypdf(self, pdf_path):
+    def _load_with_pypdf(self, pdf_path, workers=None, stats=None, progress=None) -> PageMap:
         try:
-            with PdfReader(pdf_path) as reader:
-                self.total_pages = len(reader.pages)
-                self.current_page_map = []
-                for page_num, page in enumerate(reader.pages, 1):
-                    text = page.extract_text().strip()
-                    self.current_page_map.append({
-                        "page": page_num,
-                        "text": text
-                    })
-                return {"message": f"使用pypdf加载成功，总页数: {self.total_pages}"}
+            return self._load_page_ranges("pypdf", pdf_path, workers, stats, progress)
         except Exception as e:
             logger.error(f"使用pypdf加载失败: {str(e)}")
             raise
 
-    def _load_with_pdfplumber(self, pdf_path):
+    def _load_with_pdfplumber(self, pdf_path, workers=None, stats=None, progress=None) -> PageMap:
         try:
-            with pdfplumber.open(pdf_path) as pdf:
-                self.total_pages = len(pdf.pages)
-                self.current_page_map = []
-                for page_num, page in enumerate(pdf.pages, 1):
-                    text = page.extract_text().strip()
-                    self.current_page_map.append({
-                        "page": page_num,
-                        "text": text
-                    })
-                return {"message": f"使用pdfplumber加载成功，总页数: {self.total_pages}"}
+            return self._load_page_ranges("pdfplumber", pdf_path, workers, stats, progress)
         except Exception as e:
             logger.error(f"使用pdfplumber加载失败: {str(e)}")
             raise
 
-    def _load_with_unstructured(self, pdf_path, strategy=None, chunking_strategy=None, chunking_options=None):
+    def _load_page_ranges(self, method, pdf_path, workers=None, stats=None, progress=None) -> PageMap:
+        total_pages = _count_pages(method, pdf_path)
+        return PageMap.from_texts(_iter_page_ranges(method, pdf_path, total_pages, workers, stats, progress))
+
+    def _load_with_auto(self, pdf_path, workers=None, stats=None, progress=None) -> PageMap:
+        """
+        先用最快的方法提取全部页，再用 page_text_problem 检查每页，
+        只把不合格的页交给 AUTO_FALLBACK_METHOD 重新提取；重新提取的结果合格或有效字符更多时采用。
+        每页实际使用的方法记录在 metadata.backend 中。
+        """
         try:
-            # 首先尝试使用PyPDF2获取基本信息
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                self.total_pages = len(pdf_reader.pages)
-                
-                # 初始化页面映射
-                self.current_page_map = []
-                
-                # 提取每页文本
-                for page_num in range(self.total_pages):
-                    page = pdf_reader.pages[page_num]
-                    text = page.extract_text()
-                    
-                    self.current_page_map.append({
-                        "page": page_num + 1,
-                        "text": text.strip()
-                    })
-                
-                return {"message": f"使用PyPDF2加载成功，总页数: {self.total_pages}"}
-                
+            total_pages = _count_pages(AUTO_PRIMARY_METHOD, pdf_path)
+            texts = list(_iter_page_ranges(AUTO_PRIMARY_METHOD, pdf_path, total_pages, workers, stats, progress))
+            backends = [AUTO_PRIMARY_METHOD] * len(texts)
+            layout = _page_layout_stats(pdf_path)
+
+            problems = {}
+            for i, (text, (area, content_bytes)) in enumerate(zip(texts, layout)):
+                problem = page_text_problem(text, area, content_bytes)
+                if problem:
+                    problems[i] = problem
+
+            for start, end in _group_runs(sorted(problems)):
+                for i, text in enumerate(_iter_page_range(AUTO_FALLBACK_METHOD, pdf_path, start, end), start):
+                    if page_text_problem(text, *layout[i]) is None or _valid_chars(text) > _valid_chars(texts[i]):
+                        texts[i] = text
+                        backends[i] = AUTO_FALLBACK_METHOD
+
+            if stats is not None:
+                stats.update({
+                    "flagged_pages": len(problems),
+                    "escalated_pages": backends.count(AUTO_FALLBACK_METHOD),
+                    "flag_reasons": {reason: list(problems.values()).count(reason) for reason in set(problems.values())}
+                })
+            return PageMap.from_texts(texts, metadata=({"backend": backend} for backend in backends))
         except Exception as e:
-            logger.error(f"使用PyPDF2加载失败: {str(e)}")
-            # 如果PyPDF2失败，尝试使用unstructured
+            logger.error(f"使用auto加载失败: {str(e)}")
+            raise
+
+    def _load_with_unstructured(self, pdf_path, strategy=None, chunking_strategy=None, chunking_options=None, progress=None) -> PageMap:
+        """
+        在独立子进程中用 unstructured 分区，超过 UNSTRUCTURED_TIMEOUT 或任务被取消时终止子进程。
+        每页 metadata.elements 保留元素类型（Title、Table、NarrativeText 等）及其在页文本中的偏移。
+        """
+        strategy = strategy or "fast"
+        if strategy not in UNSTRUCTURED_STRATEGIES:
+            raise ValueError(f"Unsupported unstructured strategy: {strategy}")
+        try:
+            total_pages = _count_pages("unstructured", pdf_path)
+            _report_progress(progress, 0, total_pages)
+
+            context = _get_unstructured_context()
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_partition_worker,
+                args=(sender, pdf_path, strategy, chunking_strategy, chunking_options)
+            )
+            process.start()
+            sender.close()
+            deadline = time.monotonic() + UNSTRUCTURED_TIMEOUT
             try:
-                elements = partition_pdf(
-                    filename=pdf_path,
-                    strategy="auto",
-                    include_page_breaks=True,
-                    include_metadata=True,
-                    encoding="utf-8"
-                )
-                
-                if not elements:
-                    raise ValueError("未能从PDF中提取到任何内容")
-                
-                self.total_pages = max([elem.metadata.page_number for elem in elements if hasattr(elem, 'metadata')])
-                self.current_page_map = []
-                
-                for page_num in range(1, self.total_pages + 1):
-                    page_elements = [elem for elem in elements if hasattr(elem, 'metadata') and elem.metadata.page_number == page_num]
-                    page_text = " ".join([elem.text for elem in page_elements if hasattr(elem, 'text')]).strip()
-                    
-                    self.current_page_map.append({
-                        "page": page_num,
-                        "text": page_text
-                    })
-                
-                return {"message": f"使用unstructured加载成功，总页数: {self.total_pages}"}
-            except Exception as e2:
-                logger.error(f"使用unstructured加载也失败: {str(e2)}")
-                raise Exception(f"PDF加载失败: {str(e)}")
+                while not receiver.poll(1.0):
+                    if not process.is_alive():
+                        raise RuntimeError(f"unstructured 子进程异常退出，退出码 {process.exitcode}")
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"unstructured 分区超时（{UNSTRUCTURED_TIMEOUT:g} 秒）")
+                    # 任务被取消时进度回调会抛出异常，随后在 finally 中终止子进程
+                    _report_progress(progress, 0, total_pages)
+                status, payload = receiver.recv()
+            finally:
+                receiver.close()
+                if process.is_alive():
+                    process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
 
+            if status != "ok":
+                raise RuntimeError(payload)
+
+            total_pages = max([total_pages, *payload])
+            empty = {"text": "", "elements": []}
+            pages = [payload.get(page_num, empty) for page_num in range(1, total_pages + 1)]
+            return PageMap.from_texts(
+                (page["text"] for page in pages),
+                metadata=({"elements": page["elements"]} for page in pages)
+            )
+        except Exception as e:
+            logger.error(f"使用unstructured加载失败: {str(e)}")
+            raise
 
-    def _load_with_pdfminer(self, pdf_path):
+    def _load_with_pdfminer(self, pdf_path, workers=None, stats=None, progress=None) -> PageMap:
         try:
-            self.current_page_map = []
-            page_texts = {}
-            
-            # 遍历每一页
-            for page_num, page_layout in enumerate(extract_pages(pdf_path), 1):
-                page_text = []
-                # 提取页面中的文本
-                for element in page_layout:
-                    if isinstance(element, LTTextContainer):
-                        page_text.append(element.get_text())
-                
-                page_texts[page_num] = " ".join(page_text).strip()
-            
-            self.total_pages = len(page_texts)
-            self.current_page_map = [
-                {"page": num, "text": text}
-                for num, text in sorted(page_texts.items())
-            ]
-            
-            return {"message": f"使用pdfminer加载成功，总页数: {self.total_pages}"}
+            return self._load_page_ranges("pdfminer", pdf_path, workers, stats, progress)
         except Exception as e:
             logger.error(f"使用pdfminer加载失败: {str(e)}")
             raise
 
-    def save_document(self, filename: str, chunks: list, metadata: dict, loading_method: str, strategy: str = None, chunking_strategy: str = None) -> str:
+    def save_document(self, filename: str, chunks: list, metadata: dict, loading_method: str, strategy: str = None, chunking_strategy: str = None) -> tuple[str, dict]:
         """
         保存处理后的文档数据。
 
@@ -194,17 +739,10 @@ class LoadService:
             chunking_strategy (str, optional): 使用的分块策略
 
         返回:
-            str: 保存的文件路径
+            tuple[str, dict]: (保存的文件路径, 写入的文档数据)，调用方无需再读回文件
         """
         try:
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            base_name = filename.replace('.pdf', '').split('_')[0]
-            
-            # Adjust the document name to include strategy if unstructured
-            if loading_method == "unstructured" and strategy:
-                doc_name = f"{base_name}_{loading_method}_{strategy}_{chunking_strategy}_{timestamp}"
-            else:
-                doc_name = f"{base_name}_{loading_method}_{timestamp}"
+            doc_name = _document_name(filename, loading_method, strategy, chunking_strategy)
             
             document_data = {
                 "filename": str(filename),
@@ -218,13 +756,15 @@ class LoadService:
                 "chunks": chunks
             }
             
-            filepath = os.path.join("01-loaded-docs", f"{doc_name}.json")
-            os.makedirs("01-loaded-docs", exist_ok=True)
+            filepath = document_path("01-loaded-docs", doc_name)
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(document_data, f, ensure_ascii=False, indent=2)
+            size = write_document(filepath, document_data, method=loading_method)
+            BYTES_PROCESSED.inc(size, stage="write", method=loading_method)
+
+            if self.manifest is not None:
+                self.manifest.record("loaded", filepath, {k: v for k, v in document_data.items() if k != "chunks"})
                 
-            return filepath
+            return filepath, document_data
             
         except Exception as e:
             logger.error(f"Error saving document: {str(e)}")
@@ -0,0 +1,192 @@
+import logging
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+from services.cache_service import hash_file
+from services.doc_store import is_document_file, open_document
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = os.getenv("RAG_MANIFEST_PATH", os.path.join("01-loaded-docs", ".manifest.sqlite3"))
+
+# 文档类别与所在目录
+DOC_DIRS = {
+    "loaded": "01-loaded-docs",
+    "chunked": "01-chunked-docs",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    kind TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    filename TEXT,
+    loading_method TEXT,
+    chunking_method TEXT,
+    total_pages INTEGER,
+    total_chunks INTEGER,
+    byte_size INTEGER,
+    content_hash TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (kind, doc_id)
+);
+CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents (kind, filename);
+CREATE INDEX IF NOT EXISTS idx_documents_loading_method ON documents (kind, loading_method);
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents (kind, created_at);
+"""
+
+COLUMNS = [
+    "kind", "doc_id", "filename", "loading_method", "chunking_method", "total_pages",
+    "total_chunks", "byte_size", "content_hash", "created_at", "updated_at"
+]
+
+
+class ManifestService:
+    """
+    已加载/已分块文档的清单索引（SQLite），写文档时同步更新，
+    列表接口只查询索引而不再逐个解析文档 JSON。
+    """
+
+    def __init__(self, db_path: str = MANIFEST_PATH):
+        self.db_path = db_path
+        self._checked = False
+        self._schema_ready = False
+
+    @contextmanager
+    def _connect(self):
+        """打开连接，正常结束时提交事务，最后关闭连接"""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            if not self._schema_ready:
+                conn.executescript(SCHEMA)
+                self._schema_ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _ensure_built(self):
+        """首次使用时如果索引为空而目录中已有文档，自动扫描一次"""
+        if self._checked:
+            return
+        self._checked = True
+        with self._connect() as conn:
+            count = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        if count == 0 and any(
+            os.path.isdir(d) and any(is_document_file(name) for name in os.listdir(d))
+            for d in DOC_DIRS.values()
+        ):
+            self.rebuild()
+
+    def record(self, kind: str, filepath: str, document_data: dict) -> dict:
+        """写入或更新一条文档记录，document_data 只需包含顶层字段"""
+        self._ensure_built()
+        now = datetime.now().isoformat()
+        row = {
+            "kind": kind,
+            "doc_id": os.path.basename(filepath),
+            "filename": document_data.get("filename"),
+            "loading_method": document_data.get("loading_method"),
+            "chunking_method": document_data.get("chunking_method"),
+            "total_pages": document_data.get("total_pages"),
+            "total_chunks": document_data.get("total_chunks"),
+            "byte_size": os.path.getsize(filepath),
+            "content_hash": hash_file(filepath),
+            "created_at": document_data.get("timestamp") or now,
+            "updated_at": now,
+        }
+        with self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO documents ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS)})",
+                [row[c] for c in COLUMNS]
+            )
+        return row
+
+    def get(self, kind: str, doc_id: str) -> dict:
+        self._ensure_built()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM documents WHERE kind = ? AND doc_id = ?", (kind, doc_id)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def latest(self, kind: str, filename: str, loading_method: str = None) -> dict:
+        """同名文档（文件名精确匹配）最近的一条记录，没有时返回 None"""
+        self._ensure_built()
+        where = "kind = ? AND filename = ?"
+        params = [kind, filename]
+        if loading_method:
+            where += " AND loading_method = ?"
+            params.append(loading_method)
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT * FROM documents WHERE {where} ORDER BY created_at DESC LIMIT 1", params
+            ).fetchone()
+        return dict(row) if row else None
+
+    def remove(self, kind: str, doc_id: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents WHERE kind = ? AND doc_id = ?", (kind, doc_id))
+
+    def list(self, kind: str = "loaded", filename: str = None, loading_method: str = None,
+             chunking_method: str = None, offset: int = 0, limit: int = None):
+        """
+        分页查询文档记录，filename 为子串匹配。
+        返回 (记录列表, 满足条件的总数)。
+        """
+        self._ensure_built()
+        where = ["kind = ?"]
+        params = [kind]
+        if filename:
+            where.append("filename LIKE ?")
+            params.append(f"%{filename}%")
+        if loading_method:
+            where.append("loading_method = ?")
+            params.append(loading_method)
+        if chunking_method:
+            where.append("chunking_method = ?")
+            params.append(chunking_method)
+        where_sql = " AND ".join(where)
+
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM documents WHERE {where_sql}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM documents WHERE {where_sql} ORDER BY created_at DESC, doc_id "
+                f"LIMIT ? OFFSET ?",
+                params + [limit if limit is not None else -1, offset]
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def rebuild(self) -> int:
+        """扫描全部文档目录重建索引，返回索引的文档数"""
+        count = 0
+        with self._connect() as conn:
+            conn.execute("DELETE FROM documents")
+        for kind, docs_dir in DOC_DIRS.items():
+            if not os.path.isdir(docs_dir):
+                continue
+            for name in sorted(os.listdir(docs_dir)):
+                if not is_document_file(name):
+                    continue
+                filepath = os.path.join(docs_dir, name)
+                try:
+                    # 新格式只读取头尾记录，不解压 chunk
+                    self.record(kind, filepath, open_document(filepath).metadata)
+                    count += 1
+                except Exception as e:
+                    logger.error(f"索引文件 {name} 失败: {str(e)}")
+        self._checked = True
+        return count
+
+
+if __name__ == "__main__":
+    # 用法（在项目根目录下）: PYTHONPATH=backend python -m services.manifest_service rebuild
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        print(f"已索引文档数: {ManifestService().rebuild()}")
+    else:
+        print("用法: PYTHONPATH=backend python -m services.manifest_service rebuild")
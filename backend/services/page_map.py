@@ -0,0 +1,109 @@
+from array import array
+from bisect import bisect_right
+from types import MappingProxyType
+
+
+class PageMap:
+    """
+    一份文档按页提取的文本。所有页用换行拼接成一个缓冲区 buffer，
+    第 i 页为 buffer[starts[i]:starts[i + 1] - 1]，页码和每页元数据分别存放，
+    不再为每页保存一个 {"page", "text", "metadata"} 字典。
+    创建后不可修改，可以在线程和请求之间共享；分块和解析直接在缓冲区上切片。
+    """
+
+    __slots__ = ("buffer", "starts", "page_numbers", "_metadata")
+
+    def __init__(self, buffer: str, starts: array, page_numbers: array, metadata: tuple = None):
+        object.__setattr__(self, "buffer", buffer)
+        object.__setattr__(self, "starts", starts)
+        object.__setattr__(self, "page_numbers", page_numbers)
+        object.__setattr__(self, "_metadata", metadata)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PageMap 不可修改")
+
+    @classmethod
+    def from_texts(cls, texts, page_numbers=None, metadata=None):
+        """
+        由按页序排列的文本创建。page_numbers 默认从1开始连续编号，
+        metadata 为与页一一对应的字典（没有时为 None）。
+        """
+        texts = list(texts)
+        starts = array('q', [0])
+        offset = 0
+        for text in texts:
+            offset += len(text) + 1
+            starts.append(offset)
+        if page_numbers is None:
+            page_numbers = range(1, len(texts) + 1)
+        page_numbers = array('q', page_numbers)
+        if len(page_numbers) != len(texts):
+            raise ValueError("页码数量与页数不一致")
+        if metadata is not None:
+            metadata = tuple(dict(item) if item else None for item in metadata)
+            if len(metadata) != len(texts):
+                raise ValueError("元数据数量与页数不一致")
+            if not any(metadata):
+                metadata = None
+        return cls("\n".join(texts), starts, page_numbers, metadata)
+
+    @classmethod
+    def from_pages(cls, pages):
+        """由 [{"page": 页码, "text": 文本, "metadata": {...}}, ...] 创建"""
+        pages = list(pages)
+        return cls.from_texts(
+            (page["text"] for page in pages),
+            [page["page"] for page in pages],
+            [page.get("metadata") for page in pages]
+        )
+
+    @classmethod
+    def coerce(cls, page_map):
+        """PageMap 原样返回，页字典列表转换为 PageMap"""
+        if isinstance(page_map, cls):
+            return page_map
+        return cls.from_pages(page_map or [])
+
+    def with_metadata(self, key: str, values) -> "PageMap":
+        """返回每页元数据增加 key 之后的新 PageMap，文本缓冲区与原对象共享"""
+        values = list(values)
+        if len(values) != len(self):
+            raise ValueError("元数据数量与页数不一致")
+        old = self._metadata or (None,) * len(self)
+        metadata = tuple({**(item or {}), key: value} for item, value in zip(old, values))
+        return PageMap(self.buffer, self.starts, self.page_numbers, metadata)
+
+    def __len__(self) -> int:
+        return len(self.page_numbers)
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.starts[i]:self.starts[i + 1] - 1]
+
+    def page_number(self, i: int) -> int:
+        return self.page_numbers[i]
+
+    def metadata(self, i: int):
+        """第 i 页的只读元数据，没有时为 None"""
+        if self._metadata is None or self._metadata[i] is None:
+            return None
+        return MappingProxyType(self._metadata[i])
+
+    def page_index(self, offset: int) -> int:
+        """缓冲区偏移 offset 所在页的下标"""
+        return bisect_right(self.starts, offset) - 1
+
+    def items(self):
+        """逐页产出 (页码, 文本)"""
+        for i in range(len(self)):
+            yield self.page_numbers[i], self.text(i)
+
+    def pages(self):
+        """逐页产出 {"page", "text"[, "metadata"]} 字典，用于写文档和缓存"""
+        for i in range(len(self)):
+            page = {"page": self.page_numbers[i], "text": self.text(i)}
+            if self._metadata is not None and self._metadata[i] is not None:
+                page["metadata"] = dict(self._metadata[i])
+            yield page
+
+    def to_pages(self) -> list:
+        return list(self.pages())
@@ -0,0 +1,199 @@
+import math
+from collections import Counter
+import os
+import re
+import time
+from services.page_map import PageMap
+from services.title_matcher import TitleMatcher
+from services.metrics_service import STAGE_SECONDS, PAGES_PROCESSED
+
+# 分块和解析前是否默认做页面规整（去掉页眉页脚、修正空白和断行）
+NORMALIZE_PAGES = os.getenv("RAG_NORMALIZE_PAGES", "1") == "1"
+# 每页只在前后各这么多个非空行中寻找页眉页脚
+BOILERPLATE_EDGE_LINES = int(os.getenv("RAG_BOILERPLATE_EDGE_LINES", 3))
+# 同一位置的同一行出现在不少于该比例的页上才视为页眉页脚
+BOILERPLATE_MIN_RATIO = float(os.getenv("RAG_BOILERPLATE_MIN_RATIO", 0.6))
+# 页数少于该值的文档不检测页眉页脚
+BOILERPLATE_MIN_PAGES = int(os.getenv("RAG_BOILERPLATE_MIN_PAGES", 3))
+# 显示宽度不小于本页最宽行这一比例的行视为排版自动折行，可以与下一行拼接
+WRAP_LINE_RATIO = 0.85
+# 不超过该长度（去掉空白后）的行比较时忽略数字，用于识别每页不同的页码
+MASK_DIGITS_MAX_CHARS = 20
+
+# 各种宽度的空格统一为普通空格，零宽字符和软连字符直接去掉；全角空格常用于中文缩进，保留
+_ODD_SPACES = re.compile('[\xa0\u2002-\u200a\u202f\u205f]')
+_INVISIBLE_CHARS = re.compile('[\u200b-\u200d\ufeff\u00ad]')
+# 中日韩及全角字符从 U+2E80 开始
+_NARROW_CHARS = re.compile('[\x00-\u2e7f]+')
+_WHITESPACE = re.compile(r'\s+')
+_DIGITS = re.compile(r'\d+')
+# 与 ParseService 的表格行判断一致，表格行不参与断行拼接
+_TABLE_LIKE = re.compile(r'\t|\s{2,}')
+# 标题和列表项总是另起一行：TitleMatcher 能识别的各级标题，以及 "第三条"、"a) " 这类编号
+_TITLE_MATCHER = TitleMatcher()
+_LIST_PREFIX = re.compile(r'第[一二三四五六七八九十百千零〇\d]+[条款项部]|[a-z]{1,4}[.)]\s')
+# 以这些字符结尾的行是完整的句子或列表项
+_LINE_TERMINATORS = frozenset("。！？!?；;：:….」』”）)")
+
+
+def _is_cjk(char: str) -> bool:
+    return '\u3400' <= char <= '\u9fff' or '\uf900' <= char <= '\ufaff'
+
+
+def _display_width(line: str) -> int:
+    """按显示宽度计算行长，中日韩及全角字符占两列，中英混排的页面才能比较哪些行排满了"""
+    return len(line) + len(_NARROW_CHARS.sub("", line))
+
+
+def line_key(line: str) -> str:
+    """
+    页眉页脚的比较键：去掉全部空白后小写。短行（页码、"第 3 页 共 40 页" 之类）再把数字串替换为 #，
+    长行按原文比较，避免只有编号不同的正文行被当成页眉页脚。
+    """
+    key = _WHITESPACE.sub("", line).lower()
+    if len(key) <= MASK_DIGITS_MAX_CHARS:
+        key = _DIGITS.sub("#", key)
+    return key
+
+
+class PageNormalizer:
+    """
+    分块和解析前的页面规整。第一遍按位置（页首/页尾若干行）统计每个行键出现的页数，
+    第二遍去掉出现在大部分页上的页眉、页脚、页码和免责声明行，并修正空白和排版折行。
+    去掉的行作为文档元数据返回，页码和每页元数据保持不变。
+    """
+
+    def __init__(self, edge_lines: int = BOILERPLATE_EDGE_LINES, min_ratio: float = BOILERPLATE_MIN_RATIO,
+                 min_pages: int = BOILERPLATE_MIN_PAGES):
+        self.edge_lines = edge_lines
+        self.min_ratio = min_ratio
+        self.min_pages = min_pages
+
+    def _edges(self, lines: list):
+        """逐个产出 (位置, 行号)：前 edge_lines 个非空行为 header，后 edge_lines 个为 footer"""
+        nonblank = [i for i, line in enumerate(lines) if line.strip()]
+        for i in nonblank[:self.edge_lines]:
+            yield "header", i
+        for i in nonblank[-self.edge_lines:] if self.edge_lines else ():
+            yield "footer", i
+
+    def normalize(self, page_map) -> tuple:
+        """
+        返回 (规整后的 PageMap, 统计)。统计为 {"boilerplate": [{"text", "position", "pages"}],
+        "removed_lines": 去掉的行数, "joined_lines": 拼接的折行数}。
+        """
+        start_time = time.perf_counter()
+        page_map = PageMap.coerce(page_map)
+        total_pages = len(page_map)
+
+        # 第一遍：每页只统计一次同一位置的同一行键
+        page_lines = []
+        counts = {}   # (位置, 行键) -> [页数, 第一次出现时的原文]
+        for i in range(total_pages):
+            text = _INVISIBLE_CHARS.sub("", _ODD_SPACES.sub(" ", page_map.text(i)))
+            lines = [line.rstrip() for line in text.split("\n")]
+            page_lines.append(lines)
+            seen = set()
+            for position, index in self._edges(lines):
+                key = (position, line_key(lines[index]))
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry = counts.get(key)
+                if entry is None:
+                    counts[key] = [1, lines[index].strip()]
+                else:
+                    entry[0] += 1
+
+        boilerplate = set()
+        if total_pages >= self.min_pages:
+            min_count = max(self.min_pages, math.ceil(self.min_ratio * total_pages))
+            boilerplate = {key for key, (count, _) in counts.items() if count >= min_count}
+
+        # 第二遍：去掉页眉页脚，再修正折行和多余空行
+        texts = []
+        removed_lines = joined_lines = 0
+        for lines in page_lines:
+            if boilerplate:
+                removed = {index for position, index in self._edges(lines)
+                           if (position, line_key(lines[index])) in boilerplate}
+                if removed:
+                    removed_lines += len(removed)
+                    lines = [line for index, line in enumerate(lines) if index not in removed]
+            lines, joined = self._join_wrapped(lines)
+            joined_lines += joined
+            texts.append(self._collapse_blank_lines(lines))
+
+        normalized = PageMap.from_texts(
+            texts, page_map.page_numbers, [page_map.metadata(i) for i in range(total_pages)]
+        )
+        stats = {
+            "boilerplate": [
+                {"text": counts[key][1], "position": key[0], "pages": counts[key][0]}
+                for key in sorted(boilerplate, key=lambda key: (key[0] != "header", -counts[key][0], key[1]))
+            ],
+            "removed_lines": removed_lines,
+            "joined_lines": joined_lines
+        }
+        STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="normalize", method="")
+        PAGES_PROCESSED.inc(total_pages, stage="normalize", method="")
+        return normalized, stats
+
+    @staticmethod
+    def _is_wrapped(previous: str, previous_width: int, line: str, indent: int, full_width: float) -> bool:
+        """previous 是否是被排版折断、应与 line 拼接的行；line 缩进多于 indent 时是新段落"""
+        if previous_width < full_width:
+            return False
+        content = line.lstrip()
+        if not content or len(line) - len(content) > indent:
+            return False
+        if _TABLE_LIKE.search(previous.strip()) or _TABLE_LIKE.search(content):
+            return False
+        if _TITLE_MATCHER.match_level(content) or _LIST_PREFIX.match(content):
+            return False
+        last, first = previous[-1], content[0]
+        if last in _LINE_TERMINATORS or last == ".":
+            return False
+        if _is_cjk(first):
+            return _is_cjk(last) or last in "，、"
+        return first.isascii() and first.islower() and (last.isalnum() or last in ",-")
+
+    def _join_wrapped(self, lines: list) -> tuple:
+        """拼接排版折行：中文直接相连，英文加空格，行尾连字符断开的英文单词去掉连字符"""
+        nonblank = [line for line in lines if line.strip()]
+        if len(nonblank) < 3:
+            return lines, 0
+        # pdfminer 等加载方式每行都带相同的缩进，比本页最常见的缩进更多的行才是新段落
+        indent = Counter(len(line) - len(line.lstrip()) for line in nonblank).most_common(1)[0][0]
+        widths = [_display_width(line) for line in lines]
+        full_width = WRAP_LINE_RATIO * max(widths)
+        result = []
+        joined = 0
+        for i, line in enumerate(lines):
+            if i and self._is_wrapped(lines[i - 1], widths[i - 1], line, indent, full_width):
+                line = line.lstrip()
+                previous = result[-1]
+                if previous.endswith("-") and len(previous) > 1 and previous[-2].isalpha():
+                    result[-1] = previous[:-1] + line
+                elif _is_cjk(line[0]):
+                    result[-1] = previous + line
+                else:
+                    result[-1] = previous + " " + line
+                joined += 1
+            else:
+                result.append(line)
+        return result, joined
+
+    @staticmethod
+    def _collapse_blank_lines(lines: list) -> str:
+        """去掉首尾空行，连续空行只保留一个"""
+        result = []
+        for line in lines:
+            if not line.strip():
+                if result and result[-1]:
+                    result.append("")
+                continue
+            result.append(line)
+        if result and not result[-1]:
+            result.pop()
+        return "\n".join(result)
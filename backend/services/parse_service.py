@@ -6,30 +6,38 @@ import fitz  # PyMuPDF
 import pandas as pd
 from datetime import datetime
 import re
+from services.title_matcher import TitleMatcher
+from services.page_map import PageMap
+from services.metrics_service import STAGE_SECONDS, PAGES_PROCESSED
+from services.doc_store import open_document
+from services.manifest_service import DOC_DIRS
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# 解析结果保存目录，按已加载文档和解析方法命名，重复解析直接读取
+PARSED_DOCS_DIR = "01-parsed-docs"
+PARSING_METHODS = ("all_text", "by_pages", "by_titles", "text_and_tables")
+
 class ParseService:
 
     def __init__(self):
-        self.title_patterns = [
-            r'^第[一二三四五六七八九十百千万]+[章节篇]',  # 中文章节标题
-            r'^\d+\.\s+[^\n]+',  # 数字编号标题 (如: 1. 标题)
-            r'^[A-Z]\.\s+[^\n]+',  # 字母编号标题 (如: A. 标题)
-            r'^\d+\)\s+[^\n]+',  # 数字括号标题 (如: 1) 标题)
-            r'^[A-Z]\)\s+[^\n]+',  # 字母括号标题 (如: A) 标题)
-            r'^（\d+）\s*[^\n]+',  # 中文括号数字标题 (如: （1）标题)
-            r'^（[一二三四五六七八九十]+）\s*[^\n]+',  # 中文括号中文数字标题 (如: （一）标题)
-            r'^[一二三四五六七八九十]+、\s*[^\n]+',  # 中文顿号标题 (如: 一、标题)
-            r'^[（(][一二三四五六七八九十]+[）)]\s*[^\n]+',  # 中文括号标题 (如: （一）标题 或 (一)标题)
-            r'^[（(][A-Z][）)]\s*[^\n]+',  # 中文括号字母标题 (如: （A）标题 或 (A)标题)
-        ]
-
-    def parse_pdf(self, text: str, method: str, metadata: dict, page_map: list = None) -> dict:
+        self.title_matcher = TitleMatcher()
 
+    def parse_pdf(self, text: str, method: str, metadata: dict, page_map=None, doc_id: str = None) -> dict:
+        """
+        page_map 为 PageMap，也接受 [{"page": 页码, "text": 文本}, ...] 列表。
+        doc_id 为已加载文档时记录在结果元数据中；未提供 page_map 时直接读取该文档的页面，不再重新提取 PDF。
+        """
         try:
-            
+            start_time = time.perf_counter()
             parsed_content = []
+            if page_map is None and doc_id is not None:
+                loaded_doc = open_document(os.path.join(DOC_DIRS["loaded"], doc_id))
+                page_map = loaded_doc.page_map()
+                metadata = {"filename": loaded_doc.metadata.get("filename", ""), **(metadata or {})}
+            page_map = PageMap.coerce(page_map)
             total_pages = len(page_map)
             
             if method == "all_text":
@@ -53,6 +61,10 @@ class ParseService:
                 },
                 "content": parsed_content
             }
+            if doc_id is not None:
+                document_data["metadata"]["doc_id"] = doc_id
+            STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="parse", method=method)
+            PAGES_PROCESSED.inc(total_pages, stage="parse", method=method)
             
             return document_data
         
@@ -62,13 +74,13 @@ class ParseService:
             logger.error(f"Error in parse_pdf: {str(e)}")
             raise
 
-    def _parse_all_text(self, page_map: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _parse_all_text(self, page_map: PageMap) -> List[Dict[str, Any]]:
         """
         解析所有文本，将所有页面的文本合并成一个完整的文本块
         """
         try:
-            # 合并所有页面的文本
-            full_text = "\n".join(page["text"] for page in page_map)
+            # 页面缓冲区就是用换行合并的全部文本
+            full_text = page_map.buffer
             
             return [{
                 "type": "Text",
@@ -81,19 +93,19 @@ class ParseService:
             raise
             
 
-    def _parse_by_pages(self, page_map: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _parse_by_pages(self, page_map: PageMap) -> List[Dict[str, Any]]:
         """
         按页面解析文本
         """
         try:
             parsed_content = []
             
-            for page in page_map:
+            for page_number, text in page_map.items():
                 page_content = {
                     "type": "page",
-                    "page_number": page['page'],
-                    "content": page['text'],
-                    "word_count": len([char for char in page['text'] if char.strip()])
+                    "page_number": page_number,
+                    "content": text,
+                    "word_count": len([char for char in text if char.strip()])
                 }
                 parsed_content.append(page_content)
             
@@ -103,18 +115,35 @@ class ParseService:
             logger.error(f"按页面解析失败: {str(e)}")
             raise
 
-    def _parse_by_titles(self, page_map: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _parse_by_titles(self, page_map: PageMap) -> List[Dict[str, Any]]:
         """
-        按标题解析文本
+        按标题解析文本。每个章节带有标题层级 level（前言为0）和 parent，
+        parent 是上级章节在结果列表中的下标，一次遍历即可还原章节树。
         """
         try:
             parsed_content = []
             current_section = None
+            current_level = 0
+            current_parent = None
             current_content = []
             first_title_found = False
+            # 已关闭章节中可能成为后续标题上级的 (层级, 下标)
+            ancestors = []
+            match_level = self.title_matcher.match_level
+
+            def close_section(title, level, parent, page_number):
+                parsed_content.append({
+                    "type": "section",
+                    "title": title,
+                    "level": level,
+                    "parent": parent,
+                    "content": "\n".join(current_content),
+                    "page": page_number
+                })
+                if level:
+                    ancestors.append((level, len(parsed_content) - 1))
             
-            for page in page_map:
-                text = page['text']
+            for page_number, text in page_map.items():
                 lines = text.split('\n')
                 
                 for line in lines:
@@ -123,47 +152,32 @@ class ParseService:
                         continue
                     
                     # 检查是否是标题
-                    if any(re.match(pattern, line) for pattern in self.title_patterns):
+                    level = match_level(line)
+                    if level:
                         # 如果是第一个标题，保存之前的内容
                         if not first_title_found and current_content:
-                            parsed_content.append({
-                                "type": "section",
-                                "title": "前言",
-                                "content": "\n".join(current_content),
-                                "page": page['page']
-                            })
-                            first_title_found = True
+                            close_section("前言", 0, None, page_number)
                         # 保存前一个章节
                         elif current_section:
-                            parsed_content.append({
-                                "type": "section",
-                                "title": current_section,
-                                "content": "\n".join(current_content),
-                                "page": page['page']
-                            })
-                        
-                        # 开始新章节
+                            close_section(current_section, current_level, current_parent, page_number)
+                        first_title_found = True
+
+                        # 开始新章节，上级为最近一个层级更高的章节
+                        while ancestors and ancestors[-1][0] >= level:
+                            ancestors.pop()
                         current_section = line
+                        current_level = level
+                        current_parent = ancestors[-1][1] if ancestors else None
                         current_content = []
                     else:
                         current_content.append(line)
             
             # 保存最后一个章节
             if current_section:
-                parsed_content.append({
-                    "type": "section",
-                    "title": current_section,
-                    "content": "\n".join(current_content),
-                    "page": page['page']
-                })
+                close_section(current_section, current_level, current_parent, page_number)
             # 如果整个文档都没有标题，将所有内容作为前言
             elif current_content and not first_title_found:
-                parsed_content.append({
-                    "type": "section",
-                    "title": "前言",
-                    "content": "\n".join(current_content),
-                    "page": page['page']
-                })
+                close_section("前言", 0, None, page_number)
             
             return parsed_content
             
@@ -171,15 +185,14 @@ class ParseService:
             logger.error(f"按标题解析失败: {str(e)}")
             raise
 
-    def _parse_text_and_tables(self, page_map: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _parse_text_and_tables(self, page_map: PageMap) -> List[Dict[str, Any]]:
         """
         解析文本和表格
         """
         try:
             parsed_content = []
             
-            for page in page_map:
-                text = page['text']
+            for page_number, text in page_map.items():
                 lines = text.split('\n')
                 
                 # 检测表格（简单实现：连续的行包含多个制表符或空格）
@@ -198,7 +211,7 @@ class ParseService:
                             parsed_content.append({
                                 "type": "paragraph",
                                 "content": "\n".join(current_paragraph),
-                                "page": page['page']
+                                "page": page_number
                             })
                             current_paragraph = []
                         
@@ -211,7 +224,7 @@ class ParseService:
                             parsed_content.append({
                                 "type": "table",
                                 "rows": table_lines,
-                                "page": page['page']
+                                "page": page_number
                             })
                             table_lines = []
                         
@@ -222,13 +235,13 @@ class ParseService:
                     parsed_content.append({
                         "type": "paragraph",
                         "content": "\n".join(current_paragraph),
-                        "page": page['page']
+                        "page": page_number
                     })
                 elif table_lines:
                     parsed_content.append({
                         "type": "table",
                         "rows": table_lines,
-                        "page": page['page']
+                        "page": page_number
                     })
             
             return parsed_content
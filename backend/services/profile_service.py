@@ -0,0 +1,202 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import shutil
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILES_DIR = os.getenv("RAG_PROFILES_DIR", "profiles")
+# 为 1 时才接受请求头 X-Profile: 1 或查询参数 ?profile=1 开启单个请求的性能分析
+PROFILE_ON_REQUEST = os.getenv("RAG_PROFILE_ON_REQUEST", "0") == "1"
+# 按该比例随机抽样分析请求，0 表示不抽样
+PROFILE_SAMPLE_RATE = float(os.getenv("RAG_PROFILE_SAMPLE_RATE", 0))
+# 记录的函数和内存分配位置条数
+PROFILE_TOP_N = int(os.getenv("RAG_PROFILE_TOP_N", 30))
+# tracemalloc 为每次分配保存的调用栈深度，越深开销越大
+PROFILE_TRACE_FRAMES = int(os.getenv("RAG_PROFILE_TRACE_FRAMES", 1))
+# 最多保留的分析结果数，超出时删除最早的
+PROFILE_MAX_KEEP = int(os.getenv("RAG_PROFILE_MAX_KEEP", 100))
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+class ProfileService:
+    """
+    单个请求的 cProfile 与 tracemalloc 分析。每个分析结果保存在 profiles/<profile_id>/ 下：
+    profile.prof（可用 pstats、snakeviz 打开）和 summary.json（耗时最多的函数与内存增长最多的分配位置）。
+    cProfile 只统计执行任务的线程；tracemalloc 是进程级的，同时有其他请求在运行时分配统计会混在一起，
+    summary.json 中的 concurrent 记录了这种情况。
+    """
+
+    def __init__(self, profiles_dir: str = PROFILES_DIR, on_request: bool = PROFILE_ON_REQUEST,
+                 sample_rate: float = PROFILE_SAMPLE_RATE, top_n: int = PROFILE_TOP_N,
+                 max_keep: int = PROFILE_MAX_KEEP):
+        self.profiles_dir = profiles_dir
+        self.on_request = on_request
+        self.sample_rate = sample_rate
+        self.top_n = top_n
+        self.max_keep = max_keep
+        self._lock = threading.Lock()
+        self._active = 0
+        self._started_tracing = False
+
+    def new_profile_id(self, header_value: str = None, query_value: str = None) -> str:
+        """请求需要分析时返回新的 profile_id，否则返回 None"""
+        requested = any(str(value).lower() in _TRUE_VALUES for value in (header_value, query_value) if value)
+        if (requested and self.on_request) or (self.sample_rate > 0 and random.random() < self.sample_rate):
+            return uuid.uuid4().hex
+        return None
+
+    def _profile_dir(self, profile_id: str) -> str:
+        if not profile_id or not all(c in "0123456789abcdef" for c in profile_id):
+            raise ValueError(f"无效的 profile_id: {profile_id}")
+        return os.path.join(self.profiles_dir, profile_id)
+
+    def _start_tracing(self) -> bool:
+        """开始跟踪内存分配，返回是否有其他分析正在进行"""
+        with self._lock:
+            self._active += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACE_FRAMES)
+                self._started_tracing = True
+            return self._active > 1
+
+    def _stop_tracing(self) -> None:
+        with self._lock:
+            self._active -= 1
+            if self._active == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def run(self, profile_id: str, kind: str, fn, *args, **kwargs):
+        """在 cProfile 和 tracemalloc 下执行 fn，保存分析结果后返回 fn 的结果（异常照常抛出）"""
+        profile_dir = self._profile_dir(profile_id)
+        concurrent = self._start_tracing()
+        profiler = cProfile.Profile()
+        status = "succeeded"
+        error = None
+        start_time = time.perf_counter()
+        try:
+            before = tracemalloc.take_snapshot()
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+        except Exception as e:
+            status = "failed"
+            error = str(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            try:
+                current_memory, peak_memory = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                self._save(profile_dir, profiler, before, after, {
+                    "profile_id": profile_id,
+                    "kind": kind,
+                    "status": status,
+                    "error": error,
+                    "created_at": datetime.now().isoformat(),
+                    "elapsed": round(elapsed, 4),
+                    "memory_growth_bytes": current_memory - start_memory,
+                    "peak_traced_bytes": peak_memory - start_memory,
+                    "concurrent": concurrent
+                })
+            except Exception as e:
+                logger.error(f"保存性能分析结果失败 {profile_id}: {str(e)}")
+            finally:
+                self._stop_tracing()
+
+    def _save(self, profile_dir: str, profiler: cProfile.Profile, before, after, summary: dict) -> None:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, "profile.prof"))
+
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        functions = []
+        for (filename, line, name), (_, calls, total_time, cumulative_time, _) in stats.stats.items():
+            functions.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": calls,
+                "total_time": round(total_time, 6),
+                "cumulative_time": round(cumulative_time, 6)
+            })
+        functions.sort(key=lambda item: item["cumulative_time"], reverse=True)
+        summary["top_functions"] = functions[:self.top_n]
+
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+        differences = after.filter_traces(ignored).compare_to(before.filter_traces(ignored), "lineno")
+        summary["top_allocations"] = [
+            {
+                "location": f"{diff.traceback[0].filename}:{diff.traceback[0].lineno}",
+                "size_diff": diff.size_diff,
+                "count_diff": diff.count_diff,
+                "size": diff.size
+            }
+            for diff in differences[:self.top_n]
+        ]
+
+        with open(os.path.join(profile_dir, "summary.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        self._prune()
+
+    def _prune(self) -> None:
+        profiles = self.list()
+        for summary in profiles[self.max_keep:]:
+            self.delete(summary["profile_id"])
+
+    def list(self) -> list:
+        """全部分析结果的概要（不含函数和分配明细），最新的在前"""
+        profiles = []
+        if not os.path.isdir(self.profiles_dir):
+            return profiles
+        for name in os.listdir(self.profiles_dir):
+            summary = self.get(name)
+            if summary is not None:
+                summary.pop("top_functions", None)
+                summary.pop("top_allocations", None)
+                profiles.append(summary)
+        profiles.sort(key=lambda item: item.get("created_at", ""), reverse=True)
+        return profiles
+
+    def get(self, profile_id: str) -> dict:
+        try:
+            path = os.path.join(self._profile_dir(profile_id), "summary.json")
+        except ValueError:
+            return None
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def prof_path(self, profile_id: str) -> str:
+        """profile.prof 的路径，不存在时返回 None"""
+        try:
+            path = os.path.join(self._profile_dir(profile_id), "profile.prof")
+        except ValueError:
+            return None
+        return path if os.path.exists(path) else None
+
+    def delete(self, profile_id: str) -> bool:
+        try:
+            profile_dir = self._profile_dir(profile_id)
+        except ValueError:
+            return False
+        if not os.path.isdir(profile_dir):
+            return False
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        return True
@@ -0,0 +1,502 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+import numpy as np
+from services.embed_service import EMBEDDED_DOCS_DIR, DEFAULT_EMBEDDER, get_embedder, load_embedding, StaleEmbeddingError
+from services.doc_store import open_document
+
+logger = logging.getLogger(__name__)
+
+CHUNKED_DOCS_DIR = "01-chunked-docs"
+
+# 精确检索时每次参与矩阵乘法的行数，限制内存映射矩阵一次读入的数据量
+SEARCH_BLOCK_ROWS = int(os.getenv("RAG_SEARCH_BLOCK_ROWS", 65536))
+# auto 模式下，参与检索的向量总数达到该值才使用 IVF 近似检索
+IVF_MIN_VECTORS = int(os.getenv("RAG_IVF_MIN_VECTORS", 300000))
+DEFAULT_NPROBE = int(os.getenv("RAG_IVF_NPROBE", 8))
+# 语料索引目录，每个嵌入器一个子目录
+VECTOR_INDEX_DIR = os.getenv("RAG_VECTOR_INDEX_DIR", os.path.join("index", "vectors"))
+# 未收入语料索引的向量（新增、重新向量化或已删除的文件）超过已收录向量的该比例，
+# 或未收录的文件超过该数量时重建语料索引；在此之前未收录的文件逐个精确扫描
+CORPUS_REBUILD_RATIO = float(os.getenv("RAG_CORPUS_REBUILD_RATIO", 0.1))
+CORPUS_MAX_PENDING = int(os.getenv("RAG_CORPUS_MAX_PENDING", 64))
+
+SEARCH_MODES = ("exact", "ivf", "auto")
+
+
+def top_k(scores: np.ndarray, k: int):
+    """返回分数最高的 k 个下标（按分数降序）及其分数"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.argsort(-scores[candidates], kind="stable")
+    indices = candidates[order]
+    return indices, scores[indices]
+
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int, block_rows: int = SEARCH_BLOCK_ROWS):
+    """
+    分块计算内积并维护当前 top-k。向量已做 L2 归一化，内积即余弦相似度。
+    """
+    # 查询与矩阵类型不一致时 NumPy 会把整个矩阵转换一遍
+    query = np.asarray(query, dtype=vectors.dtype)
+    if len(vectors) <= block_rows:
+        # 大多数文档只有一块，省去合并各块结果的开销
+        return top_k(vectors @ query, k)
+    best_indices = np.empty(0, dtype=np.int64)
+    best_scores = np.empty(0, dtype=np.float32)
+    for start in range(0, len(vectors), block_rows):
+        scores = vectors[start:start + block_rows] @ query
+        indices, scores = top_k(scores, k)
+        best_indices = np.concatenate([best_indices, indices + start])
+        best_scores = np.concatenate([best_scores, scores])
+        if len(best_scores) > k:
+            keep, best_scores = top_k(best_scores, k)
+            best_indices = best_indices[keep]
+    return best_indices, best_scores
+
+
+class IVFIndex:
+    """
+    倒排文件（IVF）近似检索：用球面 k-means 把向量划分到 nlist 个簇，
+    查询时只计算与查询最相近的 nprobe 个簇内的向量。
+    簇成员按簇号连续存放在 order 中，offsets[i]:offsets[i + 1] 为第 i 个簇的范围。
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, order: np.ndarray):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.order = order
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, nlist: int = None, iterations: int = 10,
+              sample_size: int = 50000, seed: int = 0, block_rows: int = SEARCH_BLOCK_ROWS):
+        total = len(vectors)
+        rng = np.random.default_rng(seed)
+        nlist = cls.default_nlist(total, nlist)
+        sample_rows = np.sort(rng.choice(total, size=min(total, max(sample_size, nlist)), replace=False))
+        centroids = cls.train(np.asarray(vectors[sample_rows], dtype=np.float32), nlist, iterations, rng)
+        assignments = cls.assign(vectors, centroids, block_rows)
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        return cls(centroids, cls.cluster_offsets(assignments, nlist), order)
+
+    @staticmethod
+    def default_nlist(total: int, nlist: int = None) -> int:
+        if nlist is None:
+            nlist = int(4 * np.sqrt(total))
+        return max(1, min(nlist, total))
+
+    @staticmethod
+    def train(sample: np.ndarray, nlist: int, iterations: int, rng) -> np.ndarray:
+        """在样本上用球面 k-means 训练簇中心"""
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            # 空簇重新随机选一个样本作为中心
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.divide(sums, norms, out=sums, where=norms > 0)
+        return centroids
+
+    @staticmethod
+    def assign(vectors: np.ndarray, centroids: np.ndarray, block_rows: int = SEARCH_BLOCK_ROWS) -> np.ndarray:
+        """每个向量最相近的簇号"""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_rows):
+            block = vectors[start:start + block_rows]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    @staticmethod
+    def cluster_offsets(assignments: np.ndarray, nlist: int) -> np.ndarray:
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=offsets[1:])
+        return offsets
+
+    def search(self, vectors: np.ndarray, query: np.ndarray, k: int, nprobe: int = DEFAULT_NPROBE):
+        query = np.asarray(query, dtype=vectors.dtype)
+        probes, _ = top_k(self.centroids @ query, max(1, nprobe))
+        rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes])
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        # 按行号顺序读取，内存映射时访问更连续
+        rows.sort()
+        indices, scores = top_k(vectors[rows] @ query, k)
+        return rows[indices], scores
+
+    def save(self, path: str) -> None:
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, offsets=self.offsets, order=self.order)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["order"])
+
+
+class VectorStore:
+    """
+    02-embedded-docs 中的一个向量文件。向量矩阵以只读内存映射方式打开，
+    chunk 内容和元数据在返回结果时才从对应的分块文档按需读取。
+    """
+
+    def __init__(self, vectors_path: str):
+        self.vectors_path = vectors_path
+        self.base_path = vectors_path[:-len(".npy")]
+        with open(f"{self.base_path}.json", 'r', encoding='utf-8') as f:
+            self.info = json.load(f)
+        self.name = os.path.basename(vectors_path)
+        self.mtime_ns = os.stat(vectors_path).st_mtime_ns
+        self.vectors, self.chunk_ids, _ = load_embedding(self.base_path)
+        self._document = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def get_chunk(self, chunk_id: int) -> dict:
+        """按 chunk_id 读取来源分块文档中的 chunk，文档或 chunk 不存在时返回 None"""
+        with self._lock:
+            if self._document is None:
+                source_path = os.path.join(CHUNKED_DOCS_DIR, self.info.get("source", ""))
+                if not os.path.isfile(source_path):
+                    return None
+                self._document = open_document(source_path)
+            return self._document.chunk_by_id(chunk_id)
+
+
+
+class CorpusIndex:
+    """
+    同一嵌入器全部向量文件上的检索索引。只有一组 IVF 簇中心，全部向量按簇号重排后拷贝成一个矩阵，
+    offsets[c]:offsets[c + 1] 为第 c 个簇的行，stores / rows 记录每行来自 files 中哪个向量文件的哪一行。
+    向量总数低于 IVF_MIN_VECTORS 时只有一个簇，检索即按块扫描整个矩阵；
+    不论 exact 还是 ivf，检索都只做少数几次矩阵乘法，不按文件循环。
+    矩阵以内存映射方式打开，索引文件按代写入，corpus.json 指向当前一代。
+    """
+
+    def __init__(self, files: list, centroids: np.ndarray, offsets: np.ndarray, stores: np.ndarray,
+                 rows: np.ndarray, vectors: np.ndarray, trained: int):
+        self.files = files          # [{"name", "mtime_ns", "count"}]
+        self.centroids = centroids
+        self.offsets = offsets
+        self.stores = stores
+        self.rows = rows
+        self.vectors = vectors
+        self.trained = trained      # 训练簇中心时的向量总数
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, index_dir: str, stores: list, ivf: bool, centroids: np.ndarray = None, trained: int = 0,
+              sample_size: int = 50000, iterations: int = 10, seed: int = 0):
+        """
+        在 stores 上构建并保存语料索引。ivf 为假时只有一个簇；给出 centroids 时沿用已有簇中心，只重新分配。
+        """
+        counts = np.array([len(store) for store in stores], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(counts)])
+        total = int(starts[-1])
+        dim = stores[0].vectors.shape[1]
+        if not ivf:
+            centroids, trained = np.zeros((1, dim), dtype=np.float32), total
+        elif centroids is None:
+            rng = np.random.default_rng(seed)
+            nlist = IVFIndex.default_nlist(total)
+            sample_rows = np.sort(rng.choice(total, size=min(total, max(sample_size, nlist)), replace=False))
+            sample_stores = np.searchsorted(starts, sample_rows, side="right") - 1
+            sample = np.concatenate([
+                np.asarray(stores[i].vectors[sample_rows[sample_stores == i] - starts[i]], dtype=np.float32)
+                for i in np.unique(sample_stores)
+            ])
+            centroids, trained = IVFIndex.train(sample, nlist, iterations, rng), total
+
+        if len(centroids) == 1:
+            assignments = np.zeros(total, dtype=np.int32)
+        else:
+            assignments = np.concatenate([IVFIndex.assign(store.vectors, centroids) for store in stores])
+        order = np.argsort(assignments, kind="stable").astype(np.int64)
+        store_of = np.repeat(np.arange(len(stores), dtype=np.int32), counts)
+        rows = (np.arange(total, dtype=np.int64) - starts[store_of])[order]
+
+        os.makedirs(index_dir, exist_ok=True)
+        generation = f"{time.time_ns():x}"
+        base_path = os.path.join(index_dir, generation)
+        vectors = np.lib.format.open_memmap(f"{base_path}.vectors.npy", mode="w+", dtype=np.float32, shape=(total, dim))
+        destination = np.empty(total, dtype=np.int64)
+        destination[order] = np.arange(total)
+        for i, store in enumerate(stores):
+            vectors[destination[starts[i]:starts[i + 1]]] = store.vectors
+        vectors.flush()
+        del vectors
+        offsets = IVFIndex.cluster_offsets(assignments, len(centroids))
+        np.savez(f"{base_path}.npz", centroids=centroids, offsets=offsets, stores=store_of[order], rows=rows)
+
+        files = [{"name": store.name, "mtime_ns": store.mtime_ns, "count": len(store)} for store in stores]
+        manifest_path = os.path.join(index_dir, "corpus.json")
+        with open(f"{manifest_path}.tmp", 'w', encoding='utf-8') as f:
+            json.dump({"generation": generation, "trained": trained, "files": files}, f, ensure_ascii=False)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        # 旧的几代已不再被 corpus.json 引用；其他进程已打开的内存映射在删除后仍然有效，删除失败时留到下次重建
+        for path in glob.glob(os.path.join(index_dir, "*.npz")) + glob.glob(os.path.join(index_dir, "*.vectors.npy")):
+            if not os.path.basename(path).startswith(f"{generation}."):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"删除旧的语料索引文件失败: {str(e)}")
+        return cls.load(index_dir)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        """读取已保存的语料索引，不存在或不完整时返回 None"""
+        manifest_path = os.path.join(index_dir, "corpus.json")
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            base_path = os.path.join(index_dir, manifest["generation"])
+            with np.load(f"{base_path}.npz") as data:
+                centroids, offsets, stores, rows = data["centroids"], data["offsets"], data["stores"], data["rows"]
+            vectors = np.load(f"{base_path}.vectors.npy", mmap_mode='r')
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"语料索引 {index_dir} 无法读取，将重新构建: {str(e)}")
+            return None
+        return cls(manifest["files"], centroids, offsets, stores, rows, vectors, manifest["trained"])
+
+    def search(self, query: np.ndarray, k: int, nprobe: int = None, allowed: np.ndarray = None,
+               block_rows: int = SEARCH_BLOCK_ROWS):
+        """
+        返回分数最高的 k 行（矩阵行号）及其分数。nprobe 为 None 或不小于簇数时扫描全部行；
+        allowed 为按 files 下标的布尔数组，为假的文件的行不参与排序。
+        """
+        query = np.asarray(query, dtype=self.vectors.dtype)
+        if nprobe is None or nprobe >= self.nlist:
+            segments = [(start, min(start + block_rows, len(self))) for start in range(0, len(self), block_rows)]
+        else:
+            probes, _ = top_k(self.centroids @ query, max(1, nprobe))
+            # 按行号顺序读取，内存映射时访问更连续
+            segments = [(self.offsets[c], self.offsets[c + 1]) for c in np.sort(probes)]
+        best_indices = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start, stop in segments:
+            if start == stop:
+                continue
+            scores = self.vectors[start:stop] @ query
+            if allowed is not None:
+                scores[~allowed[self.stores[start:stop]]] = -np.inf
+            indices, scores = top_k(scores, k)
+            best_indices = np.concatenate([best_indices, indices + start])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                keep, best_scores = top_k(best_scores, k)
+                best_indices = best_indices[keep]
+        found = np.isfinite(best_scores)
+        return best_indices[found], best_scores[found]
+
+
+class CorpusView(NamedTuple):
+    """语料索引与某一份向量文件列表的对应关系"""
+    corpus: CorpusIndex
+    listing: list        # 对应的向量文件列表
+    files: list          # 与 corpus.files 对齐的 VectorStore，已替换或删除的文件为 None
+    live: np.ndarray     # files 中不为 None 的位置
+    pending: list        # 尚未收入语料索引的向量文件
+
+
+class SearchService:
+    """
+    在已向量化的分块文档上做余弦相似度检索。同一嵌入器的全部向量文件合成一个语料索引（CorpusIndex），
+    auto 模式按参与检索的向量总数选择 exact 或 ivf。
+    """
+
+    def __init__(self, embedded_dir: str = EMBEDDED_DOCS_DIR, index_dir: str = VECTOR_INDEX_DIR):
+        self.embedded_dir = embedded_dir
+        self.index_dir = index_dir
+        self._stores = {}    # 向量文件路径 -> (mtime, VectorStore)
+        self._listings = {}  # 嵌入器 -> (目录修改时间, [VectorStore])
+        self._corpora = {}   # 嵌入器 -> CorpusView
+        self._lock = threading.Lock()
+        self._corpus_lock = threading.Lock()
+
+    def _get_store(self, vectors_path: str) -> VectorStore:
+        mtime = os.path.getmtime(vectors_path)
+        with self._lock:
+            cached = self._stores.get(vectors_path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        try:
+            store = VectorStore(vectors_path)
+        except StaleEmbeddingError as e:
+            # 正在重新向量化：继续使用上一个一致的版本，没有时本次检索跳过该文件
+            logger.warning(str(e))
+            return cached[1] if cached is not None else None
+        with self._lock:
+            self._stores[vectors_path] = (mtime, store)
+        return store
+
+    def _list_stores(self, embedder: str) -> list:
+        """
+        当前的向量文件。目录修改时间不变时沿用上次的列表：EmbedService 用 os.replace 写入，
+        新增、替换和删除向量文件都会更新目录的修改时间；有文件正在写入时不缓存
+        """
+        if not os.path.isdir(self.embedded_dir):
+            return []
+        dir_mtime = os.stat(self.embedded_dir).st_mtime_ns
+        with self._lock:
+            cached = self._listings.get(embedder)
+            if cached is not None and cached[0] == dir_mtime:
+                return cached[1]
+        stores, complete = [], True
+        for vectors_path in sorted(glob.glob(os.path.join(self.embedded_dir, f"*_{embedder}.npy"))):
+            if vectors_path.endswith((".tmp.npy", ".ids.npy")):
+                continue
+            store = self._get_store(vectors_path)
+            if store is None or store.mtime_ns != os.stat(vectors_path).st_mtime_ns:
+                complete = False
+            if store is None or store.info.get("embedder") != embedder or len(store) == 0:
+                continue
+            stores.append(store)
+        if complete:
+            with self._lock:
+                self._listings[embedder] = (dir_mtime, stores)
+        return stores
+
+    @staticmethod
+    def _selected(store: VectorStore, doc_ids) -> bool:
+        return not doc_ids or store.info.get("source") in doc_ids or store.name in doc_ids
+
+    @staticmethod
+    def resolve_mode(mode: str, vector_count: int) -> str:
+        """auto 按参与检索的向量总数选择 exact 或 ivf"""
+        if mode == "auto":
+            return "ivf" if vector_count >= IVF_MIN_VECTORS else "exact"
+        return mode
+
+    def _get_corpus(self, embedder: str, stores: list, ivf: bool) -> CorpusView:
+        """
+        返回 stores 上的语料索引视图。没有索引、需要 IVF 而索引只有一个簇，
+        或未收录和已失效的向量过多时重建；向量总数比训练时翻倍后重新训练簇中心。
+        同一份文件列表的视图会被缓存，检索时不再逐个文件核对
+        """
+        index_dir = os.path.join(self.index_dir, embedder)
+        with self._corpus_lock:
+            view = self._corpora.get(embedder)
+            if view is not None and view.listing is stores and not (ivf and view.corpus.nlist == 1):
+                return view
+            corpus = view.corpus if view is not None else CorpusIndex.load(index_dir)
+            indexed = set()
+            if corpus is not None:
+                indexed = {(f["name"], f["mtime_ns"]) for f in corpus.files}
+            pending = [store for store in stores if (store.name, store.mtime_ns) not in indexed]
+            current = {(store.name, store.mtime_ns) for store in stores}
+            stale = sum(len(store) for store in pending)
+            if corpus is not None:
+                stale += sum(f["count"] for f in corpus.files if (f["name"], f["mtime_ns"]) not in current)
+
+            if (corpus is None or (ivf and corpus.nlist == 1)
+                    or stale > CORPUS_REBUILD_RATIO * len(corpus) or len(pending) > CORPUS_MAX_PENDING):
+                total = sum(len(store) for store in stores)
+                ivf = ivf or (corpus is not None and corpus.nlist > 1)
+                retrain = corpus is None or corpus.nlist == 1 or total > 2 * corpus.trained
+                start = time.perf_counter()
+                corpus = CorpusIndex.build(
+                    index_dir, stores, ivf,
+                    centroids=None if retrain else corpus.centroids,
+                    trained=0 if retrain else corpus.trained
+                )
+                logger.info(f"构建语料索引 {index_dir}: {len(stores)} 个向量文件, {len(corpus)} 个向量, "
+                            f"{corpus.nlist} 个簇, 耗时 {time.perf_counter() - start:.2f}s")
+                pending = []
+
+            by_key = {(store.name, store.mtime_ns): store for store in stores}
+            files = [by_key.get((f["name"], f["mtime_ns"])) for f in corpus.files]
+            view = CorpusView(corpus, stores, files, np.array([store is not None for store in files]), pending)
+            self._corpora[embedder] = view
+            return view
+
+    def search_by_vector(self, query_vector: np.ndarray, top_k: int = 5, doc_ids=None, mode: str = "auto",
+                         nprobe: int = None, embedder: str = DEFAULT_EMBEDDER):
+        """
+        用已向量化的查询检索，返回 (参与检索的向量文件, 按分数降序的 [(分数, 向量文件, 行号), ...])。
+        语料索引上做一次检索，尚未收录的向量文件逐个精确扫描后合并；
+        精确检索且用 doc_ids 限定了少数文件时直接扫描这些文件
+        """
+        all_stores = self._list_stores(embedder)
+        stores = [store for store in all_stores if self._selected(store, doc_ids)]
+        if not stores:
+            return stores, []
+        ivf = self.resolve_mode(mode, sum(len(store) for store in stores)) == "ivf"
+        candidates = []
+        if not ivf and doc_ids:
+            pending = stores
+        else:
+            view = self._get_corpus(embedder, all_stores, ivf)
+            allowed = view.live
+            if doc_ids:
+                allowed = allowed & np.array([store is not None and self._selected(store, doc_ids) for store in view.files])
+            corpus = view.corpus
+            matrix_rows, scores = corpus.search(query_vector, top_k, (nprobe or DEFAULT_NPROBE) if ivf else None,
+                                                None if allowed.all() else allowed)
+            candidates.extend((float(score), view.files[corpus.stores[row]], int(corpus.rows[row]))
+                              for row, score in zip(matrix_rows, scores))
+            pending = [store for store in view.pending if self._selected(store, doc_ids)]
+        for store in pending:
+            rows, scores = exact_search(store.vectors, query_vector, top_k)
+            candidates.extend((float(score), store, int(row)) for row, score in zip(rows, scores))
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return stores, candidates[:top_k]
+
+    def search(self, query: str, top_k: int = 5, doc_ids=None, mode: str = "auto",
+               nprobe: int = None, embedder: str = DEFAULT_EMBEDDER) -> dict:
+        try:
+            if mode not in SEARCH_MODES:
+                raise ValueError(f"Unsupported search mode: {mode}")
+            start = time.perf_counter()
+            query_vector = get_embedder(embedder).embed([query])[0]
+            stores, candidates = self.search_by_vector(query_vector, top_k, doc_ids, mode, nprobe, embedder)
+
+            results = []
+            for score, store, row in candidates:
+                chunk_id = int(store.chunk_ids[row])
+                chunk = store.get_chunk(chunk_id) or {}
+                results.append({
+                    "score": score,
+                    "doc_id": store.info.get("source"),
+                    "filename": store.info.get("filename"),
+                    "content": chunk.get("content", ""),
+                    "metadata": chunk.get("metadata", {"chunk_id": chunk_id})
+                })
+
+            return {
+                "query": query,
+                "mode": mode,
+                "top_k": top_k,
+                "search_mode": self.resolve_mode(mode, sum(len(store) for store in stores)),
+                "searched_vectors": sum(len(store) for store in stores),
+                "elapsed": time.perf_counter() - start,
+                "results": results
+            }
+        except Exception as e:
+            logger.error(f"检索失败: {str(e)}")
+            raise
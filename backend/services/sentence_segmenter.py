@@ -0,0 +1,138 @@
+import re
+from bisect import bisect_left, bisect_right
+
+# 中文句末标点及 ! ?，出现即断句。逐字符用 str.find 查找，比字符集正则扫描整段文本快得多
+CJK_TERMINATORS = "。！？!?…"
+# 句末标点之后仍属于本句的字符（引号、右括号、连续的句末标点）
+TRAILING_CHARS = frozenset('”’」』）)"\'。！？!?….')
+
+# 英文句号：后面必须是空白或文本结尾，因此 3.5、www.example.com 之类不会被断开
+LATIN_STOP = re.compile(r'\.(?=[\s”’"\')]|$)')
+# 空行也视为句子边界
+BLANK_LINE = re.compile(r'\n[ \t　]*\n')
+
+# 以这些词结尾的 "." 不是句末（不区分大小写）
+ABBREVIATIONS = frozenset({
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "no", "nos", "vol", "fig", "p", "pp",
+    "e.g", "i.e", "etc", "vs", "cf", "al", "inc", "ltd", "co", "corp", "dept", "approx",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+})
+
+# "." 前面的一个词（含内部的点，如 e.g）
+WORD_BEFORE_DOT = re.compile(r'([A-Za-z][A-Za-z.]*|\d+)$')
+
+
+def _is_false_stop(text: str, dot_pos: int) -> bool:
+    """判断位于 dot_pos 的 "." 是否属于缩写、单字母缩写或行首的列表编号"""
+    match = WORD_BEFORE_DOT.search(text, max(0, dot_pos - 16), dot_pos)
+    if not match:
+        return False
+    word = match.group(1)
+    if word.lower() in ABBREVIATIONS:
+        return True
+    # 单个大写字母，如人名缩写 J. Smith 或列表编号 A.
+    if len(word) == 1 and word.isupper():
+        return True
+    # 行首的数字编号，如 "1. 标题"
+    if word.isdigit() and len(word) <= 3:
+        line_start = text.rfind("\n", 0, match.start()) + 1
+        return not text[line_start:match.start()].strip()
+    return False
+
+
+def sentence_boundaries(text: str) -> list:
+    """
+    一次扫描整段文本，返回升序排列的句子结束偏移（不含），最后一个总是 len(text)。
+    """
+    length = len(text)
+    ends = []
+    find = text.find
+    for char in CJK_TERMINATORS:
+        pos = find(char)
+        while pos != -1:
+            ends.append(pos + 1)
+            pos = find(char, pos + 1)
+    for match in LATIN_STOP.finditer(text):
+        if not _is_false_stop(text, match.start()):
+            ends.append(match.end())
+    ends.extend(match.end() for match in BLANK_LINE.finditer(text))
+    ends.sort()
+
+    boundaries = []
+    last = 0
+    for end in ends:
+        if end <= last:
+            continue
+        # 把紧跟的引号、括号和连续标点并入本句
+        while end < length and text[end] in TRAILING_CHARS:
+            end += 1
+        boundaries.append(end)
+        last = end
+    if not boundaries or boundaries[-1] != length:
+        boundaries.append(length)
+    return boundaries
+
+
+def sentence_spans(text: str):
+    """逐个产出句子的 (start, end) 偏移，已去掉首尾空白"""
+    start = 0
+    for end in sentence_boundaries(text):
+        span = _strip_span(text, start, end)
+        if span:
+            yield span
+        start = end
+
+
+def _strip_span(text: str, start: int, end: int):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return (start, end) if start < end else None
+
+
+def pack_sentences(text: str, boundaries: list, chunk_size: int, chunk_overlap: int = 0, split_long=None):
+    """
+    把句子打包成不超过 chunk_size 个字符的块，逐个产出去掉首尾空白的 (start, end)。
+    每个块用二分查找定位能容纳的最后一个句子边界，开销与块数而不是句子数成正比；
+    相邻块之间按整句重叠，重叠不超过 chunk_overlap 个字符。
+    单句超过 chunk_size 时交给 split_long(start, end) 再切分。
+    """
+    length = len(text)
+    start = 0
+    prev_end = 0
+    while start < length:
+        limit = start + chunk_size
+        i = bisect_right(boundaries, limit) - 1
+        end = boundaries[i] if i >= 0 else 0
+
+        if end <= prev_end and start < prev_end:
+            # 重叠部分加上下一句就超长了，放弃重叠
+            start = prev_end
+            continue
+
+        if end <= start:
+            # 从 start 开始的这一句本身超过 chunk_size
+            sent_end = boundaries[bisect_right(boundaries, start)]
+            span = _strip_span(text, start, sent_end)
+            if span:
+                if split_long is not None:
+                    yield from split_long(*span)
+                else:
+                    yield span
+            start = prev_end = sent_end
+            continue
+
+        span = _strip_span(text, start, end)
+        if span:
+            yield span
+        prev_end = end
+        if end >= length:
+            break
+
+        next_start = end
+        if chunk_overlap > 0:
+            k = bisect_left(boundaries, end - chunk_overlap)
+            if boundaries[k] > start and boundaries[k] < end:
+                next_start = boundaries[k]
+        start = next_start
@@ -0,0 +1,26 @@
+import re
+
+# 连续的中日韩文字，或连续的英文字母/数字
+TOKEN_PATTERN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[A-Za-z0-9]+')
+
+
+def _is_cjk(char: str) -> bool:
+    return char >= '㐀'
+
+
+def tokenize(text: str) -> list:
+    """
+    中英文混合分词：中文按相邻两字切成二元组（单字时保留单字），
+    英文和数字按词切分并转为小写。
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text):
+        run = match.group(0)
+        if _is_cjk(run[0]):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
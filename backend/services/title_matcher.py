@@ -0,0 +1,48 @@
+import re
+
+_CN_DIGITS = "一二三四五六七八九十"
+_UPPER = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_DIGITS = "0123456789"
+
+# (标题层级, 可能的首字符, 正则)。层级越小越靠上，同一行只取第一个匹配的模式。
+TITLE_PATTERNS = [
+    (1, "第", r'第[一二三四五六七八九十百千万]+[章篇]'),  # 中文章/篇标题
+    (2, "第", r'第[一二三四五六七八九十百千万]+节'),  # 中文节标题
+    (2, _CN_DIGITS, r'[一二三四五六七八九十]+、\s*[^\n]+'),  # 中文顿号标题 (如: 一、标题)
+    (3, "（(", r'[（(][一二三四五六七八九十]+[）)]\s*[^\n]+'),  # 中文括号中文数字标题 (如: （一）标题 或 (一)标题)
+    (4, _DIGITS, r'\d+\.\s+[^\n]+'),  # 数字编号标题 (如: 1. 标题)
+    (4, _UPPER, r'[A-Z]\.\s+[^\n]+'),  # 字母编号标题 (如: A. 标题)
+    (5, "（", r'（\d+）\s*[^\n]+'),  # 中文括号数字标题 (如: （1）标题)
+    (5, _DIGITS, r'\d+\)\s+[^\n]+'),  # 数字括号标题 (如: 1) 标题)
+    (6, _UPPER, r'[A-Z]\)\s+[^\n]+'),  # 字母括号标题 (如: A) 标题)
+    (6, "（(", r'[（(][A-Z][）)]\s*[^\n]+'),  # 中文括号字母标题 (如: （A）标题 或 (A)标题)
+]
+
+
+class TitleMatcher:
+    """
+    标题识别器。按行首字符分派到预编译的组合正则，每个首字符只对应一条
+    由可能匹配的模式组成的分支正则，命名分组给出匹配到的标题层级。
+    """
+
+    def __init__(self, patterns=TITLE_PATTERNS):
+        by_first_char = {}
+        for index, (level, first_chars, pattern) in enumerate(patterns):
+            for char in first_chars:
+                by_first_char.setdefault(char, []).append((index, level, pattern))
+
+        self._levels = {}
+        self._dispatch = {}
+        for char, entries in by_first_char.items():
+            alternation = "|".join(f"(?P<p{index}>{pattern})" for index, _, pattern in entries)
+            self._dispatch[char] = re.compile(alternation)
+            for index, level, _ in entries:
+                self._levels[f"p{index}"] = level
+
+    def match_level(self, line: str) -> int:
+        """返回标题层级，不是标题时返回 0。line 应已去掉首尾空白"""
+        regex = self._dispatch.get(line[:1])
+        if regex is None:
+            return 0
+        match = regex.match(line)
+        return self._levels[match.lastgroup] if match else 0
@@ -1,39 +1,249 @@
-from fastapi import APIRouter, FastAPI, UploadFile, File, Form, HTTPException, Body, Query, Request, Depends
-from services.load_service import LoadService
+from fastapi import APIRouter, FastAPI, UploadFile, File, Form, HTTPException, Body, Query, Request, Depends, Response
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
+from starlette.background import BackgroundTask
+from services.load_service import LoadService, DocumentWriter
+from services.doc_store import document_path, document_stem, open_document, write_document, is_document_file
 from services.chunk_service import ChunkService
-from services.parse_service import ParseService
+from services.parse_service import ParseService, PARSED_DOCS_DIR, PARSING_METHODS
+from services.cache_service import ExtractionCache, ChunkCache, hash_file
+from services.job_service import JobService
+from services.manifest_service import ManifestService, DOC_DIRS
+from services.embed_service import EmbedService, EMBEDDED_DOCS_DIR, DEFAULT_EMBEDDER, DEFAULT_BATCH_SIZE
+from services.search_service import SearchService, SEARCH_MODES
+from services.bm25_index import BM25Index
+from services.dedup_index import DedupIndex, DEDUP_MODE, DEDUP_MODES
+from services.page_normalizer import PageNormalizer, NORMALIZE_PAGES
+from services.metrics_service import STAGE_SECONDS, BYTES_PROCESSED
+from services.profile_service import ProfileService, PROFILE_HEADER, PROFILE_ID_HEADER
 import os
 import json
+import hashlib
+import hmac
+import tempfile
+import time
 from datetime import datetime
+from functools import lru_cache
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# 创建服务实例
-load_service = LoadService()
+# 上传文件按块写入临时目录，单个文件大小上限由 RAG_MAX_UPLOAD_MB 配置
+UPLOAD_DIR = "temp"
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("RAG_MAX_UPLOAD_MB", 200)) * 1024 * 1024
+# /admin 接口需要在请求头 X-Admin-Token 中提供该值，未设置时 /admin 接口全部拒绝访问
+ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN")
+# 分页读取 chunk 时每页的默认条数和上限，/load、/chunk 的摘要模式也只返回第一页
+DOCS_PAGE_SIZE = int(os.getenv("RAG_DOCS_PAGE_SIZE", 50))
+DOCS_MAX_PAGE_SIZE = int(os.getenv("RAG_DOCS_MAX_PAGE_SIZE", 500))
+# 保持打开（已读取头尾记录）的文档数
+DOCS_OPEN_CACHE_SIZE = int(os.getenv("RAG_DOCS_OPEN_CACHE_SIZE", 16))
+
+# 创建服务实例。各服务不保存单次请求的结果，所有请求共享同一实例
+extraction_cache = ExtractionCache()
+chunk_cache = ChunkCache()
+job_service = JobService()
+manifest_service = ManifestService()
+load_service = LoadService(cache=extraction_cache, manifest=manifest_service)
 chunk_service = ChunkService()
 parse_service = ParseService()
+search_service = SearchService()
+bm25_index = BM25Index()
+dedup_index = DedupIndex()
+page_normalizer = PageNormalizer()
+profile_service = ProfileService()
 
-@router.post("/load")
-async def load(   
-    file: UploadFile = File(...),
-    loading_method: str = Form(...),
-    strategy: str = Form(None),
-    chunking_strategy: str = Form(None),
-    chunking_options: str = Form(None)
-):
+
+def _page_to_chunk(idx: int, page: dict) -> dict:
+    """把加载得到的一页转换为已加载文档中的一个 chunk"""
+    # 统计字数（同时支持中英文）
+    text = page["text"]
+    word_count = len([char for char in text if char.strip()])  # 去除空白字符后统计字符数
+    
+    chunk_metadata = {
+        "chunk_id": idx,
+        "page_number": page["page"],
+        "page_range": str(page["page"]),
+        "word_count": word_count
+    }
+    if "metadata" in page:
+        chunk_metadata.update(page["metadata"])
+    
+    return {
+        "content": page["text"],
+        "metadata": chunk_metadata
+    }
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _require_upload(file, loading_method):
+    """解析接口未提供 doc_id 时必须上传文件并指定加载方法"""
+    if file is None or not loading_method:
+        raise HTTPException(status_code=400, detail="参数错误: 需要提供 doc_id，或上传文件并指定 loading_method")
+
+
+async def _save_upload(file: UploadFile):
+    """
+    把上传文件按块复制到 temp 目录下唯一命名的临时文件，同时计算 SHA-256。
+    超过 MAX_UPLOAD_BYTES 时立即停止并返回 413，任何异常都会删除临时文件。
+    返回 (临时文件路径, 内容哈希)。
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"文件超过大小上限 {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"
+    )
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise too_large
+    
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    suffix = os.path.splitext(file.filename or "")[1]
+    fd, temp_path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=UPLOAD_DIR)
+    sha256 = hashlib.sha256()
+    size = 0
+    start_time = time.perf_counter()
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            while True:
+                block = await file.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > MAX_UPLOAD_BYTES:
+                    raise too_large
+                sha256.update(block)
+                buffer.write(block)
+    except BaseException:
+        _remove_quietly(temp_path)
+        raise
+    STAGE_SECONDS.observe(time.perf_counter() - start_time, stage="upload", method="")
+    BYTES_PROCESSED.inc(size, stage="upload", method="")
+    return temp_path, sha256.hexdigest()
+
+
+def _remove_when_done(job, temp_path: str) -> None:
+    """任务结束（包括开始前就被取消）后删除临时文件"""
+    job.future.add_done_callback(lambda _: _remove_quietly(temp_path))
+
+
+def _json_response(fn, *args, **kwargs) -> JSONResponse:
+    """执行 fn 并在当前（工作）线程中完成 JSON 序列化"""
+    result = fn(*args, **kwargs)
+    name = fn.__name__.replace("_run_", "", 1)
+    with STAGE_SECONDS.time(stage="response", method=name):
+        return JSONResponse(result)
+
+
+def _profile_id(request: Request, profile: str = Query(None)):
+    """请求头 X-Profile 或查询参数 profile 要求分析、或被抽样时返回 profile_id"""
+    return profile_service.new_profile_id(request.headers.get(PROFILE_HEADER), profile)
+
+
+def _profiled_response(profile_id, fn, *args) -> JSONResponse:
+    """profile_id 不为空时在性能分析下执行，并在响应头 X-Profile-Id 中返回分析结果的 id"""
+    if profile_id is None:
+        return _json_response(fn, *args)
+    kind = fn.__name__.replace("_run_", "", 1)
+    response = profile_service.run(profile_id, kind, _json_response, fn, *args)
+    response.headers[PROFILE_ID_HEADER] = profile_id
+    return response
+
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="未配置 RAG_ADMIN_TOKEN，管理接口已禁用")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        raise HTTPException(status_code=403, detail="需要管理员令牌")
+
+
+def _page_size(value) -> int:
+    if value in (None, ""):
+        return DOCS_PAGE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        size = 0
+    if not 1 <= size <= DOCS_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"参数错误: page_size 必须在 1 到 {DOCS_MAX_PAGE_SIZE} 之间")
+    return size
+
+
+def _next_cursor(start: int, count: int, total: int):
+    """游标就是下一页第一个 chunk 的下标，没有下一页时为 None"""
+    return str(start + count) if start + count < total else None
+
+
+def _summarize(document_data: dict, doc_id: str, kind: str, page_size: int) -> dict:
+    """文档字段加第一页 chunk，其余通过 /docs/{doc_id}/chunks 按游标读取"""
+    chunks = document_data.get("chunks", [])
+    summary = {k: v for k, v in document_data.items() if k != "chunks"}
+    summary.update({
+        "doc_id": doc_id,
+        "kind": kind,
+        "total_chunks": len(chunks),
+        "chunks": chunks[:page_size],
+        "next_cursor": _next_cursor(0, min(page_size, len(chunks)), len(chunks))
+    })
+    return summary
+
+
+@lru_cache(maxsize=DOCS_OPEN_CACHE_SIZE)
+def _open_stored_document(path: str, mtime_ns: int, size: int):
+    return open_document(path)
+
+
+def _resolve_document(doc_id: str, kind: str = None):
+    """按 doc_id（文件名）查找文档，返回 (kind, 路径, StoredDocument)。未指定 kind 时先找已加载文档"""
+    if kind is not None and kind not in DOC_DIRS:
+        raise HTTPException(status_code=400, detail=f"参数错误: kind 只能是 {', '.join(DOC_DIRS)}")
+    if os.path.basename(doc_id) != doc_id or not is_document_file(doc_id):
+        raise HTTPException(status_code=404, detail="文档不存在")
+    for candidate in ([kind] if kind else DOC_DIRS):
+        path = os.path.join(DOC_DIRS[candidate], doc_id)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # 文档写入后不再修改，按修改时间和大小缓存已打开的文档
+        return candidate, path, _open_stored_document(path, stat.st_mtime_ns, stat.st_size)
+    raise HTTPException(status_code=404, detail="文档不存在")
+
+
+def _etag(path: str, *parts) -> str:
+    """由文档文件的修改时间、大小和请求参数生成弱 ETag（响应可能被 gzip 压缩）"""
+    stat = os.stat(path)
+    key = ":".join(str(part) for part in (os.path.basename(path), stat.st_mtime_ns, stat.st_size) + parts)
+    return f'W/"{hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+
+def _conditional_json(request: Request, etag: str, build) -> Response:
+    """If-None-Match 命中时返回 304，不读取文档内容；否则调用 build 生成响应"""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(build(), headers=headers)
+
+
+def _run_load(temp_path, filename, loading_method, strategy=None, chunking_strategy=None, chunking_options=None, workers=None, incremental=True, file_hash=None, summary=False, page_size=None, progress=None):
+    """加载PDF并保存为已加载文档，在线程池中执行。summary 为真时 loaded_content 只包含第一页 chunk"""
     try:
-        # 保存上传的文件
-        temp_path = os.path.join("temp", file.filename)
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
         # 准备元数据
         metadata = {
-            "filename": file.filename,
+            "filename": filename,
             "total_chunks": 0,  
             "total_pages": 0,   
             "loading_method": loading_method,
@@ -46,41 +256,26 @@ async def load(
         if chunking_options:
             chunking_options_dict = json.loads(chunking_options)
         
-        loading_service = LoadService()
-        raw_text = loading_service.load_pdf(
+        # 同名文档已有上一版本时只重新提取有变化的页
+        previous_doc = load_service.find_previous_doc(filename, loading_method) if incremental else None
+        result = load_service.load_pdf(
             temp_path, 
             loading_method, 
             strategy=strategy,
             chunking_strategy=chunking_strategy,
-            chunking_options=chunking_options_dict
+            chunking_options=chunking_options_dict,
+            workers=workers,
+            file_hash=file_hash,
+            progress=progress,
+            previous_doc=previous_doc
         )
         
-        metadata["total_pages"] = loading_service.get_total_pages()
-        
-        page_map = loading_service.get_page_map()
+        metadata["total_pages"] = len(result.page_map)
         
-        chunks = []
-        for idx, page in enumerate(page_map, 1):
-            # 统计字数（同时支持中英文）
-            text = page["text"]
-            word_count = len([char for char in text if char.strip()])  # 去除空白字符后统计字符数
-            
-            chunk_metadata = {
-                "chunk_id": idx,
-                "page_number": page["page"],
-                "page_range": str(page["page"]),
-                "word_count": word_count
-            }
-            if "metadata" in page:
-                chunk_metadata.update(page["metadata"])
-            
-            chunks.append({
-                "content": page["text"],
-                "metadata": chunk_metadata
-            })
+        chunks = [_page_to_chunk(idx, page) for idx, page in enumerate(result.page_map.pages(), 1)]
         
-        filepath = loading_service.save_document(
-            filename=file.filename,
+        filepath, document_data = load_service.save_document(
+            filename=filename,
             chunks=chunks,
             metadata=metadata,
             loading_method=loading_method,
@@ -88,102 +283,233 @@ async def load(
             chunking_strategy=chunking_strategy,
         )
         
-        with open(filepath, "r", encoding="utf-8") as f:
-            document_data = json.load(f)
-        
+        if summary:
+            document_data = _summarize(document_data, os.path.basename(filepath), "loaded", page_size)
+        return {
+            "loaded_content": document_data,
+            "filepath": filepath,
+            "extraction": result.stats
+        }
+    finally:
         # 清理临时文件
-        os.remove(temp_path)
-        
-        return {"loaded_content": document_data, "filepath": filepath}
-    except Exception as e:
-        logger.error(f"加载错误: {str(e)}")
-        raise
-    
+        _remove_quietly(temp_path)
 
-@router.post("/chunk")
-async def chunk_document(data: dict = Body(...)):
-    try:
-        doc_id = data.get("doc_id")
-        chunking_option = data.get("chunking_option")
-        chunk_size = data.get("chunk_size", 1000)
-        print(f"doc_id: {data}")
-        print(f"chunking_option: {chunking_option}")
-        print(f"chunk_size: {chunk_size}")
-        
-        if not doc_id or not chunking_option:
-            raise HTTPException(
-                status_code=400, 
-                detail="参数错误: doc_id 和 chunking_option 不能为空"
-            )
-        
-        # 读取已加载的文档
-        file_path = os.path.join("01-loaded-docs", doc_id)
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="文档不存在")
-            
-        with open(file_path, 'r', encoding='utf-8') as f:
-            doc_data = json.load(f)
-            
-        # 构建页面映射
-        page_map = [
-            {
-                'page': chunk['metadata']['page_number'],
-                'text': chunk['content']
-            }
-            for chunk in doc_data['chunks']
-        ]
-            
-        # 准备元数据
-        metadata = {
-            "filename": doc_data['filename'],
-            "loading_method": doc_data['loading_method'],
-            "total_pages": doc_data['total_pages']
-        }
-            
-        chunking_service = ChunkService()
-        result = chunking_service.chunk_text(
-            text="", 
-            method=chunking_option,
-            metadata=metadata,
-            page_map=page_map,
-            chunk_size=chunk_size
+
+def _normalize_pages(page_map, normalize):
+    """按需去掉页眉页脚并修正折行，返回 (page_map, 统计)；不规整时统计为 None"""
+    if normalize is None:
+        normalize = NORMALIZE_PAGES
+    if not normalize:
+        return page_map, None
+    return page_normalizer.normalize(page_map)
+
+
+def _cached_chunk_result(cache_key: str):
+    """
+    返回分块缓存中的结果。分块文件已不存在，或文件头记录的缓存键、chunk 数与缓存结果不一致
+    （文件被其他分块结果覆盖）时视为未命中。
+    """
+    cached = chunk_cache.get(cache_key)
+    if cached is None:
+        return None
+    try:
+        _, _, stored = _resolve_document(os.path.basename(cached["output_path"]), "chunked")
+    except HTTPException:
+        return None
+    if stored.metadata.get("cache_key", cache_key) != cache_key or len(stored) != cached["result"]["total_chunks"]:
+        return None
+    return cached
+
+
+def _run_chunk(data: dict, progress=None):
+    """对已加载文档分块并保存结果，在线程池中执行"""
+    doc_id = data.get("doc_id")
+    chunking_option = data.get("chunking_option")
+    chunk_size = data.get("chunk_size", 1000)
+    chunk_overlap = data.get("chunk_overlap")
+    logger.debug(f"分块请求: {data}")
+    
+    if not doc_id or not chunking_option:
+        raise HTTPException(
+            status_code=400, 
+            detail="参数错误: doc_id 和 chunking_option 不能为空"
         )
+    # summary 为真时只返回文档字段和第一页 chunk
+    summary = bool(data.get("summary"))
+    page_size = _page_size(data.get("page_size"))
+    
+    # 读取已加载的文档
+    file_path = os.path.join("01-loaded-docs", doc_id)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="文档不存在")
+    
+    # 相同文档内容、方法和参数的分块结果直接复用，不再重复分块和写文件
+    record = manifest_service.get("loaded", doc_id)
+    content_hash = record["content_hash"] if record else hash_file(file_path)
+    # 近重复 chunk 的处理方式：off、mark（标记 duplicate_of）或 collapse（移除重复 chunk）
+    dedup = data.get("dedup") or DEDUP_MODE
+    if dedup not in DEDUP_MODES:
+        raise HTTPException(status_code=400, detail=f"参数错误: dedup 只能是 {', '.join(DEDUP_MODES)}")
+    # 分块前是否去掉页眉页脚并修正折行，已加载文档本身保持原样
+    normalize = data.get("normalize")
+    normalize = NORMALIZE_PAGES if normalize is None else bool(normalize)
+    # 词法索引默认只保留同一已加载文档最新的分块结果，keep_previous 为真时与此前的分块结果并存
+    keep_previous = bool(data.get("keep_previous"))
+    size_params = {}
+    if chunking_option in ("fixed_size", "by_sentences"):
+        size_params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    cache_key = chunk_cache.make_key(content_hash, chunking_option, dedup=dedup, normalize=normalize, **size_params)
+    cached = _cached_chunk_result(cache_key)
+    if cached is not None:
+        # 缓存中可能是较早的分块结果：并存时补入索引；否则只在该文档还没有任何分块结果被索引时加入，不回退到旧结果
+        if keep_previous or not bm25_index.documents_for(doc_id, cached["result"]["filename"]):
+            bm25_index.add_document(os.path.basename(cached["output_path"]), cached["result"], source=doc_id,
+                                    replace=False)
+        if progress is not None:
+            progress(cached["result"]["total_pages"], cached["result"]["total_pages"])
+        if summary:
+            return _summarize(cached["result"], os.path.basename(cached["output_path"]), "chunked", page_size)
+        return cached["result"]
         
-        # 生成输出文件名
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        base_name = doc_data['filename'].replace('.pdf', '').split('_')[0]
-        output_filename = f"{base_name}_{chunking_option}_{timestamp}.json"
-        
-        output_path = os.path.join("01-chunked-docs", output_filename)
-        os.makedirs("01-chunked-docs", exist_ok=True)
+    loaded_doc = open_document(file_path)
+    doc_data = loaded_doc.metadata
         
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+    # 构建页面映射
+    page_map, normalization = _normalize_pages(loaded_doc.page_map(), normalize)
+    if progress is not None:
+        progress(0, len(page_map))
         
-        return result
+    # 准备元数据
+    metadata = {
+        "filename": doc_data['filename'],
+        "loading_method": doc_data['loading_method'],
+        "total_pages": doc_data['total_pages']
+    }
         
-    except Exception as e:
-        logger.error(f"分块错误: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    result = chunk_service.chunk_text(
+        text="", 
+        method=chunking_option,
+        metadata=metadata,
+        page_map=page_map,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap
+    )
+    if normalization is not None:
+        result["page_normalization"] = normalization
+    
+    # 生成输出文件名，带上缓存键前缀，同一秒内以不同参数分块同一文档时不会写到同一个文件
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    base_name = doc_data['filename'].replace('.pdf', '').split('_')[0]
+    output_path = document_path("01-chunked-docs", f"{base_name}_{chunking_option}_{timestamp}_{cache_key[:8]}")
+    output_filename = os.path.basename(output_path)
+    # 与其他已加载文档的分块结果比较，重复 chunk 指向规范 chunk，向量化和词法索引都会跳过它们
+    dedup_update = dedup_index.mark_duplicates(output_filename, result, source=doc_id, mode=dedup,
+                                               replace=not keep_previous)
+    
+    size = write_document(output_path, {**result, "cache_key": cache_key}, method=chunking_option)
+    BYTES_PROCESSED.inc(size, stage="write", method=chunking_option)
+    manifest_service.record("chunked", output_path, {k: v for k, v in result.items() if k != "chunks"})
+    chunk_cache.put(cache_key, {"output_path": output_path, "result": result})
+    # 同一已加载文档重新分块后默认替换其词法索引段和去重段；文件写入成功后才更新去重索引
+    bm25_index.add_document(output_filename, result, source=doc_id, replace=not keep_previous)
+    _resolve_stale_duplicates(dedup_index.commit(dedup_update))
+    
+    if progress is not None:
+        progress(len(page_map), len(page_map))
+    if summary:
+        return _summarize(result, output_filename, "chunked", page_size)
+    return result
 
-@router.post("/parse")
-async def parse(
-    file: UploadFile = File(...),
-    loading_method: str = Form(...),
-    strategy: str = Form(None),
-    chunking_strategy: str = Form(None),
-    chunking_options: str = Form(None)
-):
+
+def _resolve_stale_duplicates(stale: dict) -> None:
+    """重新解析指向已移除去重段的重复标记，改写受影响的已分块文档并更新词法索引、分块缓存和清单"""
+    for chunked_doc_id, stale_ids in stale.items():
+        path = os.path.join(DOC_DIRS["chunked"], chunked_doc_id)
+        if not os.path.isfile(path):
+            continue
+        document_data = open_document(path).to_dict()
+        update = dedup_index.resolve_stale(chunked_doc_id, document_data, stale_ids)
+        if update is None:
+            continue
+        method = document_data.get("chunking_method", "")
+        size = write_document(path, document_data, method=method)
+        BYTES_PROCESSED.inc(size, stage="write", method=method)
+        result = {k: v for k, v in document_data.items() if k != "cache_key"}
+        manifest_service.record("chunked", path, {k: v for k, v in result.items() if k != "chunks"})
+        if document_data.get("cache_key"):
+            chunk_cache.put(document_data["cache_key"], {"output_path": path, "result": result})
+        dedup_index.commit(update)
+        # 标记变化后重复 chunk 集合不同，已建立词法索引的文档按新内容重建其段
+        if bm25_index.remove_document(chunked_doc_id):
+            bm25_index.add_document(chunked_doc_id, result, source=update.source, replace=False)
+        logger.info(f"已重新解析 {chunked_doc_id} 中指向 {', '.join(sorted(stale_ids))} 的重复标记")
+
+
+def _run_embed(data: dict, progress=None):
+    """对已分块文档做向量化，在线程池中执行"""
+    doc_id = data.get("doc_id")
+    if not doc_id:
+        raise HTTPException(status_code=400, detail="参数错误: doc_id 不能为空")
+    
+    # 与其他按 doc_id 读取文档的接口一样只接受 01-chunked-docs 中的文件名
+    _, file_path, _ = _resolve_document(doc_id, "chunked")
+    
+    return EmbedService().embed_document(
+        file_path,
+        embedder=data.get("embedder") or DEFAULT_EMBEDDER,
+        batch_size=int(data.get("batch_size") or DEFAULT_BATCH_SIZE),
+        progress=progress
+    )
+
+
+def _run_search(data: dict):
+    """向量检索，在线程池中执行"""
+    query = (data.get("query") or "").strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="参数错误: query 不能为空")
+    
+    mode = data.get("mode") or "auto"
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"参数错误: mode 只能是 {', '.join(SEARCH_MODES)}")
+    
+    top_k = int(data.get("top_k") or 5)
+    if top_k < 1:
+        raise HTTPException(status_code=400, detail="参数错误: top_k 必须大于 0")
+    
+    nprobe = data.get("nprobe")
+    return search_service.search(
+        query,
+        top_k=top_k,
+        doc_ids=data.get("doc_ids"),
+        mode=mode,
+        nprobe=int(nprobe) if nprobe else None,
+        embedder=data.get("embedder") or DEFAULT_EMBEDDER
+    )
+
+
+def _run_bm25_search(data: dict):
+    """BM25 词法检索，在线程池中执行"""
+    query = (data.get("query") or "").strip()
+    if not query:
+        raise HTTPException(status_code=400, detail="参数错误: query 不能为空")
+    
+    top_k = int(data.get("top_k") or 5)
+    if top_k < 1:
+        raise HTTPException(status_code=400, detail="参数错误: top_k 必须大于 0")
+    
+    return {
+        "query": query,
+        "top_k": top_k,
+        "results": bm25_index.search(query, top_k=top_k, doc_ids=data.get("doc_ids"))
+    }
+
+
+def _run_parse(temp_path, filename, loading_method, strategy=None, chunking_strategy=None, chunking_options=None, file_hash=None, normalize=None, progress=None):
+    """加载并解析PDF，在线程池中执行"""
     try:
-        # 保存上传的文件
-        temp_path = os.path.join("temp", file.filename)
-        with open(temp_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
         # 准备元数据
         metadata = {
-            "filename": file.filename,
+            "filename": filename,
             "total_pages": 0,
             "loading_method": loading_method,
             "loading_strategy": strategy,
@@ -191,63 +517,507 @@ async def parse(
         }
         
         # 使用 LoadService 加载和解析 PDF
-        loading_service = LoadService()
         chunking_options_dict = None
         if chunking_options:
             chunking_options_dict = json.loads(chunking_options)
             
-        raw_text = loading_service.load_pdf(
+        result = load_service.load_pdf(
             temp_path, 
             loading_method, 
             strategy=strategy,
             chunking_strategy=chunking_strategy,
-            chunking_options=chunking_options_dict
+            chunking_options=chunking_options_dict,
+            file_hash=file_hash,
+            progress=progress
         )
         
-        metadata["total_pages"] = loading_service.get_total_pages()
-        page_map = loading_service.get_page_map()
+        metadata["total_pages"] = len(result.page_map)
+        
+        page_map, normalization = _normalize_pages(result.page_map, normalize)
         
         # 使用 ParseService 进行解析
-        parse_service = ParseService()
-        parsed_result = parse_service.parse_pdf(
-            text=raw_text,
+        parsed = parse_service.parse_pdf(
+            text=result.message,
             method=chunking_strategy,
             metadata=metadata,
             page_map=page_map
         )
-        
+        if normalization is not None:
+            parsed["metadata"]["page_normalization"] = normalization
+        return parsed
+    finally:
         # 清理临时文件
-        os.remove(temp_path)
-        
-        return parsed_result
-        
+        _remove_quietly(temp_path)
+
+
+def _run_parse_loaded(doc_id, chunking_strategy, normalize=None, persist=True, progress=None):
+    """
+    直接从已加载文档解析，不再上传和提取PDF，在线程池中执行。
+    persist 为真时结果保存在 01-parsed-docs，同一文档、方法和规整选项的重复解析直接读取保存的结果
+    """
+    if chunking_strategy not in PARSING_METHODS:
+        raise HTTPException(status_code=400, detail=f"参数错误: chunking_strategy 只能是 {', '.join(PARSING_METHODS)}")
+    _, loaded_path, loaded_doc = _resolve_document(doc_id, "loaded")
+    normalize = NORMALIZE_PAGES if normalize is None else normalize
+    suffix = "" if normalize else "_raw"
+    output_path = document_path(PARSED_DOCS_DIR, f"{document_stem(doc_id)}_{chunking_strategy}{suffix}")
+    
+    # 已加载文档写入后不再修改，比它新的解析结果可以直接复用
+    if persist and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(loaded_path):
+        parsed_doc = open_document(output_path)
+        total_pages = parsed_doc.metadata["metadata"]["total_pages"]
+        if progress is not None:
+            progress(total_pages, total_pages)
+        return {"metadata": parsed_doc.metadata["metadata"], "content": list(parsed_doc.iter_chunks())}
+    
+    page_map = loaded_doc.page_map()
+    if progress is not None:
+        progress(0, len(page_map))
+    page_map, normalization = _normalize_pages(page_map, normalize)
+    parsed = parse_service.parse_pdf(
+        text="",
+        method=chunking_strategy,
+        metadata={"filename": loaded_doc.metadata.get("filename", "")},
+        page_map=page_map,
+        doc_id=doc_id
+    )
+    if normalization is not None:
+        parsed["metadata"]["page_normalization"] = normalization
+    
+    if persist:
+        size = write_document(output_path, {"metadata": parsed["metadata"], "chunks": parsed["content"]},
+                              method=chunking_strategy)
+        BYTES_PROCESSED.inc(size, stage="write", method=chunking_strategy)
+    if progress is not None:
+        progress(len(page_map), len(page_map))
+    return parsed
+
+
+@router.post("/load")
+async def load(   
+    file: UploadFile = File(...),
+    loading_method: str = Form(...),
+    strategy: str = Form(None),
+    chunking_strategy: str = Form(None),
+    chunking_options: str = Form(None),
+    workers: int = Form(None),
+    incremental: bool = Form(True),
+    summary: bool = Form(False),
+    page_size: int = Form(None),
+    profile_id: str = Depends(_profile_id)
+):
+    """summary 为真时 loaded_content 只返回文档字段和前 page_size 个 chunk，其余用 /docs/{doc_id}/chunks 分页读取"""
+    page_size = _page_size(page_size)
+    temp_path, file_hash = await _save_upload(file)
+    try:
+        return await job_service.run(
+            _profiled_response, profile_id, _run_load, temp_path, file.filename, loading_method,
+            strategy, chunking_strategy, chunking_options, workers, incremental, file_hash,
+            summary, page_size
+        )
+    except Exception as e:
+        logger.error(f"加载错误: {str(e)}")
+        raise
+    finally:
+        _remove_quietly(temp_path)
+    
+
+@router.post("/load/stream")
+async def load_stream(
+    file: UploadFile = File(...),
+    loading_method: str = Form(...),
+    strategy: str = Form(None),
+    chunking_strategy: str = Form(None),
+    chunking_options: str = Form(None),
+    workers: int = Form(None)
+):
+    """
+    流式加载：每提取完一页就返回一行 NDJSON 记录并追加写入磁盘，
+    最后返回一条汇总记录。
+    """
+    temp_path, file_hash = await _save_upload(file)
+    
+    try:
+        chunking_options_dict = json.loads(chunking_options) if chunking_options else None
+    except Exception:
+        _remove_quietly(temp_path)
+        raise
+    
+    def generate():
+        stats = {}
+        writer = DocumentWriter(
+            filename=file.filename,
+            loading_method=loading_method,
+            strategy=strategy,
+            chunking_strategy=chunking_strategy,
+            manifest=manifest_service
+        )
+        try:
+            pages = load_service.iter_pages(
+                temp_path,
+                loading_method,
+                strategy=strategy,
+                chunking_strategy=chunking_strategy,
+                chunking_options=chunking_options_dict,
+                workers=workers,
+                file_hash=file_hash,
+                stats=stats
+            )
+            for idx, page in enumerate(pages, 1):
+                chunk = _page_to_chunk(idx, page)
+                writer.write_chunk(chunk)
+                yield json.dumps({"type": "page", "chunk": chunk}, ensure_ascii=False) + "\n"
+            
+            filepath = writer.close(total_pages=writer.total_chunks)
+            yield json.dumps({
+                "type": "summary",
+                "filename": file.filename,
+                "filepath": filepath,
+                "total_pages": writer.total_chunks,
+                "total_chunks": writer.total_chunks,
+                "extraction": stats
+            }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"流式加载错误: {str(e)}")
+            writer.abort()
+            yield json.dumps({"type": "error", "detail": str(e)}, ensure_ascii=False) + "\n"
+        finally:
+            # 清理临时文件
+            _remove_quietly(temp_path)
+    
+    # 客户端在开始读取前断开时 generate 不会执行，由后台任务兜底删除
+    return StreamingResponse(generate(), media_type="application/x-ndjson",
+                             background=BackgroundTask(_remove_quietly, temp_path))
+    
+
+@router.post("/chunk")
+async def chunk_document(data: dict = Body(...), profile_id: str = Depends(_profile_id)):
+    try:
+        return await job_service.run(_profiled_response, profile_id, _run_chunk, data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"分块错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/parse")
+async def parse(
+    file: UploadFile = File(None),
+    loading_method: str = Form(None),
+    strategy: str = Form(None),
+    chunking_strategy: str = Form(None),
+    chunking_options: str = Form(None),
+    normalize: bool = Form(None),
+    doc_id: str = Form(None),
+    persist: bool = Form(True),
+    profile_id: str = Depends(_profile_id)
+):
+    """上传 PDF 解析，或提供 doc_id 直接解析已加载文档"""
+    if doc_id:
+        try:
+            return await job_service.run(
+                _profiled_response, profile_id, _run_parse_loaded, doc_id, chunking_strategy, normalize, persist
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"解析错误: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+    _require_upload(file, loading_method)
+    temp_path, file_hash = await _save_upload(file)
+    try:
+        return await job_service.run(
+            _profiled_response, profile_id, _run_parse, temp_path, file.filename, loading_method,
+            strategy, chunking_strategy, chunking_options, file_hash, normalize
+        )
     except Exception as e:
         logger.error(f"解析错误: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        _remove_quietly(temp_path)
 
 @router.get("/loaded-docs")
-async def get_loaded_docs():
+async def get_loaded_docs(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    filename: str = Query(None),
+    loading_method: str = Query(None)
+):
+    """从清单索引分页查询已加载文档，总数放在 X-Total-Count 响应头中"""
+    try:
+        records, total = manifest_service.list(
+            kind="loaded",
+            filename=filename,
+            loading_method=loading_method,
+            offset=offset,
+            limit=limit
+        )
+        response.headers["X-Total-Count"] = str(total)
+        return [
+            {
+                "filename": record["filename"] or record["doc_id"],
+                "filepath": record["doc_id"],
+                "loading_method": record["loading_method"],
+                "total_pages": record["total_pages"],
+                "total_chunks": record["total_chunks"],
+                "byte_size": record["byte_size"],
+                "content_hash": record["content_hash"],
+                "created_at": record["created_at"],
+                "updated_at": record["updated_at"]
+            }
+            for record in records
+        ]
+    except Exception as e:
+        logger.error(f"获取文档列表失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e)) 
+
+
+@router.get("/chunked-docs")
+async def get_chunked_docs(
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(None, ge=1),
+    filename: str = Query(None),
+    chunking_method: str = Query(None)
+):
+    """从清单索引分页查询已分块文档"""
+    try:
+        records, total = manifest_service.list(
+            kind="chunked",
+            filename=filename,
+            chunking_method=chunking_method,
+            offset=offset,
+            limit=limit
+        )
+        response.headers["X-Total-Count"] = str(total)
+        return [
+            {
+                "filename": record["filename"] or record["doc_id"],
+                "filepath": record["doc_id"],
+                "chunking_method": record["chunking_method"],
+                "total_chunks": record["total_chunks"],
+                "created_at": record["created_at"]
+            }
+            for record in records
+        ]
+    except Exception as e:
+        logger.error(f"获取分块文档列表失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/embed")
+async def embed_document(data: dict = Body(...)):
     try:
-        docs_dir = "01-loaded-docs"
-        if not os.path.exists(docs_dir):
+        return await job_service.run(_json_response, _run_embed, data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"向量化错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/docs/{doc_id}")
+def get_document(request: Request, doc_id: str, kind: str = Query(None)):
+    """文档字段（不含 chunk），只读取头尾记录"""
+    kind, path, document = _resolve_document(doc_id, kind)
+    return _conditional_json(request, _etag(path, "metadata"), lambda: {
+        **document.metadata,
+        "doc_id": doc_id,
+        "kind": kind,
+        "total_chunks": len(document)
+    })
+
+
+@router.get("/docs/{doc_id}/chunks")
+def get_document_chunks(
+    request: Request,
+    doc_id: str,
+    cursor: str = Query(None),
+    limit: int = Query(DOCS_PAGE_SIZE, ge=1, le=DOCS_MAX_PAGE_SIZE),
+    kind: str = Query(None)
+):
+    """按游标分页读取 chunk，只解压涉及的块；next_cursor 为 None 表示已到末尾"""
+    kind, path, document = _resolve_document(doc_id, kind)
+    cursor = cursor or "0"
+    start = int(cursor) if cursor.isdigit() else -1
+    if not 0 <= start <= len(document):
+        raise HTTPException(status_code=400, detail="参数错误: 无效的 cursor")
+
+    def build():
+        chunks = list(document.iter_chunks(start, start + limit))
+        return {
+            "doc_id": doc_id,
+            "kind": kind,
+            "total_chunks": len(document),
+            "cursor": str(start),
+            "next_cursor": _next_cursor(start, len(chunks), len(document)),
+            "chunks": chunks
+        }
+
+    return _conditional_json(request, _etag(path, "chunks", start, limit), build)
+
+
+@router.get("/docs/{doc_id}/pages/{page_number}")
+def get_document_page(request: Request, doc_id: str, page_number: int, kind: str = Query(None)):
+    """第 page_number 页的 chunk：已加载文档为该页文本，已分块文档为覆盖该页的全部分块"""
+    kind, path, document = _resolve_document(doc_id, kind)
+
+    def build():
+        chunks = document.page_chunks(page_number)
+        if not chunks:
+            raise HTTPException(status_code=404, detail="页面不存在")
+        return {"doc_id": doc_id, "kind": kind, "page_number": page_number, "chunks": chunks}
+
+    return _conditional_json(request, _etag(path, "page", page_number), build)
+
+
+@router.get("/embedded-docs")
+async def get_embedded_docs():
+    try:
+        if not os.path.exists(EMBEDDED_DOCS_DIR):
             return []
-            
         documents = []
-        for filename in os.listdir(docs_dir):
-            if filename.endswith('.json'):
-                file_path = os.path.join(docs_dir, filename)
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        doc_data = json.load(f)
-                        documents.append({
-                            "filename": doc_data.get("filename", filename),
-                            "filepath": filename
-                        })
-                except Exception as e:
-                    logger.error(f"读取文件 {filename} 失败: {str(e)}")
-                    continue
-                    
+        for name in sorted(os.listdir(EMBEDDED_DOCS_DIR)):
+            if name.endswith(".json"):
+                with open(os.path.join(EMBEDDED_DOCS_DIR, name), 'r', encoding='utf-8') as f:
+                    documents.append({**json.load(f), "filepath": name[:-len(".json")] + ".npy"})
         return documents
     except Exception as e:
-        logger.error(f"获取文档列表失败: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.error(f"获取向量文档列表失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/search")
+async def search(data: dict = Body(...)):
+    try:
+        return await job_service.run(_json_response, _run_search, data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"检索错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/search/bm25")
+async def search_bm25(data: dict = Body(...)):
+    try:
+        return await job_service.run(_json_response, _run_bm25_search, data)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"词法检索错误: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/jobs/load")
+async def submit_load_job(
+    file: UploadFile = File(...),
+    loading_method: str = Form(...),
+    strategy: str = Form(None),
+    chunking_strategy: str = Form(None),
+    chunking_options: str = Form(None),
+    workers: int = Form(None),
+    incremental: bool = Form(True)
+):
+    temp_path, file_hash = await _save_upload(file)
+    job = job_service.submit(
+        "load", _run_load, temp_path, file.filename, loading_method,
+        strategy, chunking_strategy, chunking_options, workers, incremental, file_hash
+    )
+    _remove_when_done(job, temp_path)
+    return job.to_dict(include_result=False)
+
+
+@router.post("/jobs/parse")
+async def submit_parse_job(
+    file: UploadFile = File(None),
+    loading_method: str = Form(None),
+    strategy: str = Form(None),
+    chunking_strategy: str = Form(None),
+    chunking_options: str = Form(None),
+    normalize: bool = Form(None),
+    doc_id: str = Form(None),
+    persist: bool = Form(True)
+):
+    if doc_id:
+        job = job_service.submit("parse", _run_parse_loaded, doc_id, chunking_strategy, normalize, persist)
+        return job.to_dict(include_result=False)
+    _require_upload(file, loading_method)
+    temp_path, file_hash = await _save_upload(file)
+    job = job_service.submit(
+        "parse", _run_parse, temp_path, file.filename, loading_method,
+        strategy, chunking_strategy, chunking_options, file_hash, normalize
+    )
+    _remove_when_done(job, temp_path)
+    return job.to_dict(include_result=False)
+
+
+@router.post("/jobs/chunk")
+async def submit_chunk_job(data: dict = Body(...)):
+    job = job_service.submit("chunk", _run_chunk, data)
+    return job.to_dict(include_result=False)
+
+
+@router.post("/jobs/embed")
+async def submit_embed_job(data: dict = Body(...)):
+    job = job_service.submit("embed", _run_embed, data)
+    return job.to_dict(include_result=False)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0)):
+    """查询任务状态；wait>0 时长轮询直到任务结束或超时"""
+    job = job_service.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if wait:
+        await job_service.wait(job, wait)
+    return job.to_dict()
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = job_service.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job.to_dict(include_result=False)
+
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "extraction": extraction_cache.stats(),
+        "chunks": chunk_cache.stats()
+    }
+
+
+@router.get("/admin/profiles", dependencies=[Depends(_require_admin)])
+async def list_profiles():
+    """已保存的性能分析结果概要，最新的在前"""
+    return profile_service.list()
+
+
+@router.get("/admin/profiles/{profile_id}", dependencies=[Depends(_require_admin)])
+async def get_profile(profile_id: str):
+    """分析概要，包括耗时最多的函数和内存增长最多的分配位置"""
+    summary = profile_service.get(profile_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="分析结果不存在")
+    return summary
+
+
+@router.get("/admin/profiles/{profile_id}/prof", dependencies=[Depends(_require_admin)])
+async def download_profile(profile_id: str):
+    """下载 cProfile 原始结果，可用 pstats 或 snakeviz 查看"""
+    path = profile_service.prof_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="分析结果不存在")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+
+@router.delete("/admin/profiles/{profile_id}", dependencies=[Depends(_require_admin)])
+async def delete_profile(profile_id: str):
+    if not profile_service.delete(profile_id):
+        raise HTTPException(status_code=404, detail="分析结果不存在")
+    return {"deleted": profile_id}
@@ -0,0 +1,76 @@
+import math
+import random
+from services.bm25_index import BM25Index
+from services.text_tokenizer import tokenize
+
+WORDS = ["理财", "产品", "风险", "收益", "投资", "债券", "存款", "期限", "费用", "赎回", "bond", "yield"]
+
+
+def make_document(rng, filename, count):
+    chunks = [{"content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))),
+               "metadata": {"chunk_id": i + 1}} for i in range(count)]
+    return {"filename": filename, "chunking_method": "fixed_size", "chunks": chunks}
+
+
+def brute_force(index, documents, query):
+    """按定义逐个 chunk 计算 BM25 得分"""
+    chunks = [(doc_id, chunk["metadata"]["chunk_id"], tokenize(chunk["content"]))
+              for doc_id, document in documents.items() for chunk in document["chunks"]]
+    avg_length = sum(len(tokens) for _, _, tokens in chunks) / len(chunks)
+    scores = {}
+    for term in set(tokenize(query)):
+        query_tf = tokenize(query).count(term)
+        df = sum(term in tokens for _, _, tokens in chunks)
+        idf = math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+        for doc_id, chunk_id, tokens in chunks:
+            tf = tokens.count(term)
+            if tf:
+                norm = index.k1 * (1 - index.b + index.b * len(tokens) / avg_length)
+                scores[doc_id, chunk_id] = scores.get((doc_id, chunk_id), 0.0) + query_tf * idf * tf * (index.k1 + 1) / (tf + norm)
+    return scores
+
+
+def check(index, documents, query, top_k=10, doc_ids=None):
+    expected = brute_force(index, documents, query)
+    results = index.search(query, top_k=top_k, doc_ids=doc_ids)
+    for result in results:
+        assert math.isclose(result["score"], expected[result["doc_id"], result["metadata"]["chunk_id"]], rel_tol=1e-9)
+        assert doc_ids is None or result["doc_id"] in doc_ids
+    allowed = [score for (doc_id, _), score in expected.items() if doc_ids is None or doc_id in doc_ids]
+    assert [round(r["score"], 9) for r in results] == [round(s, 9) for s in sorted(allowed, reverse=True)[:top_k]]
+
+
+def test_search_matches_brute_force_across_merged_tables(tmp_path):
+    rng = random.Random(7)
+    index = BM25Index(index_dir=str(tmp_path))
+    documents = {}
+    for i in range(12):
+        documents[f"doc{i}.jsonl.zst"] = make_document(rng, f"doc{i}.pdf", rng.randint(1, 30))
+        index.add_document(f"doc{i}.jsonl.zst", documents[f"doc{i}.jsonl.zst"], source=f"loaded{i}")
+        if i == 2:
+            index.search("理财")   # 之后加入的文档走增量合并
+    check(index, documents, "理财 风险 bond")
+    check(index, documents, "收益 收益 期限", doc_ids=["doc3.jsonl.zst", "doc7.jsonl.zst"])
+    assert index.stats()["lookup_tables"] < 12
+
+    # 重新分块替换同一已加载文档的旧结果；同名 PDF 的其他已加载文档不受影响
+    documents["doc3-v2.jsonl.zst"] = make_document(rng, "doc3.pdf", 20)
+    index.add_document("doc3-v2.jsonl.zst", documents["doc3-v2.jsonl.zst"], source="loaded3")
+    del documents["doc3.jsonl.zst"]
+    documents["other.jsonl.zst"] = make_document(rng, "doc3.pdf", 5)
+    index.add_document("other.jsonl.zst", documents["other.jsonl.zst"], source="loaded-other")
+    check(index, documents, "理财 风险 bond")
+
+    # 并存的分块结果都可以按 doc_ids 检索
+    documents["doc5-b.jsonl.zst"] = make_document(rng, "doc5.pdf", 10)
+    index.add_document("doc5-b.jsonl.zst", documents["doc5-b.jsonl.zst"], source="loaded5", replace=False)
+    check(index, documents, "债券 赎回", doc_ids=["doc5.jsonl.zst", "doc5-b.jsonl.zst"])
+    assert sorted(index.documents_for("loaded5")) == ["doc5-b.jsonl.zst", "doc5.jsonl.zst"]
+
+    for doc_id in list(documents)[:8]:
+        index.remove_document(doc_id)
+        del documents[doc_id]
+    check(index, documents, "理财 风险 bond 存款")
+
+    # 重新打开时从段文件合并
+    check(BM25Index(index_dir=str(tmp_path)), documents, "理财 风险 bond 存款")
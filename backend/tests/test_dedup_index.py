@@ -0,0 +1,89 @@
+import random
+from services.dedup_index import DedupIndex
+from services.doc_store import write_document
+
+WORDS = ["理财", "产品", "风险", "收益", "投资", "债券", "存款", "期限", "费用", "赎回", "bond", "yield"]
+
+
+def make_chunks(rng, count):
+    return [{"content": " ".join(rng.choice(WORDS) for _ in range(40)), "metadata": {"chunk_id": i + 1}}
+            for i in range(count)]
+
+
+def make_document(filename, chunks):
+    return {"filename": filename, "chunking_method": "fixed_size", "total_chunks": len(chunks),
+            "chunks": [{"content": c["content"], "metadata": dict(c["metadata"])} for c in chunks]}
+
+
+def chunk_and_commit(index, chunked_dir, chunked_doc_id, document, source, mode="mark", replace=True):
+    update = index.mark_duplicates(chunked_doc_id, document, source=source, mode=mode, replace=replace)
+    write_document(str(chunked_dir / chunked_doc_id), document)
+    return index.commit(update)
+
+
+def test_mark_does_not_touch_index_until_commit(tmp_path):
+    rng = random.Random(1)
+    index = DedupIndex(index_dir=str(tmp_path / "index"), chunked_dir=str(tmp_path))
+    chunks = make_chunks(rng, 5)
+    update = index.mark_duplicates("a.jsonl.zst", make_document("a.pdf", chunks), source="loaded-a")
+    assert index.stats()["documents"] == 0
+    # 写入失败、未 commit 时，其他文档不会指向它
+    other = make_document("b.pdf", chunks)
+    index.mark_duplicates("b.jsonl.zst", other, source="loaded-b")
+    assert not any("duplicate_of" in chunk["metadata"] for chunk in other["chunks"])
+    index.commit(update)
+    index.mark_duplicates("b.jsonl.zst", other, source="loaded-b")
+    assert all(chunk["metadata"]["duplicate_of"]["doc_id"] == "a.jsonl.zst" for chunk in other["chunks"])
+
+
+def test_same_source_is_not_compared_and_filename_is_not_the_key(tmp_path):
+    rng = random.Random(2)
+    index = DedupIndex(index_dir=str(tmp_path / "index"), chunked_dir=str(tmp_path))
+    chunks = make_chunks(rng, 4)
+    chunk_and_commit(index, tmp_path, "a1.jsonl.zst", make_document("same.pdf", chunks), "loaded-a")
+    # 同名 PDF 的另一份已加载文档不会替换前者的段
+    second = make_document("same.pdf", chunks)
+    chunk_and_commit(index, tmp_path, "b1.jsonl.zst", second, "loaded-b")
+    assert index.stats()["documents"] == 2
+    assert all(chunk["metadata"]["duplicate_of"]["doc_id"] == "a1.jsonl.zst" for chunk in second["chunks"])
+    # 同一已加载文档重新分块不与自己的旧结果比较，并替换旧段
+    again = make_document("same.pdf", chunks)
+    chunk_and_commit(index, tmp_path, "b2.jsonl.zst", again, "loaded-b")
+    assert index.stats()["documents"] == 2
+    assert all(chunk["metadata"]["duplicate_of"]["doc_id"] == "a1.jsonl.zst" for chunk in again["chunks"])
+
+
+def test_replacing_canonical_reports_and_resolves_stale_markers(tmp_path):
+    rng = random.Random(3)
+    index = DedupIndex(index_dir=str(tmp_path / "index"), chunked_dir=str(tmp_path))
+    shared, other = make_chunks(rng, 3), make_chunks(rng, 3)
+    chunk_and_commit(index, tmp_path, "a1.jsonl.zst", make_document("a.pdf", shared), "loaded-a")
+    marked = make_document("b.pdf", shared)
+    chunk_and_commit(index, tmp_path, "b.jsonl.zst", marked, "loaded-b")
+    collapsed = make_document("c.pdf", shared + [{"content": other[0]["content"], "metadata": {"chunk_id": 4}}])
+    chunk_and_commit(index, tmp_path, "c.jsonl.zst", collapsed, "loaded-c", mode="collapse")
+    assert len(collapsed["chunks"]) == 1 and len(collapsed["collapsed_chunks"]) == 3
+
+    # a 重新分块后内容不同，旧段被替换，b 和 c 中指向 a1 的标记过期
+    stale = chunk_and_commit(index, tmp_path, "a2.jsonl.zst", make_document("a.pdf", other), "loaded-a")
+    assert stale == {"b.jsonl.zst": {"a1.jsonl.zst"}, "c.jsonl.zst": {"a1.jsonl.zst"}}
+
+    # b 中没有新的规范 chunk，清除标记后自己成为规范 chunk
+    update = index.resolve_stale("b.jsonl.zst", marked, stale["b.jsonl.zst"])
+    assert not any("duplicate_of" in chunk["metadata"] for chunk in marked["chunks"])
+    assert marked["duplicate_chunks"] == 0
+    assert index.commit(update) == {}
+
+    # c 中已合并的 chunk 从 a1 的文件恢复内容，并改为指向 b 中新的规范 chunk
+    update = index.resolve_stale("c.jsonl.zst", collapsed, stale["c.jsonl.zst"])
+    assert [chunk["metadata"]["chunk_id"] for chunk in collapsed["chunks"]] == [4]
+    assert {record["duplicate_of"]["doc_id"] for record in collapsed["collapsed_chunks"]} == {"b.jsonl.zst"}
+    index.commit(update)
+    assert index.stats()["documents"] == 3
+
+    # 删除 b 后 c 的标记再次过期，这次没有其他规范 chunk，内容恢复到文档中
+    assert index.remove_document("b.jsonl.zst") == {"c.jsonl.zst": {"b.jsonl.zst"}}
+    index.commit(index.resolve_stale("c.jsonl.zst", collapsed, {"b.jsonl.zst"}))
+    assert [chunk["metadata"]["chunk_id"] for chunk in collapsed["chunks"]] == [1, 2, 3, 4]
+    assert [chunk["content"] for chunk in collapsed["chunks"][:3]] == [chunk["content"] for chunk in shared]
+    assert "collapsed_chunks" not in collapsed and collapsed["total_chunks"] == 4
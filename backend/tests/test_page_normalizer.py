@@ -0,0 +1,35 @@
+from services.page_normalizer import PageNormalizer
+from services.parse_service import ParseService
+
+# 排满一行的正文，末尾没有标点，按宽度会被判为排版折行
+FULL_LINE = "本理财计划主要投资于存款、债券等债权类资产以及符合监管要求的其他资产，具体投资比例"
+
+
+def normalize_page(*lines):
+    page_map, stats = PageNormalizer().normalize([{"page": 1, "text": "\n".join(lines)}])
+    return page_map.text(0).split("\n"), stats
+
+
+def test_wrapped_cjk_line_is_joined():
+    lines, stats = normalize_page("一、产品概况", FULL_LINE, "以产品说明书约定为准。", "短行。")
+    assert lines == ["一、产品概况", FULL_LINE + "以产品说明书约定为准。", "短行。"]
+    assert stats["joined_lines"] == 1
+
+
+def test_heading_after_full_width_line_is_not_joined():
+    lines, stats = normalize_page("一、产品概况", FULL_LINE, "二、投资范围", "本产品投资于固定收益类资产。")
+    assert lines == ["一、产品概况", FULL_LINE, "二、投资范围", "本产品投资于固定收益类资产。"]
+    assert stats["joined_lines"] == 0
+
+
+def test_numbered_clause_after_full_width_line_is_not_joined():
+    lines, _ = normalize_page("第一条 总则", FULL_LINE, "第二条 投资范围", "本产品投资于固定收益类资产。")
+    assert "第二条 投资范围" in lines
+
+
+def test_by_titles_keeps_section_after_full_width_line():
+    page_map, _ = PageNormalizer().normalize([
+        {"page": 1, "text": "\n".join(["一、产品概况", FULL_LINE, "二、投资范围", "本产品投资于固定收益类资产。"])}
+    ])
+    sections = ParseService().parse_pdf("", "by_titles", {"filename": "test.pdf"}, page_map=page_map)["content"]
+    assert [section["title"] for section in sections] == ["一、产品概况", "二、投资范围"]
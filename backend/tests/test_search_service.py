@@ -0,0 +1,67 @@
+import json
+import os
+import numpy as np
+import services.search_service as search_service
+from services.search_service import SearchService
+
+
+def write_store(embedded_dir, name, vectors, embedder="hashing"):
+    base_path = os.path.join(embedded_dir, f"{name}_{embedder}")
+    np.save(f"{base_path}.ids.npy", np.arange(1, len(vectors) + 1, dtype=np.int32))
+    np.save(f"{base_path}.hashes.npy", np.zeros(len(vectors), dtype=np.uint64))
+    with open(f"{base_path}.json", 'w', encoding='utf-8') as f:
+        json.dump({"source": name, "embedder": embedder, "dim": vectors.shape[1]}, f)
+    np.save(f"{base_path}.npy", vectors)
+
+
+def random_vectors(rng, count, dim=16):
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def brute_force(documents, query, k, doc_ids=None):
+    scored = [(float(score), name, row) for name, vectors in documents.items() if not doc_ids or name in doc_ids
+              for row, score in enumerate(vectors @ query)]
+    return sorted(scored, reverse=True)[:k]
+
+
+def check(service, documents, query, k=8, doc_ids=None, mode="exact"):
+    _, candidates = service.search_by_vector(query, k, doc_ids=doc_ids, mode=mode, nprobe=10 ** 6)
+    found = [(round(score, 5), store.info["source"], row) for score, store, row in candidates]
+    assert found == [(round(score, 5), name, row) for score, name, row in brute_force(documents, query, k, doc_ids)]
+
+
+def test_corpus_index_matches_brute_force_across_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_service, "CORPUS_MAX_PENDING", 2)
+    rng = np.random.default_rng(0)
+    embedded_dir, index_dir = tmp_path / "embedded", tmp_path / "index"
+    embedded_dir.mkdir()
+    documents = {f"doc{i}": random_vectors(rng, int(rng.integers(1, 40))) for i in range(20)}
+    for name, vectors in documents.items():
+        write_store(str(embedded_dir), name, vectors)
+    service = SearchService(embedded_dir=str(embedded_dir), index_dir=str(index_dir))
+    query = random_vectors(rng, 1)[0]
+    check(service, documents, query)
+    check(service, documents, query, doc_ids=["doc3", "doc7"])
+    assert service._corpora["hashing"].corpus.nlist == 1
+
+    # 新增和重新向量化的文件在重建前逐个扫描，已替换文件在索引中的旧行不再返回
+    documents["doc3"] = random_vectors(rng, 30)
+    documents["new"] = random_vectors(rng, 5)
+    write_store(str(embedded_dir), "doc3", documents["doc3"])
+    write_store(str(embedded_dir), "new", documents["new"])
+    monkeypatch.setattr(search_service, "CORPUS_REBUILD_RATIO", 1.0)
+    check(service, documents, query)
+    assert len(service._corpora["hashing"].pending) == 2
+
+    # ivf 使用同一组簇中心覆盖全部文件，nprobe 足够大时结果与精确检索相同
+    check(service, documents, query, mode="ivf")
+    check(service, documents, query, doc_ids=["doc3", "new"], mode="ivf")
+    view = service._corpora["hashing"]
+    assert view.corpus.nlist > 1 and not view.pending and len(view.corpus) == sum(map(len, documents.values()))
+
+    # 重新打开时读取已保存的语料索引；auto 按总向量数选择
+    reopened = SearchService(embedded_dir=str(embedded_dir), index_dir=str(index_dir))
+    check(reopened, documents, query, mode="ivf")
+    assert reopened.resolve_mode("auto", search_service.IVF_MIN_VECTORS) == "ivf"
+    assert reopened.resolve_mode("auto", search_service.IVF_MIN_VECTORS - 1) == "exact"